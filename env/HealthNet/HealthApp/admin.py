@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Patient, UserInfo, ProfileInfo, MedicalInfo, Doctor, Nurse, Hospital, Prescription, MedTest
+from .models import Patient, UserInfo, ProfileInfo, MedicalInfo, Doctor, Nurse, Hospital, Prescription, MedTest, AppointmentReminder
+from .forms import MedTestForm
 
 #This is how to control what models are visible to the admin.
 admin.site.register(Patient)
@@ -10,4 +11,11 @@ admin.site.register(Doctor)
 admin.site.register(Nurse)
 admin.site.register(Hospital)
 admin.site.register(Prescription)
-admin.site.register(MedTest)
\ No newline at end of file
+admin.site.register(AppointmentReminder)
+
+
+class MedTestAdmin(admin.ModelAdmin):
+    #the result is edited through the form since it is stored compressed in another table
+    form = MedTestForm
+
+admin.site.register(MedTest, MedTestAdmin)
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class HealthAppConfig(AppConfig):
+    name = 'HealthApp'
+
+    def ready(self):
+        #importing the modules is what connects the signal receivers and registers the checks
+        from . import caches, signals
@@ -0,0 +1,137 @@
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import Appointment, DoctorDay, SLOT_MINUTES, FIRST_HOUR, LAST_HOUR
+import datetime, logging
+
+"""
+Availability keeps a bitmap of booked slots for every doctor and day in the DoctorDay table.
+Checking whether a slot is free is a single row read and a bit test, and listing the free slots
+for a week is one range read over seven rows and a walk over their bits.
+
+Bookings go through bookAppointment. It locks the doctor's row for the day, checks the slot's
+bit, sets it and creates the Appointment all inside one transaction, so when two requests try
+to take the same slot at the same time the second one waits for the first and then sees the
+slot as taken. The signal receivers in signals.py pass every appointment that is saved,
+moved or deleted through appointmentAdded and appointmentRemoved, which keep each day's bits
+and its count, first and last slot and booked minutes in step with its appointments. The staff
+calendar reads those straight from the rows through dayRollups.
+
+Those two are the only code that writes a day's rollups. They never try to correct a day that
+has drifted from its appointments; a day that would have to count below zero is logged, and
+0050_fill_doctorday_rollups is what counts every day again from the appointments.
+"""
+
+logger = logging.getLogger(__name__)
+
+#every column that changes with a day's bookings
+ROLLUP_FIELDS = ['bookedSlots', 'appointmentCount', 'firstSlot', 'lastSlot', 'bookedMinutes']
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+def slotFor(when):
+    #returns the day and the slot number within that day for a timezone aware datetime
+    local = timezone.localtime(when)
+    return local.date(), (local.hour * 60 + local.minute) // SLOT_MINUTES
+
+
+def slotTime(day, slot):
+    #the inverse of slotFor, giving the aware datetime that a slot starts at
+    start = datetime.datetime.combine(day, datetime.time.min) + datetime.timedelta(minutes=slot * SLOT_MINUTES)
+    return timezone.make_aware(start, timezone.get_current_timezone())
+
+
+def isSlotFree(doctor, when):
+    day, slot = slotFor(when)
+    bookedSlots = DoctorDay.objects.filter(doctor=doctor, day=day).values_list('bookedSlots', flat=True).first()
+    if bookedSlots is None:
+        return True
+    return not (int(bookedSlots, 16) >> slot) & 1
+
+
+def freeSlots(doctor, startDay, days=7):
+    #every free working hour slot for the doctor from the start of startDay through the following days
+    endDay = startDay + datetime.timedelta(days=days)
+    bitmaps = dict(DoctorDay.objects.filter(doctor=doctor, day__gte=startDay, day__lt=endDay).values_list('day', 'bookedSlots'))
+
+    slots = []
+    for offset in range(days):
+        day = startDay + datetime.timedelta(days=offset)
+        bitmap = int(bitmaps.get(day, '0'), 16)
+        for slot in range(FIRST_HOUR * 60 // SLOT_MINUTES, LAST_HOUR * 60 // SLOT_MINUTES):
+            if not (bitmap >> slot) & 1:
+                slots.append(slotTime(day, slot))
+    return slots
+
+
+def getDoctorDay(doctorId, day):
+    #the row is created in its own short transaction before the booking transaction starts.
+    #That way a booking that loses the race to create it still finds the row with the locking
+    #read that follows, rather than reading an older snapshot of the table.
+    try:
+        DoctorDay.objects.get_or_create(doctor_id=doctorId, day=day)
+    except IntegrityError:
+        pass
+
+
+def bookAppointment(doctor, patient, when, description):
+    day, slot = slotFor(when)
+    getDoctorDay(doctor.pk, day)
+
+    with transaction.atomic():
+        doctorDay = DoctorDay.objects.select_for_update().get(doctor=doctor, day=day)
+        if (doctorDay.getBitmap() >> slot) & 1:
+            raise SlotUnavailable("%s is already booked at %s" % (doctor, when))
+        #the slot is marked as taken by appointmentAdded from the post_save signal, while the
+        #row is still locked by this transaction
+        return Appointment.objects.create(doctor=doctor, patient=patient, date=when, description=description)
+
+
+def appointmentAdded(doctorId, when):
+    #counts a new or moved appointment into its doctor's day and marks its slot as taken
+    if doctorId is None:
+        return
+    day, slot = slotFor(when)
+    getDoctorDay(doctorId, day)
+
+    with transaction.atomic():
+        doctorDay = DoctorDay.objects.select_for_update().get(doctor_id=doctorId, day=day)
+        doctorDay.appointmentCount += 1
+        doctorDay.setBitmap(doctorDay.getBitmap() | (1 << slot))
+        doctorDay.save(update_fields=ROLLUP_FIELDS)
+
+
+def appointmentRemoved(doctorId, when, appointmentId):
+    #takes a deleted or moved appointment out of its doctor's day and frees its slot
+    if doctorId is None:
+        return
+    day, slot = slotFor(when)
+    start = slotTime(day, slot)
+
+    with transaction.atomic():
+        doctorDay = DoctorDay.objects.select_for_update().filter(doctor_id=doctorId, day=day).first()
+        if doctorDay is None:
+            return
+        if doctorDay.appointmentCount > 0:
+            doctorDay.appointmentCount -= 1
+        else:
+            logger.error('doctor %s on %s has no appointments counted to take %s out of, its rollups have drifted',
+                         doctorId, day, appointmentId)
+        bitmap = doctorDay.getBitmap()
+        #appointments from before slots were tracked can share a slot, so the bit is only
+        #cleared once nothing else is booked in it
+        stillBooked = (Appointment.objects.filter(doctor_id=doctorId, date__gte=start, date__lt=start + datetime.timedelta(minutes=SLOT_MINUTES))
+                       .exclude(pk=appointmentId).exists())
+        if not stillBooked:
+            bitmap &= ~(1 << slot)
+        doctorDay.setBitmap(bitmap)
+        doctorDay.save(update_fields=ROLLUP_FIELDS)
+
+
+def dayRollups(doctorId, startDay, endDay):
+    #(day, appointment count, first slot, last slot, booked minutes) for every day from startDay
+    #up to endDay that the doctor has anything booked on
+    return list(DoctorDay.objects.filter(doctor_id=doctorId, day__gte=startDay, day__lt=endDay, appointmentCount__gt=0)
+                .order_by('day').values_list('day', 'appointmentCount', 'firstSlot', 'lastSlot', 'bookedMinutes'))
@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+import time
+
+"""
+Shared pieces for the benchmark management commands. Benchmarks run against a throwaway copy
+of the configured database, created the same way the test runner creates its test database,
+so they can seed as much data as they need without touching real records.
+"""
+
+
+@contextmanager
+def testDatabase(verbosity=0):
+    oldName = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(oldName, verbosity=verbosity)
+
+
+@contextmanager
+def testEnvironment():
+    #lets the test client reach the site and records the template context on each response
+    setup_test_environment()
+    try:
+        yield
+    finally:
+        teardown_test_environment()
+
+
+def percentile(samples, fraction):
+    #nearest rank percentile of an already sorted list
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, max(0, int(round(fraction * len(samples) + 0.5)) - 1))
+    return samples[index]
+
+
+class Stopwatch(object):
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
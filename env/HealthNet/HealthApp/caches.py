@@ -0,0 +1,118 @@
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from django.core import checks
+from .models import Doctor, Hospital
+import threading, time, uuid
+
+"""
+The doctor and hospital lists shown in the drop downs. They are needed on most pages and change
+a few times a month, so each process keeps its own copy instead of reading them every time.
+Alongside them the process keeps the reference stamp they were read under. The current stamp
+lives in the default cache and is replaced with a new random one whenever a doctor or hospital
+changes.
+
+A process looks at the stamp at most once every REFERENCE_MAX_AGE seconds, and reads its lists
+again when the stamp has moved since it last looked. So most requests get the lists without a
+query, and another process's change shows up within REFERENCE_MAX_AGE. A change made by the
+process itself is shown on its next request, since bumping the stamp also makes the process
+look at it again straight away.
+
+Stamps are only compared across processes when the default cache is one they all share. With
+a per process backend every process reads its lists again each REFERENCE_MAX_AGE instead, and
+checkSharedCache warns about it when the project's checks run.
+"""
+
+#backends that keep a separate cache in every process, or none at all
+PER_PROCESS_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def isSharedCache():
+    return settings.CACHES.get('default', {}).get('BACKEND') not in PER_PROCESS_BACKENDS
+
+
+@checks.register()
+def checkSharedCache(app_configs=None, **kwargs):
+    if isSharedCache():
+        return []
+    backend = settings.CACHES['default']['BACKEND']
+    return [checks.Warning("The default cache is %s, which isn't shared between processes." % backend,
+                           hint="Doctor and hospital changes take up to %d seconds to reach the other processes and the "
+                                "analytics dashboard is worked out once per process. Use a shared cache such as the "
+                                "database cache or memcached, see CACHES in settings.py." % REFERENCE_MAX_AGE,
+                           id='HealthApp.W001')]
+
+
+REFERENCE_STAMP_KEY = 'reference:stamp'
+
+
+class DoctorChoice(namedtuple('DoctorChoice', 'pk username firstName lastName')):
+    __slots__ = ()
+
+    def __str__(self):
+        return self.firstName + " " + self.lastName
+
+
+HospitalChoice = namedtuple('HospitalChoice', 'pk name latitude longitude')
+
+#checkedAt is when the stamp was last looked at, and settled is False for lists read just after
+#the stamp moved
+ReferenceLists = namedtuple('ReferenceLists', 'stamp checkedAt settled doctors hospitals')
+
+#how long a process goes without looking at the stamp
+REFERENCE_MAX_AGE = 300
+
+_reference = ReferenceLists(None, 0, False, (), ())
+_referenceLock = threading.Lock()
+
+
+def bumpReferenceStamp():
+    #a fresh random stamp can't match a stamp some process read before, even if the cache lost the key
+    global _reference
+    cache.set(REFERENCE_STAMP_KEY, uuid.uuid4().hex, None)
+    with _referenceLock:
+        _reference = _reference._replace(checkedAt=0)
+
+
+def currentReferenceStamp():
+    stamp = cache.get(REFERENCE_STAMP_KEY)
+    if stamp is None:
+        #add only sets the key if no other process got there first
+        cache.add(REFERENCE_STAMP_KEY, uuid.uuid4().hex, None)
+        stamp = cache.get(REFERENCE_STAMP_KEY)
+    return stamp
+
+
+def getReferenceLists():
+    #the doctor and hospital lists. They are swapped in as one tuple so a request never sees
+    #lists from two different reads.
+    global _reference
+    reference = _reference
+    if time.time() - reference.checkedAt < REFERENCE_MAX_AGE:
+        return reference
+
+    with _referenceLock:
+        reference = _reference
+        if time.time() - reference.checkedAt < REFERENCE_MAX_AGE:
+            return reference
+        stamp = currentReferenceStamp()
+        if stamp == reference.stamp and reference.settled and isSharedCache():
+            _reference = reference._replace(checkedAt=time.time())
+            return _reference
+        #lists read just after the stamp moved are read once more at the next look, in case the
+        #change that moved it hadn't been committed yet when they were read
+        doctors = tuple(DoctorChoice(*row) for row in Doctor.objects.order_by('user__last_name', 'user__first_name').values_list('pk', 'user__username', 'user__first_name', 'user__last_name'))
+        hospitals = tuple(HospitalChoice(*row) for row in Hospital.objects.order_by('name').values_list('pk', 'name', 'latitude', 'longitude'))
+        _reference = ReferenceLists(stamp, time.time(), stamp == reference.stamp, doctors, hospitals)
+        return _reference
+
+
+def getDoctorList():
+    return getReferenceLists().doctors
+
+
+def getHospitalList():
+    return getReferenceLists().hospitals
@@ -0,0 +1,210 @@
+from .models import Patient, Hospital
+from .conditions import CONDITIONS, CONDITIONS_BY_KEY
+from .indexes import LiveIndex
+import threading, time
+
+"""
+The cohort index answers questions like "which of my patients at hospital H with high blood
+pressure and kidney disease live in NY" without going to the database. For every facet value
+(each hospital, doctor, state and condition) it keeps a bitmap over patient ids, held as a
+Python integer where bit n is set when patient n has that value. A filter is then a handful of
+bitwise ANDs and ORs over those integers, and counting the patients in a result is a popcount.
+
+Values within one facet are ORed together and the facets are ANDed, so asking for two states
+and one hospital means (state A or state B) and hospital H. Conditions can be combined either
+way, any of them or all of them.
+
+The index is built from one query the first time it is used in a process and kept current by
+a LiveIndex from indexes.py, which applies this process's saves to patients and their profile
+and medical rows once they are committed, and rebuilds it in the background once it is older
+than REBUILD_SECONDS to pick up other processes' changes.
+"""
+
+FACETS = ('hospital', 'doctor', 'state', 'condition')
+
+REBUILD_SECONDS = 300
+
+try:
+    popcount = int.bit_count
+except AttributeError:
+    def popcount(bitmap):
+        return bin(bitmap).count('1')
+
+#results with at most this many patients get their facet counts by walking the members instead
+#of intersecting with every value's bitmap. Without a native popcount the intersections are
+#much slower, so walking stays the cheaper option for far bigger results.
+SPARSE_COUNT_LIMIT = 5000 if hasattr(int, 'bit_count') else 100000
+
+
+def iterBits(bitmap, limit=None):
+    #yields the positions of the set bits, lowest first. Going through the binary string means
+    #the big integer is only converted once instead of being shifted for every bit.
+    digits = bin(bitmap)[:1:-1]
+    position = digits.find('1')
+    found = 0
+    while position != -1 and (limit is None or found < limit):
+        yield position
+        found += 1
+        position = digits.find('1', position + 1)
+
+
+def bitmapFrom(positions, size):
+    #builds a bitmap with the given bits set in one pass rather than one big integer operation per bit
+    data = bytearray(size // 8 + 1)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bytes(data), 'little')
+
+
+def membershipsFor(hospitalId, doctorId, state, conditions):
+    #the (facet, value) pairs a patient belongs to
+    memberships = []
+    if hospitalId is not None:
+        memberships.append(('hospital', hospitalId))
+    if doctorId is not None:
+        memberships.append(('doctor', doctorId))
+    if state:
+        memberships.append(('state', state))
+    for condition in CONDITIONS:
+        if conditions and (conditions >> condition.bit) & 1:
+            memberships.append(('condition', condition.key))
+    return tuple(memberships)
+
+
+def patientRows(patients):
+    return patients.values_list('pk', 'hospital_id', 'doctor_id', 'profileInfo__state', 'medicalInfo__conditions')
+
+
+class CohortIndex(object):
+
+    def __init__(self):
+        self.bitmaps = dict((facet, {}) for facet in FACETS)
+        self.memberships = {}
+        self.everyone = 0
+        self.builtAt = time.time()
+        self.lock = threading.RLock()
+
+    @classmethod
+    def build(cls):
+        return cls.fromRows(patientRows(Patient.objects.all()).iterator())
+
+    @classmethod
+    def fromRows(cls, rows):
+        #collects the patient ids for every facet value first and turns each list into a bitmap
+        #at the end, which is far cheaper than setting bits on the big integers one at a time
+        index = cls()
+        positions = dict((facet, {}) for facet in FACETS)
+        maxId = 0
+        for row in rows:
+            patientId = row[0]
+            memberships = membershipsFor(*row[1:])
+            for facet, value in memberships:
+                positions[facet].setdefault(value, []).append(patientId)
+            index.memberships[patientId] = memberships
+            maxId = max(maxId, patientId)
+
+        for facet in FACETS:
+            for value, patientIds in positions[facet].items():
+                index.bitmaps[facet][value] = bitmapFrom(patientIds, maxId)
+        index.everyone = bitmapFrom(index.memberships, maxId)
+        return index
+
+    def add(self, patientId, memberships):
+        with self.lock:
+            self.remove(patientId)
+            bit = 1 << patientId
+            for facet, value in memberships:
+                values = self.bitmaps[facet]
+                values[value] = values.get(value, 0) | bit
+            self.memberships[patientId] = memberships
+            self.everyone |= bit
+
+    def remove(self, patientId):
+        with self.lock:
+            memberships = self.memberships.pop(patientId, None)
+            if memberships is None:
+                return
+            bit = 1 << patientId
+            for facet, value in memberships:
+                values = self.bitmaps[facet]
+                remaining = values[value] & ~bit
+                if remaining:
+                    values[value] = remaining
+                else:
+                    del values[value]
+            self.everyone &= ~bit
+
+    def select(self, filters, conditionMode='any', scope=None):
+        #filters maps a facet to the values wanted for it. Facets that are left out don't
+        #restrict the result. scope is a bitmap the result is limited to.
+        with self.lock:
+            result = self.everyone if scope is None else self.everyone & scope
+            for facet in FACETS:
+                values = filters.get(facet)
+                if not values:
+                    continue
+                bitmaps = [self.bitmaps[facet].get(value, 0) for value in values]
+                if facet == 'condition' and conditionMode == 'all':
+                    for bitmap in bitmaps:
+                        result &= bitmap
+                else:
+                    combined = 0
+                    for bitmap in bitmaps:
+                        combined |= bitmap
+                    result &= combined
+            return result
+
+    def facetCounts(self, bitmap):
+        #how many patients of the bitmap fall under every facet value. Small results are
+        #counted by walking their members, large ones by intersecting with every value's bitmap.
+        with self.lock:
+            counts = dict((facet, {}) for facet in FACETS)
+            if popcount(bitmap) <= SPARSE_COUNT_LIMIT:
+                for patientId in iterBits(bitmap):
+                    for facet, value in self.memberships.get(patientId, ()):
+                        counts[facet][value] = counts[facet].get(value, 0) + 1
+                return counts
+
+            for facet in FACETS:
+                for value, valueBitmap in self.bitmaps[facet].items():
+                    count = popcount(bitmap & valueBitmap)
+                    if count:
+                        counts[facet][value] = count
+            return counts
+
+    def scopeFor(self, staffMember, accountType):
+        #the bitmap of patients a doctor or nurse is allowed to see
+        if accountType == "Doctor":
+            return self.bitmaps['doctor'].get(staffMember.pk, 0)
+        elif accountType == "Nurse":
+            scope = 0
+            for hospitalId in Hospital.objects.filter(name=staffMember.hospital).values_list('pk', flat=True):
+                scope |= self.bitmaps['hospital'].get(hospitalId, 0)
+            return scope
+        return 0
+
+
+def applyChanges(index, patientIds):
+    rows = dict((row[0], row) for row in patientRows(Patient.objects.filter(pk__in=patientIds)))
+    for patientId in patientIds:
+        if patientId in rows:
+            index.add(patientId, membershipsFor(*rows[patientId][1:]))
+        else:
+            index.remove(patientId)
+
+
+live = LiveIndex(CohortIndex, applyChanges, REBUILD_SECONDS)
+
+
+def getIndex():
+    return live.get()
+
+
+def parseFilters(query):
+    #reads the facet filters out of a request's GET parameters
+    filters = {}
+    for facet in ('hospital', 'doctor'):
+        filters[facet] = [int(value) for value in query.getlist(facet) if value.isdigit()]
+    filters['state'] = query.getlist('state')
+    filters['condition'] = [key for key in query.getlist('condition') if key in CONDITIONS_BY_KEY]
+    return filters
@@ -0,0 +1,63 @@
+from collections import namedtuple
+
+"""
+The registry of medical conditions a patient can report. MedicalInfo stores the conditions a
+patient has as a single integer where each condition owns one bit, so the registry below is
+what gives those bits a meaning. It drives the medical form, the condition checkboxes on the
+registration page, the medical history on the profile pages and the csv exports.
+
+Adding a condition only means adding an entry to the end of CONDITIONS with the next unused
+bit; no database migration is needed. Bits are stored in the database, so an existing entry
+must never be renumbered and a retired bit must never be handed out again.
+"""
+
+Condition = namedtuple('Condition', ['bit', 'key', 'label'])
+
+CONDITIONS = (
+    Condition(0, 'allergies', 'Allergies'),
+    Condition(1, 'anemia', 'Anemia'),
+    Condition(2, 'arthritis', 'Arthritis'),
+    Condition(3, 'chickenpox', 'Chickenpox'),
+    Condition(4, 'coxsackie', 'Coxsackie'),
+    Condition(5, 'diphtheria', 'Diphtheria'),
+    Condition(6, 'epilepsy', 'Epilepsy'),
+    Condition(7, 'frequentColds', 'Frequent Colds'),
+    Condition(8, 'germanMeasles', 'German Measles'),
+    Condition(9, 'highBloodPressure', 'High Blood Pressure'),
+    Condition(10, 'influenza', 'Influenza'),
+    Condition(11, 'kidneyDisease', 'Kidney Disease'),
+    Condition(12, 'measles', 'Measles'),
+    Condition(13, 'migraines', 'Migraines'),
+    Condition(14, 'mumps', 'Mumps'),
+    Condition(15, 'obesity', 'Obesity'),
+    Condition(16, 'pneumonia', 'Pneumonia'),
+    Condition(17, 'polio', 'Polio'),
+    Condition(18, 'rheumaticFever', 'Rheumatic Fever'),
+    Condition(19, 'scarlatina', 'Scarlatina'),
+    Condition(20, 'scarletFever', 'Scarlet Fever'),
+    Condition(21, 'strokes', 'Strokes'),
+    Condition(22, 'syphilis', 'Syphilis'),
+    Condition(23, 'tonsillitis', 'Tonsillitis'),
+    Condition(24, 'tuberculosis', 'Tuberculosis'),
+    Condition(25, 'whoopingCough', 'Whooping Cough'),
+    Condition(26, 'cancer', 'Cancer'),
+    Condition(27, 'diabetes', 'Diabetes'),
+)
+
+#the bitfield is a signed 64 bit column, so bit 63 is never used
+MAX_CONDITIONS = 63
+
+CONDITIONS_BY_KEY = dict((condition.key, condition) for condition in CONDITIONS)
+
+
+def maskFor(keys):
+    #the bitmask with the bit of every named condition set
+    mask = 0
+    for key in keys:
+        mask |= 1 << CONDITIONS_BY_KEY[key].bit
+    return mask
+
+
+def conditionsIn(bitmask):
+    #the registry entries whose bits are set in bitmask, in registry order
+    return [condition for condition in CONDITIONS if (bitmask >> condition.bit) & 1]
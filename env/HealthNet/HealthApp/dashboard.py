@@ -0,0 +1,186 @@
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Sum, Case, When, Q, IntegerField
+from django.utils import timezone
+from .models import Patient
+from .conditions import CONDITIONS
+import threading, time, uuid
+
+"""
+The numbers behind the administrators' dashboard: how many patients each hospital, doctor and
+state has, how common each condition is and how old the patients are.
+
+Everything is worked out by the database in four queries, each a single pass over the patient
+table. Hospitals, doctors and states are each one GROUP BY. The condition and age counts all
+come from one aggregate over the patients joined to their medical and profile rows, with a
+conditional sum per condition bit and per age band, so adding a condition or a band adds a
+column to that query rather than another query.
+
+The result is kept in the shared cache together with the time it was worked out, and is
+served stale-while-revalidate:
+
+- Younger than FRESH_SECONDS it is served as it is.
+- Older than that it is still served straight away, and the first request to see it stale
+  also starts working it out again in the background.
+- Once it is STALE_SECONDS old the cache drops it, and the next request waits for a new one.
+
+Working it out is coalesced with a lock key taken with cache.add, which only one caller can
+win until the key is deleted or expires. Only the winner runs the queries. Everyone else is
+served the stale result, or when there is none, waits for the winner's result to appear in the
+cache. So however many administrators refresh at once the queries run once. The lock expires
+after LOCK_SECONDS in case the process holding it dies, and a waiting request then takes it
+over. The cache in settings.py is the database cache every process shares, so this holds
+across every process serving the site. With a cache kept per process it only holds within each
+process, which checkSharedCache in caches.py warns about.
+
+The counts of how requests were served are per process and are part of the dashboard.
+"""
+
+DASHBOARD_VERSION = 1
+
+DASHBOARD_KEY = 'dashboard:%d' % DASHBOARD_VERSION
+DASHBOARD_LOCK_KEY = 'dashboard:%d:lock' % DASHBOARD_VERSION
+
+FRESH_SECONDS = 60
+
+STALE_SECONDS = 3600
+
+#longer than the queries ever take, so the lock only expires on its own when its holder died
+LOCK_SECONDS = 120
+
+#how often a request with nothing to serve looks for the result it is waiting on
+WAIT_INTERVAL = 0.05
+
+#age bands as (label, youngest, oldest) in whole years, oldest None for no upper limit
+AGE_BANDS = (
+    ('0-17', 0, 17),
+    ('18-34', 18, 34),
+    ('35-49', 35, 49),
+    ('50-64', 50, 64),
+    ('65+', 65, None),
+)
+
+_counts = {'fresh': 0, 'stale': 0, 'waited': 0, 'computed': 0}
+_countsLock = threading.Lock()
+
+
+def count(name):
+    with _countsLock:
+        _counts[name] += 1
+
+
+def dashboardStats():
+    with _countsLock:
+        return dict(_counts)
+
+
+def yearsBefore(day, years):
+    #the same day of the year so many years earlier, with 29 February becoming the 28th
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
+
+def ageBandFilter(youngest, oldest, today):
+    #patients at least youngest and at most oldest years old today
+    condition = Q(profileInfo__dateOfBirth__lte=yearsBefore(today, youngest))
+    if oldest is not None:
+        condition &= Q(profileInfo__dateOfBirth__gt=yearsBefore(today, oldest + 1))
+    return condition
+
+
+def countWhere(condition):
+    return Sum(Case(When(condition, then=1), default=0, output_field=IntegerField()))
+
+
+def compute(today=None):
+    today = today or timezone.localtime(timezone.now()).date()
+
+    hospitals = [{'id': row['hospital_id'], 'name': row['hospital__name'] or 'No hospital', 'patients': row['patients']}
+                 for row in Patient.objects.values('hospital_id', 'hospital__name').annotate(patients=Count('pk')).order_by('-patients', 'hospital__name')]
+
+    doctors = []
+    for row in (Patient.objects.values('doctor_id', 'doctor__user__first_name', 'doctor__user__last_name')
+                .annotate(patients=Count('pk')).order_by('-patients', 'doctor__user__last_name')):
+        name = '%s %s' % (row['doctor__user__first_name'], row['doctor__user__last_name']) if row['doctor_id'] else 'No doctor'
+        doctors.append({'id': row['doctor_id'], 'name': name, 'patients': row['patients']})
+
+    states = [{'state': row['profileInfo__state'] or 'Unknown', 'patients': row['patients']}
+              for row in Patient.objects.values('profileInfo__state').annotate(patients=Count('pk')).order_by('-patients', 'profileInfo__state')]
+
+    columns = {'total': Count('pk')}
+    for condition in CONDITIONS:
+        columns['condition_%s' % condition.key] = countWhere(Q(medicalInfo__conditions__hasany=1 << condition.bit))
+    for label, youngest, oldest in AGE_BANDS:
+        columns['age_%s' % label] = countWhere(ageBandFilter(youngest, oldest, today))
+    columns['age_unknown'] = countWhere(Q(profileInfo__dateOfBirth__isnull=True))
+    totals = Patient.objects.aggregate(**columns)
+
+    total = totals['total']
+    conditions = sorted(({'key': condition.key, 'label': condition.label,
+                          'patients': totals['condition_%s' % condition.key] or 0}
+                         for condition in CONDITIONS), key=lambda row: -row['patients'])
+    for row in conditions:
+        row['percent'] = round(100.0 * row['patients'] / total, 1) if total else 0.0
+    ages = [{'band': label, 'patients': totals['age_%s' % label] or 0} for label, youngest, oldest in AGE_BANDS]
+    ages.append({'band': 'Unknown', 'patients': totals['age_unknown'] or 0})
+
+    count('computed')
+    return {'computedAt': time.time(), 'patients': total, 'hospitals': hospitals, 'doctors': doctors,
+            'states': states, 'conditions': conditions, 'ages': ages}
+
+
+def store(dashboard):
+    cache.set(DASHBOARD_KEY, dashboard, STALE_SECONDS)
+
+
+def computeHolding(token):
+    #works the dashboard out and caches it, then lets go of the lock if it still holds it
+    try:
+        dashboard = compute()
+        store(dashboard)
+        return dashboard
+    finally:
+        if cache.get(DASHBOARD_LOCK_KEY) == token:
+            cache.delete(DASHBOARD_LOCK_KEY)
+
+
+def revalidate(token):
+    try:
+        computeHolding(token)
+    finally:
+        connection.close()
+
+
+def getDashboard():
+    #the cached dashboard, worked out again by at most one caller at a time when it is stale or gone
+    dashboard = cache.get(DASHBOARD_KEY)
+    if dashboard is not None:
+        if time.time() - dashboard['computedAt'] < FRESH_SECONDS:
+            count('fresh')
+            return dashboard
+        token = uuid.uuid4().hex
+        if cache.add(DASHBOARD_LOCK_KEY, token, LOCK_SECONDS):
+            threading.Thread(target=revalidate, args=(token,), daemon=True).start()
+        count('stale')
+        return dashboard
+
+    waited = False
+    while True:
+        token = uuid.uuid4().hex
+        if cache.add(DASHBOARD_LOCK_KEY, token, LOCK_SECONDS):
+            #someone may have finished between the first look and taking the lock
+            dashboard = cache.get(DASHBOARD_KEY)
+            if dashboard is not None:
+                cache.delete(DASHBOARD_LOCK_KEY)
+                break
+            return computeHolding(token)
+        waited = True
+        time.sleep(WAIT_INTERVAL)
+        dashboard = cache.get(DASHBOARD_KEY)
+        if dashboard is not None:
+            break
+    count('waited' if waited else 'fresh')
+    return dashboard
+
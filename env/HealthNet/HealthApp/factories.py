@@ -0,0 +1,198 @@
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from .models import Patient, Doctor, Nurse, Hospital, UserInfo, ProfileInfo, MedicalInfo, Appointment, DoctorDay, SLOT_MINUTES, FIRST_HOUR, LAST_HOUR
+from .availability import slotTime
+from .conditions import CONDITIONS
+import datetime, random
+
+"""
+Synthetic data for the benchmarks. seed() fills an empty database with hospitals, doctors,
+nurses, patients with all of their info rows, and appointments, at anything from a thousand
+to a million patients. Rows are made with bulk_create a batch at a time with ids handed out
+up front, the same way importpatients does it, so a million patients take minutes rather than
+the hours saving them one by one would.
+
+Every seeded user has the password PASSWORD, hashed once and shared. Appointments are given
+free slots within working hours and the doctors' DoctorDay rows are written to match, so
+availability and the staff calendar see the seeded bookings the same as ones made through the
+site. The same random seed always gives the same data.
+"""
+
+PASSWORD = 'benchmark'
+
+BATCH_SIZE = 5000
+
+#patient counts for the named scales the benchmark command accepts
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000}
+
+#appointments are booked into working hour slots on days this far either side of today
+APPOINTMENT_DAYS = 60
+
+
+def scaledCounts(patients):
+    #the other counts are kept in the same proportion to the patients at every scale
+    return {
+        'patients': patients,
+        'hospitals': max(1, patients // 5000),
+        'doctors': max(1, patients // 100),
+        'nurses': max(1, patients // 200),
+        'appointments': patients * 2,
+    }
+
+
+class Fixture(object):
+    #what seed() made, so the benchmarks can pick users to log in as
+    def __init__(self, counts):
+        self.counts = counts
+        self.hospitals = []
+        self.doctors = []
+        self.nurses = []
+        self.patients = []
+
+
+def nextId(model):
+    return (model.objects.aggregate(highest=Max('pk'))['highest'] or 0) + 1
+
+
+def seed(patients, hospitals=None, doctors=None, nurses=None, appointments=None, batchSize=BATCH_SIZE, randomSeed=0, log=None):
+    counts = scaledCounts(patients)
+    for name, value in (('hospitals', hospitals), ('doctors', doctors), ('nurses', nurses), ('appointments', appointments)):
+        if value is not None:
+            counts[name] = value
+
+    rng = random.Random(randomSeed)
+    passwordHash = make_password(PASSWORD)
+    fixture = Fixture(counts)
+    ids = dict((model, nextId(model)) for model in (User, UserInfo, ProfileInfo, MedicalInfo, Patient, Doctor, Nurse, Hospital))
+
+    def take(model, count):
+        start = ids[model]
+        ids[model] += count
+        return range(start, start + count)
+
+    hospitalIds = take(Hospital, counts['hospitals'])
+    Hospital.objects.bulk_create([Hospital(id=i, name='Hospital %d' % i) for i in hospitalIds])
+    fixture.hospitals = ['Hospital %d' % i for i in hospitalIds]
+
+    doctorIds = take(Doctor, counts['doctors'])
+    doctorUserIds = take(User, counts['doctors'])
+    User.objects.bulk_create([User(id=userId, username='doctor%d' % i, password=passwordHash, first_name='Doctor', last_name=str(i), is_staff=True)
+                              for i, userId in zip(doctorIds, doctorUserIds)])
+    Doctor.objects.bulk_create([Doctor(id=i, user_id=userId) for i, userId in zip(doctorIds, doctorUserIds)])
+    fixture.doctors = ['doctor%d' % i for i in doctorIds]
+
+    nurseIds = take(Nurse, counts['nurses'])
+    nurseUserIds = take(User, counts['nurses'])
+    User.objects.bulk_create([User(id=userId, username='nurse%d' % i, password=passwordHash, is_staff=True)
+                              for i, userId in zip(nurseIds, nurseUserIds)])
+    Nurse.objects.bulk_create([Nurse(id=i, user_id=userId, hospital=rng.choice(fixture.hospitals))
+                               for i, userId in zip(nurseIds, nurseUserIds)])
+    fixture.nurses = ['nurse%d' % i for i in nurseIds]
+
+    #each patient's doctor is remembered for booking their appointments
+    patientDoctors = []
+    made = 0
+    while made < counts['patients']:
+        size = min(batchSize, counts['patients'] - made)
+        userIds, userInfoIds, profileIds, medicalIds, patientIds = [take(model, size) for model in (User, UserInfo, ProfileInfo, MedicalInfo, Patient)]
+        batchDoctors = [rng.choice(doctorIds) for i in range(size)]
+        with transaction.atomic():
+            User.objects.bulk_create([User(id=i, username='patient%d' % i, password=passwordHash, first_name='First%d' % (i % 500),
+                                           last_name='Last%d' % (i % 2000), email='patient%d@example.com' % i) for i in userIds])
+            UserInfo.objects.bulk_create([UserInfo(id=i, policyNumber=str(100000 + i), provider='Provider %d' % (i % 20), groupNumber=str(i % 50))
+                                          for i in userInfoIds])
+            ProfileInfo.objects.bulk_create([
+                ProfileInfo(id=i, firstName='First%d' % (i % 500), lastName='Last%d' % (i % 2000), address='%d Main St' % i,
+                            city='Rochester', state='NY', dateOfBirth=datetime.date(1930, 1, 1) + datetime.timedelta(days=rng.randrange(30000)),
+                            zipcode='14623', phoneNumber='5855550100', email='patient%d@example.com' % i, eName='Contact', ePhoneNumber='5855550101')
+                for i in profileIds
+            ])
+            #most patients have none or a few conditions, so each one is set with a small chance
+            MedicalInfo.objects.bulk_create([
+                MedicalInfo(id=i, conditions=sum(1 << condition.bit for condition in CONDITIONS if rng.random() < 0.05))
+                for i in medicalIds
+            ])
+            Patient.objects.bulk_create([
+                Patient(id=patientId, user_id=userId, userInfo_id=userInfoId, profileInfo_id=profileId, medicalInfo_id=medicalId,
+                        doctor_id=doctorId, hospital_id=rng.choice(hospitalIds))
+                for patientId, userId, userInfoId, profileId, medicalId, doctorId
+                in zip(patientIds, userIds, userInfoIds, profileIds, medicalIds, batchDoctors)
+            ])
+        patientDoctors.extend(zip(patientIds, batchDoctors))
+        if len(fixture.patients) < 1000:
+            fixture.patients.extend('patient%d' % i for i in userIds[:1000 - len(fixture.patients)])
+        made += size
+        if log:
+            log('patients: %d of %d' % (made, counts['patients']))
+
+    if patientDoctors:
+        seedAppointments(rng, patientDoctors, counts['appointments'], batchSize, log)
+    return fixture
+
+
+def seedAppointments(rng, patientDoctors, count, batchSize, log=None):
+    today = timezone.localtime(timezone.now()).date()
+    firstSlot = FIRST_HOUR * 60 // SLOT_MINUTES
+    lastSlot = LAST_HOUR * 60 // SLOT_MINUTES
+    bitmaps = {}
+
+    made = 0
+    while made < count:
+        size = min(batchSize, count - made)
+        appointments = []
+        for i in range(size):
+            patientId, doctorId = rng.choice(patientDoctors)
+            day = today + datetime.timedelta(days=rng.randint(-APPOINTMENT_DAYS, APPOINTMENT_DAYS))
+            key = (doctorId, day)
+            bitmap = bitmaps.get(key, 0)
+            slot = rng.randrange(firstSlot, lastSlot)
+            #a taken slot moves on to the next free one that day, and a full day is skipped
+            for tries in range(lastSlot - firstSlot):
+                if not (bitmap >> slot) & 1:
+                    break
+                slot = firstSlot + (slot + 1 - firstSlot) % (lastSlot - firstSlot)
+            else:
+                continue
+            bitmaps[key] = bitmap | (1 << slot)
+            appointments.append(Appointment(doctor_id=doctorId, patient_id=patientId, date=slotTime(day, slot), description='Checkup'))
+        Appointment.objects.bulk_create(appointments)
+        made += size
+        if log:
+            log('appointments: %d of %d' % (made, count))
+
+    days = []
+    for (doctorId, day), bitmap in bitmaps.items():
+        #seeded appointments never share a slot, so there is one for every bit
+        doctorDay = DoctorDay(doctor_id=doctorId, day=day, appointmentCount=bin(bitmap).count('1'))
+        doctorDay.setBitmap(bitmap)
+        days.append(doctorDay)
+    DoctorDay.objects.bulk_create(days)
+
+
+def registrationData(index, hospitalName, doctorUsername):
+    #a filled in registration form for a new patient
+    return {
+        'username': 'newpatient%d' % index,
+        'password': 'newpassword%d' % index,
+        'policyNumber': str(100000 + index),
+        'provider': 'Bench Insurance',
+        'groupNumber': '7',
+        'hospital': hospitalName,
+        'firstName': 'First',
+        'middleName': '',
+        'lastName': 'Patient%d' % index,
+        'email': 'newpatient%d@example.com' % index,
+        'dateOfBirth': '1980-01-01',
+        'address': '1 Main St',
+        'city': 'Rochester',
+        'state': 'NY',
+        'zipcode': '14623',
+        'phoneNumber': '5855550100',
+        'doctor': doctorUsername,
+        'eName': 'Someone',
+        'ePhoneNumber': '5855550101',
+        'allergies': 'on',
+    }
@@ -2,6 +2,8 @@ from django import forms
 from django.forms import ModelForm
 from django.contrib.auth.forms import User
 from .models import Patient, UserInfo, MedicalInfo, ProfileInfo, Prescription, MedTest, Appointment
+from .conditions import CONDITIONS
+from .medications import getCatalog, normalizeName
 
 
 class LoginForm(forms.Form):
@@ -25,7 +27,7 @@ class AppointmentForm(forms.Form):
         model = Appointment
         fields = (
             'doctor',
-            'userName',
+            'patient',
             'date',
             'time',
             'description'
@@ -66,41 +68,28 @@ class ProfileForm(ModelForm):
 
 
 class MedicalForm(ModelForm):
+    #one checkbox is added per condition in the registry, named after the condition's key.
+    #The checked ones are packed into the conditions bitfield when the form is saved.
     class Meta:
         model = MedicalInfo
+        fields = ()
 
-        # TODO - add cancer/diabetes
-        fields = (
-            'allergies',
-            'anemia',
-            'arthritis',
-            'chickenpox',
-            'coxsackie',
-            'diphtheria',
-            'epilepsy',
-            'frequentColds',
-            'germanMeasles',
-            'highBloodPressure',
-            'influenza',
-            'kidneyDisease',
-            'measles',
-            'migraines',
-            'mumps',
-            'obesity',
-            'pneumonia',
-            'polio',
-            'rheumaticFever',
-            'scarlatina',
-            'scarletFever',
-            'strokes',
-            'syphilis',
-            'tonsillitis',
-            'tuberculosis',
-            'whoopingCough',
-        )
+    def __init__(self, *args, **kwargs):
+        super(MedicalForm, self).__init__(*args, **kwargs)
+        for condition in CONDITIONS:
+            self.fields[condition.key] = forms.BooleanField(label=condition.label, required=False,
+                                                            initial=self.instance.hasCondition(condition.key))
+
+    def save(self, commit=True):
+        self.instance.setConditions(condition.key for condition in CONDITIONS if self.cleaned_data.get(condition.key))
+        return super(MedicalForm, self).save(commit)
 
 
 class MedTestForm(ModelForm):
+    #the result is kept compressed in its own table, so it is a plain form field here that is
+    #read from and written back to the test's result body
+    result = forms.CharField(widget=forms.Textarea, required=False)
+
     class Meta:
         model = MedTest
         fields = (
@@ -108,9 +97,27 @@ class MedTestForm(ModelForm):
             'doctor',
             'released',
             'dateIssued',
-            'result',
         )
 
+    def __init__(self, *args, **kwargs):
+        super(MedTestForm, self).__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields['result'].initial = self.instance.getResult()
+
+    def save(self, commit=True):
+        test = super(MedTestForm, self).save(commit)
+        if commit:
+            test.setResult(self.cleaned_data.get('result'))
+        else:
+            #the caller saves the test itself, then save_m2m writes the result after it
+            saveM2M = self.save_m2m
+
+            def saveWithResult():
+                saveM2M()
+                test.setResult(self.cleaned_data.get('result'))
+            self.save_m2m = saveWithResult
+        return test
+
 
 class PrescriptionForm(ModelForm):
     class Meta:
@@ -123,3 +130,21 @@ class PrescriptionForm(ModelForm):
             'directions',
             'comments',
         )
+        widgets = {
+            'medication': forms.TextInput(attrs={'autocomplete': 'off', 'data-autocomplete-url': '/medications/'}),
+        }
+
+    def clean_medication(self):
+        #the medication has to be one from the catalog, the search endpoint suggests them as it is typed
+        medication = normalizeName(self.cleaned_data['medication'])
+        if medication not in getCatalog():
+            raise forms.ValidationError("%s is not in the medication catalog" % medication)
+        return medication
+
+    def clean(self):
+        cleanedData = super(PrescriptionForm, self).clean()
+        medication = cleanedData.get('medication')
+        category = cleanedData.get('medicationCategory')
+        if medication and category and category not in getCatalog().categoriesFor(medication):
+            self.add_error('medicationCategory', "%s is not listed under %s" % (medication, category))
+        return cleanedData
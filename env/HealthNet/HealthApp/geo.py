@@ -0,0 +1,204 @@
+from array import array
+from . import caches
+import bisect, heapq, math, os, threading
+
+"""
+Nearest hospitals to a zipcode, worked out locally with no call to a mapping service.
+
+Zipcode centroids are read from data/zipcodes.txt, which uses the layout of the Census
+Bureau's ZCTA gazetteer file: tab separated with a header row, and the GEOID, INTPTLAT and
+INTPTLONG columns are the ones used. The bundled file covers Monroe County; the full national
+gazetteer file can be put in its place as it is. The codes are kept in one sorted array with
+the latitudes and longitudes in two more arrays beside it, so a lookup is a binary search.
+
+Not every zipcode is in the table: the bundled file is one county, and even the national file
+leaves out codes that only have PO boxes. A zipcode that isn't found falls back to the middle of
+the known zipcodes sharing its first three digits, which all belong to the same sorting
+facility and so lie in one area. Only a zipcode whose first three digits aren't known at all is
+reported as unknown.
+
+Hospitals with coordinates are put in a KD-tree. Every position is turned into a point on the
+unit sphere, where the straight line distance between two points orders them the same way as
+the distance along the earth's surface, so the tree can split on x, y and z like any other and
+still find the truly nearest hospitals across the whole country. The tree is stored as flat
+arrays: the points are arranged so the middle of any range is the node splitting it, and its
+two halves are the subtrees, which leaves nothing to store but the points themselves.
+
+The tree is built from the hospital list in caches.py, so it is rebuilt whenever that list is
+read again after a hospital changes.
+"""
+
+ZIPCODES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'zipcodes.txt')
+
+EARTH_RADIUS_MILES = 3958.8
+
+#ranges this small are scanned instead of split further
+LEAF_SIZE = 8
+
+
+def toPoint(latitude, longitude):
+    latitude, longitude = math.radians(latitude), math.radians(longitude)
+    return (math.cos(latitude) * math.cos(longitude), math.cos(latitude) * math.sin(longitude), math.sin(latitude))
+
+
+def chordToMiles(squaredChord):
+    #the surface distance for the squared straight line distance between two points on the unit sphere
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(squaredChord) / 2))
+
+
+def normalizeZipcode(zipcode):
+    #the five digit zipcode as a number, or None if it isn't one. ZIP+4 codes keep their first five digits.
+    zipcode = (zipcode or '').strip()[:5]
+    if len(zipcode) != 5 or not zipcode.isdigit():
+        return None
+    return int(zipcode)
+
+
+class ZipTable(object):
+
+    def __init__(self, rows):
+        #rows are (zipcode, latitude, longitude)
+        rows = sorted(rows)
+        self.codes = array('i', [row[0] for row in rows])
+        self.latitudes = array('d', [row[1] for row in rows])
+        self.longitudes = array('d', [row[2] for row in rows])
+        #first three digits to the average (latitude, longitude) of the zipcodes starting with them
+        sums = {}
+        for zipcode, latitude, longitude in rows:
+            total = sums.setdefault(zipcode // 100, [0.0, 0.0, 0])
+            total[0] += latitude
+            total[1] += longitude
+            total[2] += 1
+        self.prefixes = dict((prefix, (total[0] / total[2], total[1] / total[2])) for prefix, total in sums.items())
+
+    @classmethod
+    def load(cls, path):
+        rows = []
+        with open(path) as zipFile:
+            header = [column.strip() for column in zipFile.readline().split('\t')]
+            code, latitude, longitude = header.index('GEOID'), header.index('INTPTLAT'), header.index('INTPTLONG')
+            for line in zipFile:
+                fields = line.split('\t')
+                if len(fields) == len(header):
+                    rows.append((int(fields[code]), float(fields[latitude]), float(fields[longitude])))
+        return cls(rows)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def lookup(self, zipcode):
+        #the (latitude, longitude) of a zipcode, or of its three digit prefix when the zipcode
+        #itself isn't in the table, or None when neither is
+        zipcode = normalizeZipcode(zipcode)
+        if zipcode is None:
+            return None
+        position = bisect.bisect_left(self.codes, zipcode)
+        if position == len(self.codes) or self.codes[position] != zipcode:
+            return self.prefixes.get(zipcode // 100)
+        return self.latitudes[position], self.longitudes[position]
+
+
+class KDTree(object):
+
+    def __init__(self, points, ids):
+        #points are (latitude, longitude) and ids the value reported for each of them
+        items = [toPoint(latitude, longitude) + (i,) for i, (latitude, longitude) in enumerate(points)]
+        self.arrange(items, 0, len(items), 0)
+        self.xs = array('d', [item[0] for item in items])
+        self.ys = array('d', [item[1] for item in items])
+        self.zs = array('d', [item[2] for item in items])
+        self.ids = [ids[item[3]] for item in items]
+
+    def arrange(self, items, start, end, depth):
+        #sorts each range on its axis so its middle item splits it, then does the same for both halves
+        if end - start <= LEAF_SIZE:
+            return
+        axis = depth % 3
+        items[start:end] = sorted(items[start:end], key=lambda item: item[axis])
+        middle = (start + end) // 2
+        self.arrange(items, start, middle, depth + 1)
+        self.arrange(items, middle + 1, end, depth + 1)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def nearest(self, latitude, longitude, k):
+        #the k nearest ids with their distances in miles, nearest first
+        if k <= 0 or not self.ids:
+            return []
+        point = toPoint(latitude, longitude)
+        x, y, z = point
+        xs, ys, zs = self.xs, self.ys, self.zs
+        axes = (xs, ys, zs)
+        #a heap of the best found so far as (-squared distance, position), so the worst is on top
+        best = []
+        #ranges still to look at, with how far the query point is from the range at the least
+        stack = [(0, len(self.ids), 0, 0.0)]
+        while stack:
+            start, end, depth, bound = stack.pop()
+            if len(best) == k and bound >= -best[0][0]:
+                continue
+            if end - start <= LEAF_SIZE:
+                for position in range(start, end):
+                    distance = (xs[position] - x) ** 2 + (ys[position] - y) ** 2 + (zs[position] - z) ** 2
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, position))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, position))
+                continue
+
+            middle = (start + end) // 2
+            axis = depth % 3
+            distance = (xs[middle] - x) ** 2 + (ys[middle] - y) ** 2 + (zs[middle] - z) ** 2
+            if len(best) < k:
+                heapq.heappush(best, (-distance, middle))
+            elif distance < -best[0][0]:
+                heapq.heapreplace(best, (-distance, middle))
+
+            #the near side is looked at first. The far side can only hold something closer when
+            #the splitting plane is closer than the worst kept by the time it is reached.
+            offset = point[axis] - axes[axis][middle]
+            if offset > 0:
+                stack.append((start, middle, depth + 1, max(bound, offset * offset)))
+                stack.append((middle + 1, end, depth + 1, bound))
+            else:
+                stack.append((middle + 1, end, depth + 1, max(bound, offset * offset)))
+                stack.append((start, middle, depth + 1, bound))
+
+        return [(self.ids[position], chordToMiles(-negative)) for negative, position in sorted(best, reverse=True)]
+
+
+_zipTable = None
+_hospitalTree = None
+_hospitals = None
+_lock = threading.Lock()
+
+
+def getZipTable():
+    global _zipTable
+    if _zipTable is None:
+        with _lock:
+            if _zipTable is None:
+                _zipTable = ZipTable.load(ZIPCODES_PATH)
+    return _zipTable
+
+
+def getHospitalTree():
+    #the tree of the hospitals in the current hospital list, built again when the list is
+    global _hospitalTree, _hospitals
+    hospitals = caches.getHospitalList()
+    with _lock:
+        if hospitals is not _hospitals:
+            located = [hospital for hospital in hospitals if hospital.latitude is not None and hospital.longitude is not None]
+            _hospitalTree = KDTree([(hospital.latitude, hospital.longitude) for hospital in located], located)
+            _hospitals = hospitals
+        return _hospitalTree
+
+
+def nearestHospitals(zipcode, k=3):
+    #the k hospitals nearest the zipcode's centroid as (HospitalChoice, miles) pairs, or None
+    #when neither the zipcode nor its prefix is known
+    location = getZipTable().lookup(zipcode)
+    if location is None:
+        return None
+    return getHospitalTree().nearest(location[0], location[1], k)
@@ -0,0 +1,136 @@
+from django.db import connection
+from django.db.models import Q
+from .models import Patient
+import threading, time
+
+"""
+What the in-process patient indexes have in common. Each one is built from the patient table
+with one query the first time it is used in a process, and a LiveIndex keeps it current after
+that.
+
+Other processes' changes are picked up by rebuilding the index once it is older than its
+maxAge. The rebuild runs in a background thread while the old index keeps answering. Patients
+that change while the rebuild is reading the table are noted and read again into the new index
+before it is swapped in.
+
+This process's own changes reach every index through noteChanges, which the receivers in
+signals.py call with the ids of whatever was saved or deleted. A save inside a transaction can
+still be rolled back, so nothing is read at that point. The ids are kept for the thread until
+the transaction is over and are then applied together:
+
+- A change made outside a transaction is already committed and is applied straight away.
+- A change made inside one is applied at the end of the request by IndexChangesMiddleware, or
+  otherwise with the next change the thread makes outside a transaction.
+
+Profile, medical record and user ids are turned into patient ids with one query when the
+changes are applied. Each patient is then read again, and one whose rows were rolled back or
+deleted is no longer found and is dropped from the index.
+"""
+
+#every LiveIndex in the process, which noted changes are applied to
+_liveIndexes = []
+
+_pending = threading.local()
+
+#noteChanges keyword to the Patient column its ids are matched against
+CHANGE_COLUMNS = (('profileInfoIds', 'profileInfo_id'), ('medicalInfoIds', 'medicalInfo_id'), ('userIds', 'user_id'))
+
+
+class LiveIndex(object):
+    #one process's copy of an index. indexClass.build() reads the whole index, and
+    #applyChanges(index, patientIds) reads those patients again into an index.
+
+    def __init__(self, indexClass, applyChanges, maxAge):
+        self.indexClass = indexClass
+        self.applyChanges = applyChanges
+        self.maxAge = maxAge
+        self.index = None
+        self.lock = threading.Lock()
+        self.rebuilding = False
+        #ids changed while a rebuild is reading the table, applied to the new index once it is done
+        self.changedDuringRebuild = set()
+        _liveIndexes.append(self)
+
+    def get(self):
+        with self.lock:
+            if self.index is None:
+                self.index = self.indexClass.build()
+            elif time.time() - self.index.builtAt > self.maxAge and not self.rebuilding:
+                self.rebuilding = True
+                self.changedDuringRebuild.clear()
+                threading.Thread(target=self.rebuild, daemon=True).start()
+            return self.index
+
+    def rebuild(self):
+        try:
+            index = self.indexClass.build()
+            with self.lock:
+                changed = list(self.changedDuringRebuild)
+                self.changedDuringRebuild.clear()
+                self.applyChanges(index, changed)
+                self.index = index
+        finally:
+            with self.lock:
+                self.rebuilding = False
+            connection.close()
+
+    def patientsChanged(self, patientIds):
+        #nothing needs doing when this process hasn't built the index yet since it will read the
+        #current rows when it does
+        with self.lock:
+            index = self.index
+            if index is None or not patientIds:
+                return
+            if self.rebuilding:
+                self.changedDuringRebuild.update(patientIds)
+        self.applyChanges(index, patientIds)
+
+    def reset(self):
+        #forgets the index, so the next get() builds it again
+        with self.lock:
+            self.index = None
+            self.rebuilding = False
+            self.changedDuringRebuild.clear()
+
+
+def noteChanges(patientIds=(), profileInfoIds=(), medicalInfoIds=(), userIds=()):
+    if all(live.index is None for live in _liveIndexes):
+        return
+    changes = getattr(_pending, 'changes', None)
+    if changes is None:
+        changes = _pending.changes = {'patientIds': set(), 'profileInfoIds': set(), 'medicalInfoIds': set(), 'userIds': set()}
+    changes['patientIds'].update(patientIds)
+    changes['profileInfoIds'].update(profileInfoIds)
+    changes['medicalInfoIds'].update(medicalInfoIds)
+    changes['userIds'].update(userIds)
+    if not connection.in_atomic_block:
+        applyPendingChanges()
+
+
+def applyPendingChanges():
+    #applies the changes this thread has noted to every index. Only call it once the
+    #transaction they were made in is over.
+    changes = getattr(_pending, 'changes', None)
+    if changes is None:
+        return
+    _pending.changes = None
+
+    patientIds = set(changes['patientIds'])
+    lookup = Q()
+    for name, column in CHANGE_COLUMNS:
+        if changes[name]:
+            lookup |= Q(**{'%s__in' % column: list(changes[name])})
+    if lookup:
+        patientIds.update(Patient.objects.filter(lookup).values_list('pk', flat=True))
+
+    patientIds = list(patientIds)
+    for live in _liveIndexes:
+        live.patientsChanged(patientIds)
+
+
+class IndexChangesMiddleware(object):
+    #the views' transactions are over by the time the response is on its way out
+
+    def process_response(self, request, response):
+        applyPendingChanges()
+        return response
@@ -0,0 +1,189 @@
+from collections import namedtuple
+from .conditions import CONDITIONS, CONDITIONS_BY_KEY
+from .medications import getCatalog, normalizeName
+import json, logging, os, threading, time
+
+"""
+Drug interaction checks. The rules are read from data/interactions.json and compiled against
+the medication catalog into a matrix with one row per medication, where each row is a bitset
+of the medications it interacts with. A rule can name single medications or whole categories
+("category:anticoagulants"), and a category rule is expanded to every medication in it when
+the matrix is built, so checking never has to look at categories or rules again. Each
+medication also gets a mask of the conditions it should not be given with, using the same
+bits as MedicalInfo.conditions.
+
+Checking a new medication against a patient's k current ones sets k bits in a mask and ands it
+with the new medication's row, then ands the condition mask with the patient's conditions.
+Only the bits that come out set are looked up for their severity and note.
+
+Like the catalog, the compiled rules never change once built. getInteractions() rebuilds them
+when the rules file or the catalog has changed and swaps the new set in with one assignment.
+"""
+
+INTERACTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'interactions.json')
+
+RELOAD_CHECK_SECONDS = 30
+
+CATEGORY_PREFIX = 'category:'
+
+#when more than one rule covers the same pair the most severe one is kept
+SEVERITIES = ('minor', 'moderate', 'major')
+
+logger = logging.getLogger(__name__)
+
+Rule = namedtuple('Rule', ['severity', 'note'])
+
+#one problem found by a check: medication clashes with other, which is either another
+#medication or the label of a condition
+Interaction = namedtuple('Interaction', ['medication', 'other', 'severity', 'note'])
+
+CONDITION_LABELS = dict((condition.bit, condition.label) for condition in CONDITIONS)
+
+
+class InteractionSet(object):
+
+    def __init__(self, catalog, interactions, conditionRules):
+        self.catalog = catalog
+        self.names = catalog.names
+        self.index = dict((name, i) for i, name in enumerate(self.names))
+        self.rows = [0] * len(self.names)
+        self.conditionMasks = [0] * len(self.names)
+        self.pairRules = {}
+        self.conditionRules = {}
+
+        for rule in interactions:
+            first, second = rule['between']
+            details = self.rule(rule)
+            for i in self.expand(first):
+                for j in self.expand(second):
+                    if i != j:
+                        self.addPair(i, j, details)
+
+        for rule in conditionRules:
+            if rule['condition'] not in CONDITIONS_BY_KEY:
+                raise ValueError("unknown condition %s in the interaction rules" % rule['condition'])
+            bit = CONDITIONS_BY_KEY[rule['condition']].bit
+            details = self.rule(rule)
+            for i in self.expand(rule['medication']):
+                self.conditionMasks[i] |= 1 << bit
+                self.conditionRules[(i, bit)] = moreSevere(self.conditionRules.get((i, bit)), details)
+
+    @classmethod
+    def load(cls, path, catalog):
+        with open(path) as rulesFile:
+            data = json.load(rulesFile)
+        return cls(catalog, data['interactions'], data['conditions'])
+
+    def rule(self, rule):
+        if rule['severity'] not in SEVERITIES:
+            raise ValueError("unknown severity %s in the interaction rules" % rule['severity'])
+        return Rule(rule['severity'], rule.get('note', ''))
+
+    def expand(self, name):
+        #the matrix indexes of a medication or of every medication in a category
+        if name.startswith(CATEGORY_PREFIX):
+            category = name[len(CATEGORY_PREFIX):]
+            if category not in self.catalog.categoryNames:
+                raise ValueError("unknown category %s in the interaction rules" % category)
+            return [i for i, medication in enumerate(self.names) if category in self.catalog.categories[medication]]
+        medication = normalizeName(name)
+        if medication not in self.index:
+            raise ValueError("unknown medication %s in the interaction rules" % name)
+        return [self.index[medication]]
+
+    def addPair(self, i, j, details):
+        self.rows[i] |= 1 << j
+        self.rows[j] |= 1 << i
+        key = (min(i, j), max(i, j))
+        self.pairRules[key] = moreSevere(self.pairRules.get(key), details)
+
+    def mask(self, medications):
+        #the bitset of a list of medication names, ignoring any the catalog doesn't have
+        mask = 0
+        for name in medications:
+            i = self.index.get(normalizeName(name))
+            if i is not None:
+                mask |= 1 << i
+        return mask
+
+    def check(self, medication, currentMedications, conditions=0):
+        #the interactions of starting medication alongside the current ones and the conditions bitfield
+        i = self.index.get(normalizeName(medication))
+        if i is None:
+            return []
+        return self.warningsFor(i, self.rows[i] & self.mask(currentMedications), self.conditionMasks[i] & conditions)
+
+    def audit(self, medications, conditions=0):
+        #every clash within one patient's medications and conditions, each pair reported once
+        mask = self.mask(medications)
+        warnings = []
+        for i in bitsIn(mask):
+            #only the later medications, so a pair isn't reported from both ends
+            clashes = (self.rows[i] & mask) >> (i + 1) << (i + 1)
+            warnings.extend(self.warningsFor(i, clashes, self.conditionMasks[i] & conditions))
+        return warnings
+
+    def warningsFor(self, i, clashes, conditionClashes):
+        warnings = []
+        for j in bitsIn(clashes):
+            rule = self.pairRules[(min(i, j), max(i, j))]
+            warnings.append(Interaction(self.names[i], self.names[j], rule.severity, rule.note))
+        for bit in bitsIn(conditionClashes):
+            rule = self.conditionRules[(i, bit)]
+            warnings.append(Interaction(self.names[i], CONDITION_LABELS[bit], rule.severity, rule.note))
+        return warnings
+
+
+def bitsIn(mask):
+    #the positions of the set bits, lowest first, taking time for the set bits only
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length() - 1
+        mask ^= lowest
+
+
+def moreSevere(current, new):
+    if current is None or SEVERITIES.index(new.severity) > SEVERITIES.index(current.severity):
+        return new
+    return current
+
+
+_interactions = None
+_rulesModified = None
+_nextCheck = 0
+_reloadLock = threading.Lock()
+
+
+def reloadInteractions(path=None):
+    #compiles the rules against the current catalog and swaps them in, keeping the current set
+    #if the file is bad
+    global _interactions, _rulesModified
+    path = path or INTERACTIONS_PATH
+    with _reloadLock:
+        try:
+            modified = os.stat(path).st_mtime
+            interactions = InteractionSet.load(path, getCatalog())
+        except (OSError, ValueError, KeyError, TypeError):
+            if _interactions is None:
+                raise
+            logger.exception("could not reload the interaction rules from %s", path)
+            return _interactions
+        _interactions, _rulesModified = interactions, modified
+        return interactions
+
+
+def getInteractions():
+    global _nextCheck
+    interactions = _interactions
+    if interactions is None:
+        return reloadInteractions()
+
+    now = time.time()
+    if now >= _nextCheck:
+        _nextCheck = now + RELOAD_CHECK_SECONDS
+        try:
+            if os.stat(INTERACTIONS_PATH).st_mtime != _rulesModified or getCatalog() is not interactions.catalog:
+                return reloadInteractions()
+        except OSError:
+            pass
+    return interactions
@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+from HealthApp.models import Hospital, Patient, CurrentMedication
+from HealthApp.interactions import getInteractions, SEVERITIES
+from HealthApp.benchmark import Stopwatch
+import csv, sys
+
+"""
+Checks every patient of a hospital, or of every hospital, for interactions between their current
+medications and with their conditions, and writes what it finds as csv. It is meant to be run
+overnight, e.g. from cron, so a rule added to data/interactions.json is applied to patients who
+were already on both medications before the rule existed.
+
+Patients are read in primary key order a chunk at a time, with one query for the chunk's
+patients and conditions and one for all of their current medications, so the whole run takes
+two queries per chunk. Run it with: python manage.py auditinteractions --hospital "Strong Memorial"
+"""
+
+CHUNK_SIZE = 2000
+
+HEADER = ['Username', 'Hospital', 'Medication', 'Interacts With', 'Severity', 'Note']
+
+
+class Command(BaseCommand):
+    help = 'Lists the interactions between the current medications and conditions of every patient of a hospital'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hospital', help='the hospital name, every hospital when left out')
+        parser.add_argument('--severity', choices=SEVERITIES, default=SEVERITIES[0], help='leave out anything less severe')
+        parser.add_argument('--output', help='write the csv to this file instead of standard output')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        patients = Patient.objects.all()
+        if options['hospital']:
+            if not Hospital.objects.filter(name=options['hospital']).exists():
+                raise CommandError('there is no hospital named %s' % options['hospital'])
+            patients = patients.filter(hospital__name=options['hospital'])
+
+        interactions = getInteractions()
+        leastSevere = SEVERITIES.index(options['severity'])
+
+        outputFile = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            writer = csv.writer(outputFile)
+            writer.writerow(HEADER)
+            checked = flagged = found = 0
+            with Stopwatch() as stopwatch:
+                for chunk in self.chunks(patients, options['chunk_size']):
+                    medications = {}
+                    for patientId, medication in CurrentMedication.objects.filter(patient_id__in=[row[0] for row in chunk]).values_list('patient_id', 'medication'):
+                        medications.setdefault(patientId, []).append(medication)
+
+                    for patientId, username, hospital, conditions in chunk:
+                        checked += 1
+                        clashes = [interaction for interaction in interactions.audit(medications.get(patientId, ()), conditions or 0)
+                                   if SEVERITIES.index(interaction.severity) >= leastSevere]
+                        if clashes:
+                            flagged += 1
+                            found += len(clashes)
+                        for interaction in clashes:
+                            writer.writerow([username, hospital or '', interaction.medication, interaction.other, interaction.severity, interaction.note])
+        finally:
+            if options['output']:
+                outputFile.close()
+
+        self.stderr.write('%d patients checked in %.1fs, %d interactions found for %d of them' % (checked, stopwatch.elapsed, found, flagged))
+
+    def chunks(self, patients, chunkSize):
+        #keyset pages of (pk, username, hospital name, conditions)
+        patients = patients.order_by('pk').values_list('pk', 'user__username', 'hospital__name', 'medicalInfo__conditions')
+        lastId = 0
+        while True:
+            chunk = list(patients.filter(pk__gt=lastId)[:chunkSize])
+            if not chunk:
+                return
+            lastId = chunk[-1][0]
+            yield chunk
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import connection
+from django.utils import timezone
+from HealthApp.models import Appointment, Doctor, Patient, SLOT_MINUTES
+from HealthApp.benchmark import testDatabase, Stopwatch
+from HealthApp import availability
+import datetime, threading
+
+"""
+Contention benchmark for appointment booking. A number of writer threads are released at the
+same moment and each one tries to book one of a small set of slots with the same doctor. Every
+slot must end up with exactly one appointment. Run it with: python manage.py benchbooking
+"""
+
+
+class Command(BaseCommand):
+    help = 'Books the same appointment slots from many threads at once and checks for double bookings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=100)
+        parser.add_argument('--slots', type=int, default=4)
+
+    def handle(self, *args, **options):
+        writers = options['writers']
+        slotCount = options['slots']
+
+        with testDatabase():
+            doctor = Doctor.objects.create(user=User.objects.create_user('benchdoctor'))
+            patients = [Patient.objects.create(user=User.objects.create_user('benchpatient%d' % i)) for i in range(writers)]
+
+            firstSlot = timezone.now().replace(hour=9, minute=0, second=0, microsecond=0) + datetime.timedelta(days=1)
+            slots = [firstSlot + datetime.timedelta(minutes=SLOT_MINUTES * i) for i in range(slotCount)]
+
+            barrier = threading.Barrier(writers)
+            outcomes = {'booked': 0, 'refused': 0, 'errors': 0}
+            errors = []
+            lock = threading.Lock()
+
+            def write(index):
+                try:
+                    barrier.wait()
+                    try:
+                        availability.bookAppointment(doctor, patients[index], slots[index % slotCount], 'bench')
+                        outcome = 'booked'
+                    except availability.SlotUnavailable:
+                        outcome = 'refused'
+                    except Exception as e:
+                        outcome = 'errors'
+                        errors.append(repr(e))
+                    with lock:
+                        outcomes[outcome] += 1
+                finally:
+                    connection.close()
+
+            threads = [threading.Thread(target=write, args=(i,)) for i in range(writers)]
+            with Stopwatch() as stopwatch:
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+            perSlot = [Appointment.objects.filter(doctor=doctor, date=slot).count() for slot in slots]
+            doubleBooked = sum(1 for count in perSlot if count > 1)
+
+            self.stdout.write('writers: %d  slots: %d  time: %.3fs' % (writers, slotCount, stopwatch.elapsed))
+            self.stdout.write('booked: %(booked)d  refused: %(refused)d  errors: %(errors)d' % outcomes)
+            if errors:
+                self.stdout.write('first error: %s' % errors[0])
+            self.stdout.write('appointments per slot: %s' % perSlot)
+            self.stdout.write('double bookings: %d' % doubleBooked)
+
+            if doubleBooked or outcomes['booked'] != sum(perSlot):
+                raise CommandError('slots were double booked')
+            if outcomes['errors']:
+                raise CommandError('%d of the bookings failed with an error' % outcomes['errors'])
+            if any(count != 1 for count in perSlot):
+                raise CommandError('every slot should have one appointment, they have %s' % perSlot)
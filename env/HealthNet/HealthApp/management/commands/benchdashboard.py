@@ -0,0 +1,125 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from HealthApp import dashboard, factories
+from HealthApp.models import Patient
+from HealthApp.conditions import CONDITIONS
+from HealthApp.benchmark import testDatabase, percentile, Stopwatch
+import threading, time
+
+"""
+Benchmark for the administrators' dashboard. It seeds a throwaway database with factories.seed()
+and has --admins threads ask for the dashboard at the same moment twice: first with nothing
+cached, when one of them must work it out while the rest wait for it, and then with the cached
+dashboard gone stale, when all of them must be served the stale one straight away while one
+background refresh runs. Both times the queries must have run exactly once. The threads
+share one process; DashboardCoalescingTests in tests.py does the same with separate processes.
+
+The numbers are then checked against counts made by walking every patient in Python.
+Run it with: python manage.py benchdashboard --patients 100000 --admins 100
+"""
+
+
+class Command(BaseCommand):
+    help = 'Checks that many admins loading the dashboard at once work it out only once, and that its numbers are right'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=10000)
+        parser.add_argument('--admins', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with testDatabase():
+            with Stopwatch() as seeding:
+                factories.seed(options['patients'], randomSeed=options['seed'])
+            self.stdout.write('seeded %d patients in %.1fs' % (options['patients'], seeding.elapsed))
+
+            cache.delete_many([dashboard.DASHBOARD_KEY, dashboard.DASHBOARD_LOCK_KEY])
+            self.stampede('cold', options['admins'])
+
+            #ages the cached dashboard past FRESH_SECONDS so the next requests find it stale
+            numbers = cache.get(dashboard.DASHBOARD_KEY)
+            dashboard.store(dict(numbers, computedAt=numbers['computedAt'] - dashboard.FRESH_SECONDS))
+            self.stampede('stale', options['admins'])
+
+            self.verify(cache.get(dashboard.DASHBOARD_KEY))
+
+    def stampede(self, name, admins):
+        computedBefore = dashboard.dashboardStats()['computed']
+        barrier = threading.Barrier(admins)
+        timings = []
+        errors = []
+
+        def load():
+            try:
+                barrier.wait()
+                with Stopwatch() as stopwatch:
+                    dashboard.getDashboard()
+                timings.append(stopwatch.elapsed)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=load) for i in range(admins)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise CommandError('%d of the %s requests failed, the first with %r' % (len(errors), name, errors[0]))
+
+        #a stale dashboard is refreshed in the background, so wait for that to let go of the lock
+        deadline = time.time() + dashboard.LOCK_SECONDS
+        while cache.get(dashboard.DASHBOARD_LOCK_KEY) is not None and time.time() < deadline:
+            time.sleep(dashboard.WAIT_INTERVAL)
+
+        computed = dashboard.dashboardStats()['computed'] - computedBefore
+        timings.sort()
+        self.stdout.write('%s: %d admins at once, worked out %d times, p50 %.1fms, p99 %.1fms, max %.1fms' % (
+            name, admins, computed, percentile(timings, 0.5) * 1000, percentile(timings, 0.99) * 1000, timings[-1] * 1000))
+        if computed != 1:
+            raise CommandError('the %s dashboard was worked out %d times instead of once' % (name, computed))
+
+    def verify(self, numbers):
+        today = timezone.localtime(timezone.now()).date()
+        hospitals, doctors, states, conditions, ages = {}, {}, {}, dict((condition.key, 0) for condition in CONDITIONS), {}
+        total = 0
+        for hospitalId, doctorId, state, mask, born in Patient.objects.values_list(
+                'hospital_id', 'doctor_id', 'profileInfo__state', 'medicalInfo__conditions', 'profileInfo__dateOfBirth').iterator():
+            total += 1
+            hospitals[hospitalId] = hospitals.get(hospitalId, 0) + 1
+            doctors[doctorId] = doctors.get(doctorId, 0) + 1
+            states[state or 'Unknown'] = states.get(state or 'Unknown', 0) + 1
+            for condition in CONDITIONS:
+                if (mask or 0) & (1 << condition.bit):
+                    conditions[condition.key] += 1
+            band = 'Unknown'
+            if born is not None:
+                age = today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+                for label, youngest, oldest in dashboard.AGE_BANDS:
+                    if age >= youngest and (oldest is None or age <= oldest):
+                        band = label
+            ages[band] = ages.get(band, 0) + 1
+
+        expected = {
+            'patients': total,
+            'hospitals': hospitals,
+            'doctors': doctors,
+            'states': states,
+            'conditions': conditions,
+            'ages': dict((band, count) for band, count in ages.items() if count),
+        }
+        found = {
+            'patients': numbers['patients'],
+            'hospitals': dict((row['id'], row['patients']) for row in numbers['hospitals']),
+            'doctors': dict((row['id'], row['patients']) for row in numbers['doctors']),
+            'states': dict((row['state'], row['patients']) for row in numbers['states']),
+            'conditions': dict((row['key'], row['patients']) for row in numbers['conditions']),
+            'ages': dict((row['band'], row['patients']) for row in numbers['ages'] if row['patients']),
+        }
+        for name in sorted(expected):
+            if expected[name] != found[name]:
+                raise CommandError('the dashboard %s are %r but walking the patients gives %r' % (name, found[name], expected[name]))
+        self.stdout.write('verified the dashboard against every one of the %d patients' % total)
@@ -0,0 +1,131 @@
+from django.core.management.base import BaseCommand, CommandError
+from HealthApp.interactions import InteractionSet, INTERACTIONS_PATH, CATEGORY_PREFIX, SEVERITIES
+from HealthApp.medications import getCatalog, normalizeName
+from HealthApp.conditions import CONDITIONS, CONDITIONS_BY_KEY
+from HealthApp.benchmark import percentile, Stopwatch
+import json, random, time
+
+"""
+Benchmark for the interaction checks over a large synthetic population, a million patients by
+default, each given a random list of current medications and conditions. Everything is held in
+memory so the numbers are the cost of the checks themselves: compiling the rules, checking one
+new medication against every patient's list the way prescribing does, and auditing every
+patient the way auditinteractions does.
+
+The same checks are also run for a sample of patients by reading the rules directly, matching
+each medication against each rule and its categories. The command fails if the two ever
+disagree, and reports how much slower the direct way is.
+Run it with: python manage.py benchinteractions --patients 1000000
+"""
+
+#per call timings are taken for this many checks, timing every call would slow the run down
+TIMED_CHECKS = 10000
+
+
+class DirectRules(object):
+    #the rules as written in the file, checked one by one with no compiling
+
+    def __init__(self, catalog, data):
+        self.catalog = catalog
+        self.interactions = data['interactions']
+        self.conditions = data['conditions']
+
+    def matches(self, name, medication):
+        if name.startswith(CATEGORY_PREFIX):
+            return name[len(CATEGORY_PREFIX):] in self.catalog.categoriesFor(medication)
+        return normalizeName(name) == medication
+
+    def check(self, medication, currentMedications, conditions):
+        found = {}
+        for other in currentMedications:
+            if other == medication:
+                continue
+            for rule in self.interactions:
+                first, second = rule['between']
+                if (self.matches(first, medication) and self.matches(second, other)) or (self.matches(second, medication) and self.matches(first, other)):
+                    found[other] = max(found.get(other, rule['severity']), rule['severity'], key=SEVERITIES.index)
+        for rule in self.conditions:
+            condition = CONDITIONS_BY_KEY[rule['condition']]
+            if (conditions >> condition.bit) & 1 and self.matches(rule['medication'], medication):
+                found[condition.label] = max(found.get(condition.label, rule['severity']), rule['severity'], key=SEVERITIES.index)
+        return found
+
+
+class Command(BaseCommand):
+    help = 'Times the compiled interaction checks over a large synthetic population and verifies them against the raw rules'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=1000000)
+        parser.add_argument('--medications', type=int, default=12, help='the most current medications a patient is given')
+        parser.add_argument('--verify', type=int, default=2000, help='patients checked against the raw rules as well')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        catalog = getCatalog()
+        with open(INTERACTIONS_PATH) as rulesFile:
+            data = json.load(rulesFile)
+
+        with Stopwatch() as compiling:
+            interactions = InteractionSet(catalog, data['interactions'], data['conditions'])
+        pairs = len(interactions.pairRules)
+        self.stdout.write('compiled %d rules into %d interacting pairs over %d medications in %.1fms' % (
+            len(data['interactions']) + len(data['conditions']), pairs, len(catalog.names), compiling.elapsed * 1000))
+
+        #the medications that appear in some rule are drawn more often, or hardly anyone would clash
+        names = catalog.names
+        involved = [name for i, name in enumerate(names) if interactions.rows[i] or interactions.conditionMasks[i]]
+        conditionBits = [condition.bit for condition in CONDITIONS]
+
+        def medicationsFor():
+            count = rng.randint(0, options['medications'])
+            return tuple(set(rng.choice(involved) if rng.random() < 0.3 else rng.choice(names) for i in range(count)))
+
+        with Stopwatch() as generating:
+            population = [(medicationsFor(), sum(1 << bit for bit in conditionBits if rng.random() < 0.05)) for i in range(options['patients'])]
+            newMedications = [rng.choice(involved) for i in range(options['patients'])]
+        self.stdout.write('generated %d patients averaging %.1f medications in %.1fs' % (
+            len(population), sum(len(medications) for medications, conditions in population) / float(max(1, len(population))), generating.elapsed))
+
+        timings = []
+        for (medications, conditions), medication in zip(population[:TIMED_CHECKS], newMedications):
+            start = time.perf_counter()
+            interactions.check(medication, medications, conditions)
+            timings.append((time.perf_counter() - start) * 1000000)
+        timings.sort()
+
+        found = 0
+        with Stopwatch() as checking:
+            for (medications, conditions), medication in zip(population, newMedications):
+                found += len(interactions.check(medication, medications, conditions))
+        self.stdout.write('checked a new medication for every patient in %.1fs, %.0f checks/s, p50 %.1fus p99 %.1fus, %d interactions' % (
+            checking.elapsed, len(population) / checking.elapsed, percentile(timings, 0.5), percentile(timings, 0.99), found))
+
+        found = flagged = 0
+        with Stopwatch() as auditing:
+            for medications, conditions in population:
+                clashes = interactions.audit(medications, conditions)
+                if clashes:
+                    flagged += 1
+                    found += len(clashes)
+        self.stdout.write('audited every patient in %.1fs, %.0f patients/s, %d interactions for %d patients' % (
+            auditing.elapsed, len(population) / auditing.elapsed, found, flagged))
+
+        self.verify(DirectRules(catalog, data), interactions, population[:options['verify']], newMedications)
+
+    def verify(self, direct, interactions, sample, newMedications):
+        compiledTime = directTime = 0.0
+        for (medications, conditions), medication in zip(sample, newMedications):
+            start = time.perf_counter()
+            compiled = interactions.check(medication, medications, conditions)
+            middle = time.perf_counter()
+            expected = direct.check(medication, medications, conditions)
+            directTime += time.perf_counter() - middle
+            compiledTime += middle - start
+
+            got = dict((interaction.other, interaction.severity) for interaction in compiled)
+            if got != expected:
+                raise CommandError('%s with %s and conditions %d: the compiled rules found %r, the raw rules %r' % (
+                    medication, ', '.join(medications), conditions, got, expected))
+        if sample:
+            self.stdout.write('verified %d checks against the raw rules, which were %.0f times slower' % (len(sample), directTime / max(compiledTime, 1e-9)))
@@ -0,0 +1,175 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from HealthApp import factories
+from HealthApp.models import SLOT_MINUTES, FIRST_HOUR, LAST_HOUR
+from HealthApp.benchmark import testDatabase, testEnvironment, percentile, Stopwatch
+from collections import OrderedDict
+import datetime, django, json, platform
+
+"""
+Benchmark suite for the main views. It seeds a throwaway database with factories.seed at the
+chosen scale, then requests each view through the test client a number of times, and reports
+latency percentiles and query counts per view. --output writes the results as json and
+--compare reads an earlier results file and shows how each view has moved.
+
+Run it with: python manage.py benchmark --scale 100k --output results.json
+"""
+
+VIEWS = ('userLogin', 'profile', 'staffProfile', 'register', 'export', 'createApp')
+
+#logged in patients the patient views take turns with, so the first visit of each is a cold one
+PATIENT_CLIENTS = 10
+
+
+def loggedIn(username):
+    client = Client()
+    if not client.login(username=username, password=factories.PASSWORD):
+        raise CommandError('could not log in as %s' % username)
+    return client
+
+
+class Command(BaseCommand):
+    help = 'Seeds synthetic data and times the main views, reporting percentiles and query counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(factories.SCALES), default='1k')
+        parser.add_argument('--patients', type=int, help='seed this many patients instead of a named scale')
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--views', default=','.join(VIEWS), help='comma separated, from: %s' % ', '.join(VIEWS))
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='write the results to this json file')
+        parser.add_argument('--compare', help='an earlier results file to compare against')
+
+    def handle(self, *args, **options):
+        views = [name.strip() for name in options['views'].split(',') if name.strip()]
+        unknown = [name for name in views if name not in VIEWS]
+        if unknown:
+            raise CommandError('unknown views: %s' % ', '.join(unknown))
+        patients = options['patients'] or factories.SCALES[options['scale']]
+        log = self.stdout.write if options['verbosity'] > 1 else None
+
+        with testEnvironment(), testDatabase():
+            with Stopwatch() as seeding:
+                fixture = factories.seed(patients, randomSeed=options['seed'], log=log)
+            self.stdout.write('seeded %s in %.1fs' % (', '.join('%d %s' % (count, name) for name, count in sorted(fixture.counts.items())), seeding.elapsed))
+
+            results = {
+                'meta': {
+                    'counts': fixture.counts,
+                    'seedSeconds': round(seeding.elapsed, 3),
+                    'iterations': options['iterations'],
+                    'database': connection.vendor,
+                    'django': django.get_version(),
+                    'python': platform.python_version(),
+                    'startedAt': timezone.now().isoformat(),
+                },
+                'views': OrderedDict(),
+            }
+            for name in views:
+                step = getattr(self, 'prepare_%s' % name)(fixture)
+                results['views'][name] = self.measure(name, step, options['warmup'], options['iterations'])
+
+        previous = None
+        if options['compare']:
+            with open(options['compare']) as previousFile:
+                previous = json.load(previousFile)['views']
+        self.report(results['views'], previous)
+
+        if options['output']:
+            with open(options['output'], 'w') as outputFile:
+                json.dump(results, outputFile, indent=2, sort_keys=True)
+            self.stdout.write('results written to %s' % options['output'])
+
+    def measure(self, name, step, warmup, iterations):
+        for i in range(warmup):
+            step(i)
+
+        timings = []
+        queryCounts = []
+        for i in range(warmup, warmup + iterations):
+            with CaptureQueriesContext(connection) as queries, Stopwatch() as stopwatch:
+                step(i)
+            timings.append(stopwatch.elapsed * 1000)
+            queryCounts.append(len(queries))
+
+        timings.sort()
+        queryCounts.sort()
+        return {
+            'p50Ms': round(percentile(timings, 0.5), 3),
+            'p95Ms': round(percentile(timings, 0.95), 3),
+            'p99Ms': round(percentile(timings, 0.99), 3),
+            'meanMs': round(sum(timings) / len(timings), 3),
+            'minMs': round(timings[0], 3),
+            'maxMs': round(timings[-1], 3),
+            'queriesMedian': percentile(queryCounts, 0.5),
+            'queriesMax': queryCounts[-1],
+        }
+
+    def report(self, views, previous):
+        self.stdout.write('%-14s %9s %9s %9s %9s %8s' % ('view', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'vs p50'))
+        for name, result in views.items():
+            change = ''
+            if previous and name in previous and previous[name]['p50Ms']:
+                change = '%+.0f%%' % ((result['p50Ms'] / previous[name]['p50Ms'] - 1) * 100)
+            self.stdout.write('%-14s %9.1f %9.1f %9.1f %9d %8s' % (name, result['p50Ms'], result['p95Ms'], result['p99Ms'], result['queriesMax'], change))
+
+    def expect(self, response, status, name):
+        if response.status_code != status:
+            raise CommandError('%s returned %d instead of %d' % (name, response.status_code, status))
+
+    #each prepare_ method does the setup for one view outside the timings and returns the step
+    #that makes a single request to it
+
+    def prepare_userLogin(self, fixture):
+        def step(i):
+            response = Client().post(reverse('login'), {'username': fixture.patients[i % len(fixture.patients)], 'password': factories.PASSWORD})
+            self.expect(response, 302, 'userLogin')
+        return step
+
+    def prepare_profile(self, fixture):
+        clients = [(username, loggedIn(username)) for username in fixture.patients[:PATIENT_CLIENTS]]
+
+        def step(i):
+            username, client = clients[i % len(clients)]
+            self.expect(client.get(reverse('profile', args=[username])), 200, 'profile')
+        return step
+
+    def prepare_staffProfile(self, fixture):
+        username = fixture.doctors[0]
+        client = loggedIn(username)
+
+        def step(i):
+            self.expect(client.get(reverse('staffProfile', args=[username])), 200, 'staffProfile')
+        return step
+
+    def prepare_register(self, fixture):
+        def step(i):
+            data = factories.registrationData(i, fixture.hospitals[0], fixture.doctors[0])
+            self.expect(Client().post(reverse('register'), data), 302, 'register')
+        return step
+
+    def prepare_export(self, fixture):
+        clients = [loggedIn(username) for username in fixture.patients[:PATIENT_CLIENTS]]
+
+        def step(i):
+            self.expect(clients[i % len(clients)].get(reverse('export')), 200, 'export')
+        return step
+
+    def prepare_createApp(self, fixture):
+        client = loggedIn(fixture.patients[0])
+        doctor = fixture.doctors[-1]
+        #bookings go a year out, past the seeded appointments, one slot after another
+        firstDay = timezone.localtime(timezone.now()).date() + datetime.timedelta(days=365)
+        slotsPerDay = (LAST_HOUR - FIRST_HOUR) * 60 // SLOT_MINUTES
+
+        def step(i):
+            day = firstDay + datetime.timedelta(days=i // slotsPerDay)
+            minutes = FIRST_HOUR * 60 + (i % slotsPerDay) * SLOT_MINUTES
+            data = {'doctor': doctor, 'date': day.isoformat(), 'time': '%02d:%02d' % (minutes // 60, minutes % 60), 'description': 'Benchmark'}
+            self.expect(client.post(reverse('createAppForm'), data), 302, 'createApp')
+        return step
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand, CommandError
+from HealthApp.geo import KDTree, toPoint, chordToMiles, getZipTable
+from HealthApp.benchmark import percentile, Stopwatch
+import random, time
+
+"""
+Benchmark for the nearest hospital lookup. Hospitals are scattered at random over the
+continental United States, about as many as there are in the country by default, and the
+nearest few are found for random points and for every zipcode in the bundled table.
+
+Each answer for a sample of the points is compared with checking the distance to every
+hospital. The command fails if the two ever disagree, and reports how much slower checking
+every hospital is.
+Run it with: python manage.py benchnearest --hospitals 6000
+"""
+
+#the continental United States, roughly
+SOUTH, NORTH, WEST, EAST = 24.5, 49.0, -124.8, -66.9
+
+
+def bruteForce(locations, latitude, longitude, k):
+    x, y, z = toPoint(latitude, longitude)
+    distances = sorted(((px - x) ** 2 + (py - y) ** 2 + (pz - z) ** 2, i) for i, (px, py, pz) in enumerate(locations))
+    return [(i, chordToMiles(distance)) for distance, i in distances[:k]]
+
+
+class Command(BaseCommand):
+    help = 'Times the nearest hospital lookup against checking the distance to every hospital'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hospitals', type=int, default=6000)
+        parser.add_argument('--queries', type=int, default=20000)
+        parser.add_argument('--k', type=int, default=3)
+        parser.add_argument('--verify', type=int, default=500, help='queries checked against every hospital as well')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        hospitals = [(rng.uniform(SOUTH, NORTH), rng.uniform(WEST, EAST)) for i in range(options['hospitals'])]
+        with Stopwatch() as building:
+            tree = KDTree(hospitals, list(range(len(hospitals))))
+        self.stdout.write('built the tree for %d hospitals in %.1fms' % (len(tree), building.elapsed * 1000))
+
+        zipTable = getZipTable()
+        points = [(rng.uniform(SOUTH, NORTH), rng.uniform(WEST, EAST)) for i in range(options['queries'])]
+        zipPoints = list(zip(zipTable.latitudes, zipTable.longitudes))
+        for name, queries in (('random points', points), ('zipcodes', zipPoints)):
+            timings = []
+            for latitude, longitude in queries:
+                start = time.perf_counter()
+                tree.nearest(latitude, longitude, options['k'])
+                timings.append((time.perf_counter() - start) * 1000000)
+            timings.sort()
+            self.stdout.write('%-14s %6d lookups, p50 %.1fus p99 %.1fus max %.1fus' % (
+                name, len(timings), percentile(timings, 0.5), percentile(timings, 0.99), timings[-1]))
+
+        self.verify(tree, hospitals, (points + zipPoints)[:options['verify']], options['k'])
+
+    def verify(self, tree, hospitals, sample, k):
+        locations = [toPoint(latitude, longitude) for latitude, longitude in hospitals]
+        treeTime = bruteTime = 0.0
+        for latitude, longitude in sample:
+            start = time.perf_counter()
+            found = tree.nearest(latitude, longitude, k)
+            middle = time.perf_counter()
+            expected = bruteForce(locations, latitude, longitude, k)
+            bruteTime += time.perf_counter() - middle
+            treeTime += middle - start
+
+            #ties could come back in either order, so the distances are what is compared
+            if [round(miles, 6) for i, miles in found] != [round(miles, 6) for i, miles in expected]:
+                raise CommandError('nearest to %.4f, %.4f: the tree found %r, checking every hospital %r' % (latitude, longitude, found, expected))
+        if sample:
+            self.stdout.write('verified %d lookups against checking every hospital, which was %.0f times slower' % (len(sample), bruteTime / max(treeTime, 1e-9)))
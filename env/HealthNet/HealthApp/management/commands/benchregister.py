@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from HealthApp.models import Doctor, Hospital, Patient
+from HealthApp.benchmark import testDatabase, testEnvironment, percentile, Stopwatch
+from HealthApp.factories import registrationData
+
+"""
+Registration benchmark. Posts the registration form the given number of times, each time as a
+new visitor, and reports registrations per second, latency percentiles and the number of
+queries a registration takes. Every registration has to end up as a logged in patient with
+their hospital and doctor set. Run it with: python manage.py benchregister
+"""
+
+
+class Command(BaseCommand):
+    help = 'Registers patients through the registration view and reports registrations per second'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100)
+
+    def handle(self, *args, **options):
+        count = options['count']
+
+        with testEnvironment(), testDatabase():
+            hospital = Hospital.objects.create(name='Bench Hospital')
+            doctor = Doctor.objects.create(user=User.objects.create_user('benchdoctor', first_name='Bench', last_name='Doctor'))
+
+            timings = []
+            queryCounts = []
+            with Stopwatch() as total:
+                for index in range(count):
+                    client = Client()
+                    with CaptureQueriesContext(connection) as queries, Stopwatch() as stopwatch:
+                        response = client.post(reverse('register'), registrationData(index, hospital.name, doctor.user.username))
+                    if response.status_code != 302:
+                        raise CommandError('registration %d returned %d' % (index, response.status_code))
+                    if '_auth_user_id' not in client.session:
+                        raise CommandError('registration %d did not log the patient in' % index)
+                    timings.append(stopwatch.elapsed)
+                    queryCounts.append(len(queries))
+
+            registered = Patient.objects.filter(hospital=hospital, doctor=doctor, user__username__startswith='newpatient').count()
+            if registered != count:
+                raise CommandError('%d of %d registrations made a complete patient' % (registered, count))
+
+            timings.sort()
+            self.stdout.write('registrations: %d  time: %.2fs  per second: %.1f' % (count, total.elapsed, count / total.elapsed))
+            self.stdout.write('latency p50: %.1fms  p95: %.1fms  p99: %.1fms' % tuple(percentile(timings, fraction) * 1000 for fraction in (0.5, 0.95, 0.99)))
+            self.stdout.write('queries per registration: %d' % max(queryCounts))
@@ -0,0 +1,83 @@
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from HealthApp import factories
+from HealthApp.models import Appointment, AppointmentReminder
+from HealthApp.reminders import Dispatcher
+from HealthApp.benchmark import testDatabase, Stopwatch
+import asyncore, datetime, smtpd, threading
+
+"""
+Benchmark for the reminder job. It seeds a throwaway database with factories.seed(), starts an
+SMTP server in this process that accepts and discards every message, and sends the reminders
+for every seeded appointment in the next --days days through it over a real SMTP connection.
+
+It then checks that every appointment in the window got exactly one reminder and that each
+patient got one email, and runs the job a second time, which must send nothing.
+Run it with: python manage.py benchreminders --patients 100000
+"""
+
+
+class SinkServer(smtpd.SMTPServer):
+    #accepts every message and keeps nothing but a count
+
+    def __init__(self):
+        smtpd.SMTPServer.__init__(self, ('127.0.0.1', 0), None, decode_data=False)
+        self.received = 0
+
+    def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+        self.received += 1
+
+
+class Command(BaseCommand):
+    help = 'Sends appointment reminders for a seeded database through a local SMTP server and checks none are missed or repeated'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=10000)
+        parser.add_argument('--days', type=int, default=7, help='how far ahead to send reminders for')
+        parser.add_argument('--page-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with testDatabase():
+            with Stopwatch() as seeding:
+                factories.seed(options['patients'], randomSeed=options['seed'])
+            self.stdout.write('seeded %d patients in %.1fs' % (options['patients'], seeding.elapsed))
+
+            server = SinkServer()
+            host, port = server.socket.getsockname()
+            thread = threading.Thread(target=asyncore.loop, kwargs={'timeout': 0.1}, daemon=True)
+            thread.start()
+            try:
+                hours = options['days'] * 24
+                dispatcher = self.run(host, port, hours, options['page_size'])
+                self.verify(dispatcher, server)
+                again = self.run(host, port, hours, options['page_size'])
+                if again.counts['sent'] or again.counts['claimed']:
+                    raise CommandError('the second run sent %d reminders again' % again.counts['sent'])
+            finally:
+                server.close()
+                thread.join()
+
+    def run(self, host, port, hours, pageSize):
+        connection = get_connection('django.core.mail.backends.smtp.EmailBackend', host=host, port=port, use_tls=False, use_ssl=False)
+        dispatcher = Dispatcher(connection, hours=hours, pageSize=pageSize)
+        with Stopwatch() as stopwatch:
+            counts = dispatcher.run()
+        self.stdout.write('%d appointments in %.1fs: %d reminders in %d emails, %.0f reminders per hour, %d failed' % (
+            counts['appointments'], stopwatch.elapsed, counts['sent'], counts['messages'],
+            counts['sent'] * 3600 / max(stopwatch.elapsed, 1e-9), counts['failed']))
+        return dispatcher
+
+    def verify(self, dispatcher, server):
+        appointments = Appointment.objects.filter(date__gte=dispatcher.start, date__lt=dispatcher.end)
+        expected = appointments.count()
+        patients = appointments.values('patient_id').distinct().count()
+        reminders = AppointmentReminder.objects.filter(status=AppointmentReminder.SENT)
+        repeated = reminders.values('appointment_id').annotate(times=Count('pk')).filter(times__gt=1).count()
+        if reminders.count() != expected or repeated:
+            raise CommandError('%d appointments in the window but %d reminders sent, %d of them repeated' % (expected, reminders.count(), repeated))
+        if dispatcher.counts['messages'] != patients or server.received != patients:
+            raise CommandError('%d patients had appointments but %d emails were sent and %d received' % (
+                patients, dispatcher.counts['messages'], server.received))
+        self.stdout.write('verified one reminder for each of the %d appointments and one email for each of the %d patients' % (expected, patients))
@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand
+from HealthApp.searchindex import SearchIndex
+from HealthApp.benchmark import percentile, Stopwatch
+from collections import OrderedDict
+import random, time
+
+"""
+Benchmark for the patient search index over a large synthetic population, a million patients
+by default, with made up names, usernames, emails and phone numbers. The index is built in
+memory from generated rows, so the numbers are the cost of the index itself and not of reading
+the patients from the database.
+
+It reports the build time, then searches with the kinds of query staff type (a last name, a
+first and last name, the first two letters of a name, the last digits of a phone number, an
+email address and a name nobody has) from the scope of a doctor and of a nurse's hospital, and
+finally times updating a patient in place the way the signal receivers do.
+Run it with: python manage.py benchsearch --patients 1000000
+"""
+
+SYLLABLES = ('an', 'ber', 'car', 'da', 'el', 'fer', 'gan', 'ha', 'is', 'jo', 'ka', 'lin', 'mar', 'ne', 'o',
+             'per', 'qui', 'ro', 'son', 'ta', 'u', 'vi', 'wil', 'xa', 'yo', 'zi')
+
+
+def makeName(rng, parts):
+    return ''.join(rng.choice(SYLLABLES) for i in range(parts)).title()
+
+
+class Command(BaseCommand):
+    help = 'Times building and searching the patient search index over a large synthetic population'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=500, help='searches timed for each kind of query and scope')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        doctors = max(1, options['patients'] // 100)
+        hospitals = max(1, options['patients'] // 5000)
+        firstNames = [makeName(rng, rng.randint(2, 3)) for i in range(500)]
+        lastNames = [makeName(rng, rng.randint(2, 4)) for i in range(5000)]
+
+        rows = []
+        for patientId in range(1, options['patients'] + 1):
+            firstName, lastName = rng.choice(firstNames), rng.choice(lastNames)
+            rows.append((patientId, rng.randint(1, doctors), rng.randint(1, hospitals), firstName, lastName,
+                         '%s%s%d' % (firstName[0].lower(), lastName.lower(), patientId),
+                         '%s.%s%d@example.com' % (firstName.lower(), lastName.lower(), patientId % 1000),
+                         '585%07d' % rng.randrange(10000000)))
+
+        with Stopwatch() as building:
+            index = SearchIndex.fromRows(iter(rows))
+        self.stdout.write('built the index for %d patients in %.1fs, %d posting lists' % (
+            len(rows), building.elapsed, sum(len(postings) for postings in index.trigrams.values())))
+
+        queries = OrderedDict([
+            ('last name', lambda row: row[4]),
+            ('first and last', lambda row: '%s %s' % (row[3], row[4])),
+            ('two letters', lambda row: row[4][:2]),
+            ('phone digits', lambda row: row[7][-4:]),
+            ('email', lambda row: row[6]),
+            ('no match', lambda row: 'Qqxz%s' % row[4]),
+        ])
+        scopes = OrderedDict([
+            ('doctor', lambda row: {'doctorId': row[1]}),
+            ('hospital', lambda row: {'hospitalIds': [row[2]]}),
+        ])
+
+        self.stdout.write('%-16s %-9s %9s %9s %9s %8s' % ('query', 'scope', 'p50 ms', 'p99 ms', 'max ms', 'found'))
+        for queryName, makeQuery in queries.items():
+            for scopeName, makeScope in scopes.items():
+                timings = []
+                found = 0
+                for i in range(options['queries']):
+                    row = rng.choice(rows)
+                    query, scope = makeQuery(row), makeScope(row)
+                    start = time.perf_counter()
+                    matches = index.search(query, **scope)
+                    timings.append((time.perf_counter() - start) * 1000)
+                    found += bool(matches)
+                timings.sort()
+                self.stdout.write('%-16s %-9s %9.2f %9.2f %9.2f %7.0f%%' % (queryName, scopeName, percentile(timings, 0.5),
+                                                                         percentile(timings, 0.99), timings[-1], 100.0 * found / len(timings)))
+
+        timings = []
+        for i in range(options['queries']):
+            row = list(rng.choice(rows))
+            row[4] = rng.choice(lastNames)
+            start = time.perf_counter()
+            index.add(tuple(row))
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        self.stdout.write('updated %d patients in place, p50 %.2fms p99 %.2fms' % (len(timings), percentile(timings, 0.5), percentile(timings, 0.99)))
@@ -0,0 +1,262 @@
+from concurrent.futures import ProcessPoolExecutor
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction, IntegrityError
+from django.db.models import Max
+from HealthApp.models import Doctor, Hospital, Patient, UserInfo, ProfileInfo, MedicalInfo
+from HealthApp.forms import UserForm, ProfileForm
+from HealthApp.conditions import CONDITIONS
+from HealthApp.views import staffExportHeader
+import csv, itertools, os, time
+
+"""
+Bulk patient import for onboarding a hospital. The csv has the same columns as the staff export
+with a Password column added, so an export from one install can be loaded into another once the
+passwords are filled in. Run it with: python manage.py importpatients patients.csv
+
+The file is read a batch at a time. Each row is checked with the same forms registration uses,
+and its hospital and doctor are looked up in maps of every hospital name and doctor username
+read once at the start. Rows that fail are reported with their line number and skipped while
+the rest of the batch carries on; --errors writes them out to a csv that can be fixed and
+imported again.
+
+Passwords are hashed in a pool of worker processes, since the hashing is deliberately slow and
+takes far longer than the inserts. Each batch is then written in its own transaction with one
+bulk insert per table. bulk_create can't hand back the ids it made, so each batch is given a
+block of ids after the highest one in every table and the rows are linked up before they are
+inserted. If the site inserted a row into one of those blocks meanwhile the batch is rolled
+back and given a new block. A batch that still fails after that is inserted a row at a time, so
+the rows at fault are reported with the database's own error and the rest are imported.
+"""
+
+BATCH_SIZE = 1000
+
+#a batch is given a fresh block of ids this many times before it is reported as failed
+ID_RETRIES = 3
+
+TRUE_VALUES = ('true', '1', 'yes', 'y', 'x', 'on')
+
+PASSWORD_COLUMN = 'Password'
+
+#csv column to form field name for the two forms each row is checked with
+USER_INFO_COLUMNS = (('Policy Number', 'policyNumber'), ('Provider', 'provider'), ('Group Number', 'groupNumber'))
+PROFILE_COLUMNS = (('Firstname', 'firstName'), ('Middlename', 'middleName'), ('Lastname', 'lastName'),
+                   ('Address', 'address'), ('City', 'city'), ('State', 'state'), ('Date of Birth', 'dateOfBirth'),
+                   ('Zipcode', 'zipcode'), ('Phone Number', 'phoneNumber'), ('Email', 'email'),
+                   ('Emergency Contact', 'eName'), ('Emergency Phone', 'ePhoneNumber'))
+
+
+class RowError(Exception):
+    pass
+
+
+def hashPassword(password):
+    #runs in the worker processes, so it has to be a plain module level function
+    return make_password(password)
+
+
+def formErrors(form):
+    return '; '.join('%s: %s' % (field, ' '.join(errors)) for field, errors in form.errors.items())
+
+
+class ImportRow(object):
+    #one validated csv row, holding the unsaved model objects it turns into
+    def __init__(self, line, values, hospitals, doctors):
+        self.line = line
+        self.values = values
+
+        #DictReader puts extra cells under the key None and fills missing ones with None
+        if None in values or None in values.values():
+            raise RowError('the row does not have the same number of columns as the header.')
+
+        self.username = (values['Username'] or '').strip()
+        try:
+            User._meta.get_field('username').clean(self.username, None)
+        except ValidationError as e:
+            raise RowError('Username: %s' % ' '.join(e.messages))
+        self.password = values[PASSWORD_COLUMN]
+        if not self.password:
+            raise RowError('Password: this field is required.')
+
+        userForm = UserForm(data=dict((field, values[column]) for column, field in USER_INFO_COLUMNS))
+        profileForm = ProfileForm(data=dict((field, values[column]) for column, field in PROFILE_COLUMNS))
+        if not userForm.is_valid():
+            raise RowError(formErrors(userForm))
+        if not profileForm.is_valid():
+            raise RowError(formErrors(profileForm))
+        self.userInfo = userForm.save(commit=False)
+        self.profileInfo = profileForm.save(commit=False)
+
+        self.medicalInfo = MedicalInfo(otherText=values['Other'] or None)
+        self.medicalInfo.setConditions(condition.key for condition in CONDITIONS
+                                       if (values[condition.label] or '').strip().lower() in TRUE_VALUES)
+
+        self.hospitalId = self.lookup(hospitals, values['Hospital'], 'Hospital')
+        self.doctorId = self.lookup(doctors, values['Doctor'], 'Doctor')
+
+    def lookup(self, ids, name, column):
+        name = (name or '').strip()
+        if not name:
+            return None
+        if name not in ids:
+            raise RowError('%s: %s does not exist.' % (column, name))
+        return ids[name]
+
+
+class Command(BaseCommand):
+    help = 'Creates patients in bulk from a csv laid out like the staff export with a Password column'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csvfile')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='processes used to hash passwords, 0 hashes them in this process')
+        parser.add_argument('--errors', help='write the rows that failed to this csv with an Error column')
+
+    def handle(self, *args, **options):
+        self.hospitals = dict((name, pk) for pk, name in Hospital.objects.values_list('pk', 'name'))
+        self.doctors = dict(Doctor.objects.values_list('user__username', 'pk'))
+        self.imported = 0
+        self.failures = []
+
+        executor = ProcessPoolExecutor(options['workers']) if options['workers'] > 0 else None
+        start = time.time()
+        try:
+            with open(options['csvfile'], newline='') as csvfile:
+                reader = csv.DictReader(csvfile)
+                missing = [column for column in staffExportHeader() + [PASSWORD_COLUMN] if column not in (reader.fieldnames or [])]
+                if missing:
+                    raise CommandError('the csv is missing the columns: %s' % ', '.join(missing))
+                self.fieldnames = reader.fieldnames
+
+                #line numbers count the header as line 1
+                numbered = enumerate(reader, 2)
+                while True:
+                    batch = list(itertools.islice(numbered, options['batch_size']))
+                    if not batch:
+                        break
+                    self.importBatch(batch, executor)
+                    self.stdout.write('%d imported, %d failed, %.0f rows/s' % (self.imported, len(self.failures),
+                                                                             (self.imported + len(self.failures)) / (time.time() - start)))
+        finally:
+            if executor:
+                executor.shutdown()
+
+        self.resetSequences()
+        if options['errors'] and self.failures:
+            self.writeErrors(options['errors'])
+        self.stdout.write('done: %d imported, %d failed in %.1fs' % (self.imported, len(self.failures), time.time() - start))
+
+    def fail(self, line, values, message):
+        self.failures.append((line, values, message))
+        self.stderr.write('line %d: %s' % (line, message))
+
+    def importBatch(self, batch, executor):
+        rows = []
+        seen = set()
+        for line, values in batch:
+            try:
+                row = ImportRow(line, values, self.hospitals, self.doctors)
+            except RowError as e:
+                self.fail(line, values, str(e))
+                continue
+            if row.username in seen:
+                self.fail(line, values, 'Username: %s appears more than once in this batch.' % row.username)
+                continue
+            seen.add(row.username)
+            rows.append(row)
+
+        rows = self.dropExisting(rows)
+        if not rows:
+            return
+
+        passwords = [row.password for row in rows]
+        if executor:
+            hashes = executor.map(hashPassword, passwords, chunksize=max(1, len(passwords) // 64))
+        else:
+            hashes = map(hashPassword, passwords)
+        for row, passwordHash in zip(rows, hashes):
+            row.passwordHash = passwordHash
+
+        for attempt in range(ID_RETRIES):
+            try:
+                with transaction.atomic():
+                    self.insert(rows)
+                self.imported += len(rows)
+                return
+            except IntegrityError:
+                #either the site took one of the ids or someone registered one of the usernames
+                rows = self.dropExisting(rows)
+                if not rows:
+                    return
+
+        #something else is wrong with one of the rows, so find out which by inserting them one by one
+        for row in rows:
+            self.insertAlone(row)
+
+    def insertAlone(self, row):
+        for attempt in range(ID_RETRIES):
+            try:
+                with transaction.atomic():
+                    self.insert([row])
+                self.imported += 1
+                return
+            except IntegrityError as e:
+                error = e
+                if not self.dropExisting([row]):
+                    return
+        self.fail(row.line, row.values, 'could not be inserted: %s' % error)
+
+    def dropExisting(self, rows):
+        existing = set(User.objects.filter(username__in=[row.username for row in rows]).values_list('username', flat=True))
+        kept = []
+        for row in rows:
+            if row.username in existing:
+                self.fail(row.line, row.values, 'Username: a user with that username already exists.')
+            else:
+                kept.append(row)
+        return kept
+
+    def nextId(self, model):
+        return (model.objects.aggregate(highest=Max('pk'))['highest'] or 0) + 1
+
+    def insert(self, rows):
+        userId, userInfoId, profileInfoId, medicalInfoId, patientId = [self.nextId(model) for model in (User, UserInfo, ProfileInfo, MedicalInfo, Patient)]
+
+        users = []
+        patients = []
+        for offset, row in enumerate(rows):
+            profileInfo = row.profileInfo
+            users.append(User(id=userId + offset, username=row.username, password=row.passwordHash,
+                              first_name=profileInfo.firstName, last_name=profileInfo.lastName, email=profileInfo.email))
+            row.userInfo.id = userInfoId + offset
+            profileInfo.id = profileInfoId + offset
+            row.medicalInfo.id = medicalInfoId + offset
+            patients.append(Patient(id=patientId + offset, user_id=userId + offset, userInfo_id=userInfoId + offset,
+                                    profileInfo_id=profileInfoId + offset, medicalInfo_id=medicalInfoId + offset,
+                                    hospital_id=row.hospitalId, doctor_id=row.doctorId))
+
+        User.objects.bulk_create(users)
+        UserInfo.objects.bulk_create([row.userInfo for row in rows])
+        ProfileInfo.objects.bulk_create([row.profileInfo for row in rows])
+        MedicalInfo.objects.bulk_create([row.medicalInfo for row in rows])
+        Patient.objects.bulk_create(patients)
+
+    def resetSequences(self):
+        #MySQL and sqlite move their counters past explicit ids by themselves, other databases need telling
+        statements = connection.ops.sequence_reset_sql(no_style(), [User, UserInfo, ProfileInfo, MedicalInfo, Patient])
+        if statements:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+
+    def writeErrors(self, path):
+        with open(path, 'w', newline='') as errorFile:
+            writer = csv.writer(errorFile)
+            writer.writerow(['Line'] + self.fieldnames + ['Error'])
+            for line, values, message in self.failures:
+                writer.writerow([line] + [values.get(column, '') for column in self.fieldnames] + [message])
+        self.stdout.write('failed rows written to %s' % path)
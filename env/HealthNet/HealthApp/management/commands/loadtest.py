@@ -0,0 +1,316 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import resolve, Resolver404
+from django.db import connection
+from django.utils import timezone
+from django.test.utils import override_settings
+from django.utils.http import urlencode
+from HealthApp import factories
+from HealthApp.models import SLOT_MINUTES, FIRST_HOUR, LAST_HOUR
+from HealthApp.benchmark import testDatabase, percentile
+from HealthNet.wsgi import application
+from http.client import HTTPConnection
+from http.cookies import SimpleCookie
+from io import BytesIO
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler
+import datetime, json, random, re, threading, time
+
+"""
+Load test for the whole site. A number of simulated users run at the same time, each one
+working through a script of what a patient, doctor or nurse does on the site: logging in,
+looking at their profile or roster, opening patient details, loading the calendar and booking
+appointments. Requests go through HealthNet.wsgi.application with every middleware, either by
+calling it directly (--mode wsgi) or over HTTP to a threaded server started on a local port
+(--mode http). Either way the site runs against a throwaway database seeded by factories.seed.
+
+At the end it reports requests per second and p50/p95/p99 latency and error rates for every
+url name. Run it with: python manage.py loadtest --concurrency 20 --duration 60
+"""
+
+DEFAULT_MIX = 'patient=70,doctor=20,nurse=10'
+
+PATIENT_LINK = re.compile(r'data-patient="(\d+)"')
+PATIENT_USERNAME = re.compile(r'\((\w+)\)\s*</a>')
+NEXT_CURSOR = re.compile(r'\?cursor=([A-Za-z0-9_\-=%]+)')
+
+
+class Session(object):
+    #one simulated browser, keeping the cookies the site sets
+    def __init__(self):
+        self.cookies = SimpleCookie()
+
+    def cookieHeader(self):
+        return '; '.join('%s=%s' % (name, morsel.value) for name, morsel in self.cookies.items())
+
+    def keepCookies(self, headers):
+        for name, value in headers:
+            if name.lower() == 'set-cookie':
+                self.cookies.load(value)
+
+    def request(self, method, path, data=None):
+        #returns the status and the body, following no redirects
+        body = urlencode(data).encode('utf-8') if data else b''
+        return self.send(method, path, body)
+
+
+class WsgiSession(Session):
+    def send(self, method, path, body):
+        path, _, query = path.partition('?')
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'testserver',
+            'HTTP_COOKIE': self.cookieHeader(),
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': BytesIO(body),
+            'wsgi.errors': BytesIO(),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        started = {}
+
+        def startResponse(status, headers, excInfo=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = headers
+
+        result = application(environ, startResponse)
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        self.keepCookies(started['headers'])
+        return started['status'], content
+
+
+class HttpSession(Session):
+    def __init__(self, host, port):
+        super(HttpSession, self).__init__()
+        self.host = host
+        self.port = port
+
+    def send(self, method, path, body):
+        connection = HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            headers = {'Cookie': self.cookieHeader(), 'Content-Type': 'application/x-www-form-urlencoded'}
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            content = response.read()
+            self.keepCookies(response.getheaders())
+            return response.status, content
+        finally:
+            connection.close()
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Recorder(object):
+    #collects the latency and status of every request by url name
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = {}
+        self.errors = {}
+
+    def add(self, name, elapsed, failed):
+        with self.lock:
+            self.timings.setdefault(name, []).append(elapsed)
+            if failed:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self, duration):
+        results = {}
+        for name, timings in sorted(self.timings.items()):
+            timings = sorted(timings)
+            errors = self.errors.get(name, 0)
+            results[name] = {
+                'requests': len(timings),
+                'perSecond': round(len(timings) / duration, 2),
+                'p50Ms': round(percentile(timings, 0.5) * 1000, 3),
+                'p95Ms': round(percentile(timings, 0.95) * 1000, 3),
+                'p99Ms': round(percentile(timings, 0.99) * 1000, 3),
+                'errors': errors,
+                'errorRate': round(float(errors) / len(timings), 4),
+            }
+        return results
+
+
+class VirtualUser(object):
+    #runs scripts one after another with its own session until the deadline
+    def __init__(self, command, fixture, recorder, sessionFactory, mix, deadline, rng):
+        self.command = command
+        self.fixture = fixture
+        self.recorder = recorder
+        self.sessionFactory = sessionFactory
+        self.mix = mix
+        self.deadline = deadline
+        self.rng = rng
+
+    def call(self, method, path, data=None, expect=(200, 302)):
+        try:
+            name = resolve(path.split('?', 1)[0]).url_name or 'unnamed'
+        except Resolver404:
+            name = 'unresolved'
+        start = time.perf_counter()
+        try:
+            status, content = self.session.request(method, path, data)
+        except Exception as e:
+            self.recorder.add(name, time.perf_counter() - start, True)
+            self.command.noteError('%s %s: %r' % (method, path, e))
+            return 0, b''
+        self.recorder.add(name, time.perf_counter() - start, status not in expect)
+        if status not in expect:
+            self.command.noteError('%s %s: %d' % (method, path, status))
+        return status, content
+
+    def login(self, username):
+        self.session = self.sessionFactory()
+        self.call('POST', '/login/', {'username': username, 'password': factories.PASSWORD}, expect=(302,))
+
+    def run(self):
+        roles = [role for role, weight in self.mix for i in range(weight)]
+        try:
+            while time.time() < self.deadline:
+                getattr(self, self.rng.choice(roles))()
+        finally:
+            connection.close()
+
+    def patient(self):
+        username = self.rng.choice(self.fixture.patients)
+        self.login(username)
+        self.call('GET', '/%s/profile/' % username)
+        today = timezone.localtime(timezone.now()).date()
+        monday = today - datetime.timedelta(days=today.weekday())
+        self.call('GET', '/appointmentEvents/?' + urlencode({'start': monday.isoformat(), 'end': (monday + datetime.timedelta(days=35)).isoformat()}))
+        if self.rng.random() < 0.3:
+            #a random working hour slot on a random upcoming day, some of which will already be taken
+            day = today + datetime.timedelta(days=self.rng.randint(1, 60))
+            minutes = FIRST_HOUR * 60 + self.rng.randrange((LAST_HOUR - FIRST_HOUR) * 60 // SLOT_MINUTES) * SLOT_MINUTES
+            self.call('POST', '/createAppForm/', {'doctor': self.rng.choice(self.fixture.doctors), 'date': day.isoformat(),
+                                                  'time': '%02d:%02d' % (minutes // 60, minutes % 60), 'description': 'Load test'})
+            self.call('GET', '/%s/profile/' % username)
+        self.call('GET', '/logout/')
+
+    def staff(self, username):
+        self.login(username)
+        status, content = self.call('GET', '/%s/staffProfile/' % username)
+        patientIds = PATIENT_LINK.findall(content.decode('utf-8', 'replace'))
+        for patientId in self.rng.sample(patientIds, min(3, len(patientIds))):
+            self.call('GET', '/patientDetail/%s/' % patientId)
+        usernames = PATIENT_USERNAME.findall(content.decode('utf-8', 'replace'))
+        if usernames:
+            #typing the start of someone's username into the search box
+            self.call('GET', '/patientSearch/?' + urlencode({'q': self.rng.choice(usernames)[:3]}))
+        nextCursor = NEXT_CURSOR.search(content.decode('utf-8', 'replace'))
+        if nextCursor and self.rng.random() < 0.5:
+            self.call('GET', '/%s/staffProfile/?cursor=%s' % (username, nextCursor.group(1)))
+        self.call('GET', '/logout/')
+
+    def doctor(self):
+        self.staff(self.rng.choice(self.fixture.doctors))
+
+    def nurse(self):
+        self.staff(self.rng.choice(self.fixture.nurses))
+
+
+def parseMix(text):
+    mix = []
+    for part in text.split(','):
+        role, _, weight = part.partition('=')
+        role = role.strip()
+        if role not in ('patient', 'doctor', 'nurse'):
+            raise CommandError('unknown role in the mix: %s' % role)
+        try:
+            mix.append((role, int(weight)))
+        except ValueError:
+            raise CommandError('the mix needs role=weight pairs, got %s' % part)
+    return mix
+
+
+class Command(BaseCommand):
+    help = 'Drives the WSGI application with concurrent scripted users and reports latency per url name'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=('wsgi', 'http'), default='wsgi')
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--duration', type=float, default=30, help='seconds to run for')
+        parser.add_argument('--patients', type=int, default=1000, help='patients to seed, the rest scale with it')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help='weights of each kind of user, default %s' % DEFAULT_MIX)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='write the results to this json file')
+
+    def noteError(self, message):
+        with self.errorLock:
+            if len(self.errorSamples) < 10:
+                self.errorSamples.append(message)
+
+    def handle(self, *args, **options):
+        mix = parseMix(options['mix'])
+        self.errorLock = threading.Lock()
+        self.errorSamples = []
+
+        #the in-process requests are made to testserver and the http ones to the local server
+        with override_settings(ALLOWED_HOSTS=['testserver', '127.0.0.1']), testDatabase():
+            fixture = factories.seed(options['patients'], randomSeed=options['seed'])
+
+            server = None
+            if options['mode'] == 'http':
+                server = make_server('127.0.0.1', 0, application, server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                host, port = server.server_address
+                sessionFactory = lambda: HttpSession(host, port)
+            else:
+                sessionFactory = WsgiSession
+
+            recorder = Recorder()
+            started = time.time()
+            deadline = started + options['duration']
+            users = [VirtualUser(self, fixture, recorder, sessionFactory, mix, deadline, random.Random(options['seed'] * 1000 + i))
+                     for i in range(options['concurrency'])]
+            threads = [threading.Thread(target=user.run) for user in users]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            duration = time.time() - started
+
+            if server:
+                server.shutdown()
+                server.server_close()
+
+        results = {
+            'meta': {'mode': options['mode'], 'concurrency': options['concurrency'], 'duration': round(duration, 3),
+                     'mix': options['mix'], 'counts': fixture.counts, 'database': connection.vendor},
+            'urls': recorder.summary(duration),
+        }
+        total = sum(entry['requests'] for entry in results['urls'].values())
+        errors = sum(entry['errors'] for entry in results['urls'].values())
+        results['meta']['requests'] = total
+        results['meta']['perSecond'] = round(total / duration, 2)
+
+        self.stdout.write('%d requests in %.1fs, %.1f per second, %d errors' % (total, duration, total / duration, errors))
+        self.stdout.write('%-18s %8s %8s %9s %9s %9s %7s' % ('url name', 'requests', 'per sec', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+        for name, entry in results['urls'].items():
+            self.stdout.write('%-18s %8d %8.1f %9.1f %9.1f %9.1f %6.1f%%' % (name, entry['requests'], entry['perSecond'], entry['p50Ms'],
+                                                                            entry['p95Ms'], entry['p99Ms'], entry['errorRate'] * 100))
+        for message in self.errorSamples:
+            self.stdout.write('error: %s' % message)
+
+        if options['output']:
+            with open(options['output'], 'w') as outputFile:
+                json.dump(results, outputFile, indent=2, sort_keys=True)
+            self.stdout.write('results written to %s' % options['output'])
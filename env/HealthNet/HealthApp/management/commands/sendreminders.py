@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from HealthApp.reminders import Dispatcher, REMINDER_HOURS, PAGE_SIZE
+from HealthApp.benchmark import Stopwatch
+
+"""
+Emails every patient with an appointment in the next few hours a reminder listing them, one
+email per patient however many appointments they have. Reminders that were already sent are
+never sent again, so this is meant to be run from cron every few minutes, e.g.
+*/10 * * * * python manage.py sendreminders --hours 24
+Mail goes through the EMAIL_HOST and EMAIL_PORT server in settings.py. See reminders.py for how
+a run works.
+"""
+
+
+class Command(BaseCommand):
+    help = 'Emails reminders for the appointments in the next few hours that have not had one yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=REMINDER_HOURS, help='how far ahead to remind patients')
+        parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+
+    def handle(self, *args, **options):
+        if options['hours'] <= 0 or options['page_size'] <= 0:
+            raise CommandError('--hours and --page-size must be positive')
+
+        dispatcher = Dispatcher(hours=options['hours'], pageSize=options['page_size'])
+        with Stopwatch() as stopwatch:
+            try:
+                counts = dispatcher.run()
+            except OSError as e:
+                raise CommandError('could not connect to the mail server: %s' % e)
+
+        self.stdout.write('%d appointments checked in %.1fs, %d reminders sent in %d emails (%.0f per hour), %d failed, %d skipped' % (
+            counts['appointments'], stopwatch.elapsed, counts['sent'], counts['messages'],
+            counts['sent'] * 3600 / max(stopwatch.elapsed, 1e-9), counts['failed'], counts['skipped']))
@@ -0,0 +1,109 @@
+from types import MappingProxyType
+import bisect, json, logging, os, threading, time
+
+"""
+The medication catalog. It is read from data/medications.json, which lists every medication
+category with the medications in it, and is built into a Catalog once per process.
+
+A Catalog never changes after it is built. Every medication name is kept in one sorted tuple,
+so the names starting with what has been typed so far sit next to each other and are found
+with a binary search followed by a short scan. A second map goes from each medication to every
+category it is listed under, since a drug like paromomycin is both an amebicide and an
+aminoglycoside.
+
+Callers always go through getCatalog(). At most once every RELOAD_CHECK_SECONDS it checks
+whether the catalog file has changed and, if it has, builds a new Catalog and swaps it in with
+a single assignment. A request that is already holding the old catalog keeps using it, so a
+new file can be rolled out without restarting workers. The file should be replaced with a
+rename so a half written file is never read; a file that fails to load is logged and the
+current catalog is kept.
+"""
+
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'medications.json')
+
+RELOAD_CHECK_SECONDS = 30
+
+logger = logging.getLogger(__name__)
+
+
+def normalizeName(name):
+    return name.strip().lower().replace(' ', '-')
+
+
+class Catalog(object):
+
+    def __init__(self, categories):
+        #categories is a list of (category name, medication names) pairs
+        categoriesByName = {}
+        for categoryName, medications in categories:
+            for name in medications:
+                categoriesByName.setdefault(normalizeName(name), set()).add(categoryName)
+
+        self.categoryNames = tuple(categoryName for categoryName, medications in categories)
+        self.names = tuple(sorted(categoriesByName))
+        self.categories = MappingProxyType(dict((name, tuple(sorted(found))) for name, found in categoriesByName.items()))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as catalogFile:
+            data = json.load(catalogFile)
+        return cls([(category['name'], category['medications']) for category in data['categories']])
+
+    def search(self, prefix, limit=10):
+        #the names beginning with prefix, in alphabetical order
+        prefix = normalizeName(prefix)
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self.names, prefix)
+        matches = []
+        for name in self.names[start:start + limit]:
+            if not name.startswith(prefix):
+                break
+            matches.append(name)
+        return matches
+
+    def categoriesFor(self, name):
+        return self.categories.get(normalizeName(name), ())
+
+    def __contains__(self, name):
+        return normalizeName(name) in self.categories
+
+
+_catalog = None
+_catalogModified = None
+_nextCheck = 0
+_reloadLock = threading.Lock()
+
+
+def reloadCatalog(path=None):
+    #builds a catalog from the file and swaps it in, keeping the current one if the file is bad
+    global _catalog, _catalogModified
+    path = path or CATALOG_PATH
+    with _reloadLock:
+        try:
+            modified = os.stat(path).st_mtime
+            catalog = Catalog.load(path)
+        except (OSError, ValueError, KeyError, TypeError):
+            if _catalog is None:
+                raise
+            logger.exception("could not reload the medication catalog from %s", path)
+            return _catalog
+        _catalog, _catalogModified = catalog, modified
+        return catalog
+
+
+def getCatalog():
+    global _nextCheck
+    catalog = _catalog
+    if catalog is None:
+        return reloadCatalog()
+
+    now = time.time()
+    if now >= _nextCheck:
+        _nextCheck = now + RELOAD_CHECK_SECONDS
+        try:
+            if os.stat(CATALOG_PATH).st_mtime != _catalogModified:
+                return reloadCatalog()
+        except OSError:
+            pass
+    return catalog
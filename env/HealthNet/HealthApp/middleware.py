@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.db import connection
+import logging, threading
+
+"""
+QueryBudgetMiddleware records the SQL each request runs, grouped by the name of the url it
+resolved to: how many requests there were, their query counts, the total time spent in the
+database and the slowest single statement seen. The totals are kept in this process and are
+dumped as json by the queryStats view.
+
+Budgets are set per url name in settings.QUERY_BUDGETS as the most queries a request to that
+view should take. A request over budget is logged, or with QUERY_BUDGET_ACTION = 'raise' it
+fails with QueryBudgetExceeded, which is meant for development so a new N+1 shows up straight
+away instead of as a timeout later on.
+
+Queries are captured the same way DEBUG captures them, by turning on the connection's debug
+cursor for the length of the request. Streamed responses keep running queries after the view
+has returned, so for those the request is recorded once the last chunk has been sent.
+"""
+
+logger = logging.getLogger(__name__)
+
+_stats = {}
+_statsLock = threading.Lock()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def queryStats():
+    with _statsLock:
+        return dict((name, dict(entry)) for name, entry in _stats.items())
+
+
+def resetQueryStats():
+    with _statsLock:
+        _stats.clear()
+
+
+def record(name, queries):
+    #adds one request's queries to the totals for its url name
+    times = [float(query['time']) for query in queries]
+    dbTime = sum(times)
+    with _statsLock:
+        entry = _stats.get(name)
+        if entry is None:
+            entry = _stats[name] = {'requests': 0, 'queries': 0, 'maxQueries': 0, 'dbTime': 0.0, 'maxDbTime': 0.0,
+                                    'slowestTime': 0.0, 'slowestSql': '', 'overBudget': 0}
+        entry['requests'] += 1
+        entry['queries'] += len(queries)
+        entry['maxQueries'] = max(entry['maxQueries'], len(queries))
+        entry['dbTime'] += dbTime
+        entry['maxDbTime'] = max(entry['maxDbTime'], dbTime)
+        if times and max(times) > entry['slowestTime']:
+            slowest = queries[times.index(max(times))]
+            entry['slowestTime'] = max(times)
+            entry['slowestSql'] = slowest['sql']
+
+    budget = getattr(settings, 'QUERY_BUDGETS', {}).get(name)
+    if budget is not None and len(queries) > budget:
+        with _statsLock:
+            _stats[name]['overBudget'] += 1
+        message = '%s ran %d queries, its budget is %d' % (name, len(queries), budget)
+        if getattr(settings, 'QUERY_BUDGET_ACTION', 'log') == 'raise':
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+class QueryBudgetMiddleware(object):
+
+    def process_request(self, request):
+        #the log isn't cleared, so anything else capturing queries around the request, like
+        #assertNumQueries, still sees them. This request's queries are the ones after start.
+        request._queryBudgetDebug = connection.force_debug_cursor
+        request._queryBudgetStart = len(connection.queries_log)
+        connection.force_debug_cursor = True
+
+    def process_response(self, request, response):
+        if not hasattr(request, '_queryBudgetDebug'):
+            return response
+        match = getattr(request, 'resolver_match', None)
+        name = match.url_name if match and match.url_name else 'unresolved'
+
+        if response.streaming:
+            response.streaming_content = self.recordWhenSent(request, name, response.streaming_content)
+        else:
+            self.finish(request, name)
+        return response
+
+    def recordWhenSent(self, request, name, content):
+        try:
+            for chunk in content:
+                yield chunk
+        finally:
+            self.finish(request, name)
+
+    def finish(self, request, name):
+        queries = list(connection.queries_log)[request._queryBudgetStart:]
+        connection.force_debug_cursor = request._queryBudgetDebug
+        record(name, queries)
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0027_auto_20160321_1904'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='appointment',
+            index_together=set([('userName', 'date'), ('doctor', 'date')]),
+        ),
+    ]
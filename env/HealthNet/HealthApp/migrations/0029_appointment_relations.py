@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0028_auto_20261018_1315'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='appointment',
+            index_together=set([]),
+        ),
+        migrations.RenameField(
+            model_name='appointment',
+            old_name='doctor',
+            new_name='doctorName',
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='doctor',
+            field=models.ForeignKey(to='HealthApp.Doctor', null=True),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='patient',
+            field=models.ForeignKey(to='HealthApp.Patient', null=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='appointment',
+            index_together=set([('patient', 'date'), ('doctor', 'date')]),
+        ),
+    ]
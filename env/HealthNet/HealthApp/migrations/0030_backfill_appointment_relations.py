@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, transaction
+
+"""
+Fills in the new patient and doctor foreign keys from the usernames that appointments used to
+store. The rows are converted a batch at a time, walking the table in primary key order, and
+each batch commits on its own. That keeps every transaction short so the table is never locked
+for the length of the whole conversion, and a migration that is interrupted can simply be run
+again since rows that already have a patient are skipped.
+"""
+
+BATCH_SIZE = 1000
+
+
+def backfillAppointments(apps, schema_editor):
+    Appointment = apps.get_model('HealthApp', 'Appointment')
+    Patient = apps.get_model('HealthApp', 'Patient')
+    Doctor = apps.get_model('HealthApp', 'Doctor')
+    db = schema_editor.connection.alias
+
+    lastId = 0
+    while True:
+        with transaction.atomic(using=db):
+            batch = list(Appointment.objects.using(db)
+                         .filter(pk__gt=lastId, patient__isnull=True)
+                         .order_by('pk')
+                         .values_list('pk', 'userName', 'doctorName')[:BATCH_SIZE])
+            if not batch:
+                return
+            lastId = batch[-1][0]
+
+            patientIds = dict(Patient.objects.using(db)
+                              .filter(user__username__in=set(row[1] for row in batch))
+                              .values_list('user__username', 'pk'))
+            doctorIds = dict(Doctor.objects.using(db)
+                             .filter(user__username__in=set(row[2] for row in batch))
+                             .values_list('user__username', 'pk'))
+
+            #rows that resolve to the same patient and doctor are updated with one statement
+            groups = {}
+            for pk, userName, doctorName in batch:
+                key = (patientIds.get(userName), doctorIds.get(doctorName))
+                if key != (None, None):
+                    groups.setdefault(key, []).append(pk)
+            for (patientId, doctorId), pks in groups.items():
+                Appointment.objects.using(db).filter(pk__in=pks).update(patient_id=patientId, doctor_id=doctorId)
+
+
+def restoreUsernames(apps, schema_editor):
+    Appointment = apps.get_model('HealthApp', 'Appointment')
+    db = schema_editor.connection.alias
+
+    lastId = 0
+    while True:
+        with transaction.atomic(using=db):
+            batch = list(Appointment.objects.using(db)
+                         .filter(pk__gt=lastId)
+                         .order_by('pk')
+                         .values_list('pk', 'patient__user__username', 'doctor__user__username')[:BATCH_SIZE])
+            if not batch:
+                return
+            lastId = batch[-1][0]
+            for pk, userName, doctorName in batch:
+                Appointment.objects.using(db).filter(pk=pk).update(userName=userName or '', doctorName=doctorName or '')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0029_appointment_relations'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfillAppointments, restoreUsernames, atomic=False),
+    ]
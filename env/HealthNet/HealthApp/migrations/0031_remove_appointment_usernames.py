@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0030_backfill_appointment_relations'),
+    ]
+
+    #the old columns get a default first so that reversing this migration can add them back
+    #to a table that already has rows in it
+    operations = [
+        migrations.AlterField(
+            model_name='appointment',
+            name='doctorName',
+            field=models.CharField(max_length=50, default=''),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='userName',
+            field=models.CharField(max_length=50, default=''),
+        ),
+        migrations.RemoveField(
+            model_name='appointment',
+            name='doctorName',
+        ),
+        migrations.RemoveField(
+            model_name='appointment',
+            name='userName',
+        ),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0031_remove_appointment_usernames'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorDay',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('day', models.DateField()),
+                ('bookedSlots', models.CharField(max_length=24, default='000000000000000000000000')),
+                ('doctor', models.ForeignKey(to='HealthApp.Doctor')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='doctorday',
+            unique_together=set([('doctor', 'day')]),
+        ),
+    ]
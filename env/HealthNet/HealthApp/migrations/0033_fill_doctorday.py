@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, transaction
+from django.utils import timezone
+
+"""
+Builds the booked slot bitmaps for appointments that were made before availability was tracked.
+Appointments are read a batch at a time in primary key order and each batch commits on its own.
+"""
+
+BATCH_SIZE = 1000
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+
+def fillDoctorDays(apps, schema_editor):
+    Appointment = apps.get_model('HealthApp', 'Appointment')
+    DoctorDay = apps.get_model('HealthApp', 'DoctorDay')
+    db = schema_editor.connection.alias
+
+    lastId = 0
+    while True:
+        with transaction.atomic(using=db):
+            batch = list(Appointment.objects.using(db)
+                         .filter(pk__gt=lastId, doctor__isnull=False)
+                         .order_by('pk')
+                         .values_list('pk', 'doctor_id', 'date')[:BATCH_SIZE])
+            if not batch:
+                return
+            lastId = batch[-1][0]
+
+            bitmaps = {}
+            for pk, doctorId, date in batch:
+                local = timezone.localtime(date) if timezone.is_aware(date) else date
+                key = (doctorId, local.date())
+                bitmaps[key] = bitmaps.get(key, 0) | (1 << ((local.hour * 60 + local.minute) // SLOT_MINUTES))
+
+            for (doctorId, day), bitmap in bitmaps.items():
+                doctorDay, created = DoctorDay.objects.using(db).get_or_create(doctor_id=doctorId, day=day)
+                doctorDay.bookedSlots = '%0*x' % (SLOTS_PER_DAY // 4, int(doctorDay.bookedSlots, 16) | bitmap)
+                doctorDay.save()
+
+
+def clearDoctorDays(apps, schema_editor):
+    DoctorDay = apps.get_model('HealthApp', 'DoctorDay')
+    DoctorDay.objects.using(schema_editor.connection.alias).all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0032_doctorday'),
+    ]
+
+    operations = [
+        migrations.RunPython(fillDoctorDays, clearDoctorDays, atomic=False),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import HealthApp.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0033_fill_doctorday'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalinfo',
+            name='conditions',
+            field=HealthApp.models.ConditionSetField(default=0),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, transaction
+
+"""
+Packs the old one-column-per-condition booleans into the conditions bitfield. The column list
+is frozen here, in bit order, rather than read from conditions.py so this migration keeps
+doing the same thing when conditions are added to the registry later.
+"""
+
+BATCH_SIZE = 1000
+
+CONDITION_COLUMNS = (
+    'allergies', 'anemia', 'arthritis', 'chickenpox', 'coxsackie', 'diphtheria', 'epilepsy',
+    'frequentColds', 'germanMeasles', 'highBloodPressure', 'influenza', 'kidneyDisease',
+    'measles', 'migraines', 'mumps', 'obesity', 'pneumonia', 'polio', 'rheumaticFever',
+    'scarlatina', 'scarletFever', 'strokes', 'syphilis', 'tonsillitis', 'tuberculosis',
+    'whoopingCough',
+)
+
+
+def packConditions(apps, schema_editor):
+    MedicalInfo = apps.get_model('HealthApp', 'MedicalInfo')
+    db = schema_editor.connection.alias
+
+    lastId = 0
+    while True:
+        with transaction.atomic(using=db):
+            batch = list(MedicalInfo.objects.using(db)
+                         .filter(pk__gt=lastId)
+                         .order_by('pk')
+                         .values_list('pk', *CONDITION_COLUMNS)[:BATCH_SIZE])
+            if not batch:
+                return
+            lastId = batch[-1][0]
+
+            #rows with the same set of conditions are updated together
+            groups = {}
+            for row in batch:
+                bitmask = 0
+                for bit, value in enumerate(row[1:]):
+                    if value:
+                        bitmask |= 1 << bit
+                groups.setdefault(bitmask, []).append(row[0])
+            for bitmask, pks in groups.items():
+                MedicalInfo.objects.using(db).filter(pk__in=pks).update(conditions=bitmask)
+
+
+def unpackConditions(apps, schema_editor):
+    MedicalInfo = apps.get_model('HealthApp', 'MedicalInfo')
+    db = schema_editor.connection.alias
+
+    lastId = 0
+    while True:
+        with transaction.atomic(using=db):
+            batch = list(MedicalInfo.objects.using(db)
+                         .filter(pk__gt=lastId)
+                         .order_by('pk')
+                         .values_list('pk', 'conditions')[:BATCH_SIZE])
+            if not batch:
+                return
+            lastId = batch[-1][0]
+            for pk, bitmask in batch:
+                values = dict((column, bool((bitmask >> bit) & 1)) for bit, column in enumerate(CONDITION_COLUMNS))
+                MedicalInfo.objects.using(db).filter(pk=pk).update(**values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0034_medicalinfo_conditions'),
+    ]
+
+    operations = [
+        migrations.RunPython(packConditions, unpackConditions, atomic=False),
+    ]
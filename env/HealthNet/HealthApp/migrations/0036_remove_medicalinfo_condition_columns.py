@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0035_pack_medicalinfo_conditions'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='allergies',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='anemia',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='arthritis',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='chickenpox',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='coxsackie',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='diphtheria',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='epilepsy',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='frequentColds',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='germanMeasles',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='highBloodPressure',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='influenza',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='kidneyDisease',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='measles',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='migraines',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='mumps',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='obesity',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='pneumonia',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='polio',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='rheumaticFever',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='scarlatina',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='scarletFever',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='strokes',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='syphilis',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='tonsillitis',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='tuberculosis',
+        ),
+        migrations.RemoveField(
+            model_name='medicalinfo',
+            name='whoopingCough',
+        ),
+    ]
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0036_remove_medicalinfo_condition_columns'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='Z_adamantane_antivirals',
+        ),
+        migrations.DeleteModel(
+            name='Z_adrenal_cortical_steroids',
+        ),
+        migrations.DeleteModel(
+            name='Z_adrenal_corticosteroid_inhibitors',
+        ),
+        migrations.DeleteModel(
+            name='Z_adrenergic_bronchodilators',
+        ),
+        migrations.DeleteModel(
+            name='Z_aldosterone_receptor_agents',
+        ),
+        migrations.DeleteModel(
+            name='Z_alkylating_agents',
+        ),
+        migrations.DeleteModel(
+            name='Z_alphaglucosidase_inhibitors',
+        ),
+        migrations.DeleteModel(
+            name='Z_amebicides',
+        ),
+        migrations.DeleteModel(
+            name='Z_aminoglycosides',
+        ),
+        migrations.DeleteModel(
+            name='Z_aminopenicillins',
+        ),
+        migrations.DeleteModel(
+            name='Z_amylin_analogs',
+        ),
+        migrations.DeleteModel(
+            name='Z_anabolic_steroids',
+        ),
+        migrations.DeleteModel(
+            name='Z_analgesics',
+        ),
+        migrations.DeleteModel(
+            name='Z_angiotensin_converting_enzyme_inhibitors',
+        ),
+        migrations.DeleteModel(
+            name='Z_anitmigraine',
+        ),
+        migrations.DeleteModel(
+            name='Z_anorexiants',
+        ),
+        migrations.DeleteModel(
+            name='Z_anthelmintics',
+        ),
+        migrations.DeleteModel(
+            name='Z_antiandrogens',
+        ),
+        migrations.DeleteModel(
+            name='Z_antianginal',
+        ),
+        migrations.DeleteModel(
+            name='Z_anticoagulants',
+        ),
+        migrations.DeleteModel(
+            name='Z_anticonvulsants',
+        ),
+        migrations.DeleteModel(
+            name='Z_antidepressants',
+        ),
+        migrations.DeleteModel(
+            name='Z_antidiabetic',
+        ),
+        migrations.DeleteModel(
+            name='Z_antidiarrheals',
+        ),
+        migrations.DeleteModel(
+            name='Z_antidiuretics',
+        ),
+        migrations.DeleteModel(
+            name='Z_antidotes',
+        ),
+        migrations.DeleteModel(
+            name='Z_antifungals',
+        ),
+        migrations.DeleteModel(
+            name='Z_antigonadotropic',
+        ),
+        migrations.DeleteModel(
+            name='Z_antigout',
+        ),
+        migrations.DeleteModel(
+            name='Z_antihistamines',
+        ),
+        migrations.DeleteModel(
+            name='Z_antimalarial',
+        ),
+        migrations.DeleteModel(
+            name='Z_antimetabolites',
+        ),
+        migrations.DeleteModel(
+            name='Z_antiparkinson_agents',
+        ),
+        migrations.DeleteModel(
+            name='Z_antipsoriatics',
+        ),
+        migrations.DeleteModel(
+            name='Z_antirheumatics',
+        ),
+        migrations.DeleteModel(
+            name='Z_antiseptics',
+        ),
+        migrations.DeleteModel(
+            name='Z_antithyroid',
+        ),
+        migrations.DeleteModel(
+            name='Z_barbiturates',
+        ),
+        migrations.DeleteModel(
+            name='Z_benzodiazepines',
+        ),
+        migrations.DeleteModel(
+            name='Z_bisphosphonates',
+        ),
+        migrations.DeleteModel(
+            name='Z_calcineurin_inhibitors',
+        ),
+        migrations.DeleteModel(
+            name='Z_calcitonin',
+        ),
+        migrations.DeleteModel(
+            name='Z_carbapenems',
+        ),
+        migrations.DeleteModel(
+            name='Z_cardiac_stressing_agents',
+        ),
+        migrations.DeleteModel(
+            name='Z_catecholamines',
+        ),
+        migrations.DeleteModel(
+            name='Z_cerumenolytics',
+        ),
+        migrations.DeleteModel(
+            name='Z_chelating_agents',
+        ),
+        migrations.DeleteModel(
+            name='Z_cholinergic_muscle_stimulants',
+        ),
+        migrations.DeleteModel(
+            name='Z_cholinesterase_inhibitors',
+        ),
+        migrations.DeleteModel(
+            name='Z_contraceptives',
+        ),
+        migrations.DeleteModel(
+            name='Z_decongestants',
+        ),
+        migrations.DeleteModel(
+            name='Z_digestive_enzymes',
+        ),
+        migrations.DeleteModel(
+            name='Z_echinocandins',
+        ),
+        migrations.DeleteModel(
+            name='Z_estrogens',
+        ),
+        migrations.DeleteModel(
+            name='Z_expectorants',
+        ),
+        migrations.DeleteModel(
+            name='Z_fibric_acid_derivatives',
+        ),
+        migrations.DeleteModel(
+            name='Z_gallstone_solubilizing_agents',
+        ),
+        migrations.DeleteModel(
+            name='Z_general_anesthetics',
+        ),
+        migrations.DeleteModel(
+            name='Z_gi_stimulants',
+        ),
+        migrations.DeleteModel(
+            name='Z_growth_hormones',
+        ),
+        migrations.DeleteModel(
+            name='Z_impotence_agents',
+        ),
+        migrations.DeleteModel(
+            name='Z_inhaled_antiinfectives',
+        ),
+        migrations.DeleteModel(
+            name='Z_inhaled_corticosteroids',
+        ),
+        migrations.DeleteModel(
+            name='Z_inotropic_agents',
+        ),
+        migrations.DeleteModel(
+            name='Z_interleukins',
+        ),
+        migrations.DeleteModel(
+            name='Z_ketolides',
+        ),
+        migrations.DeleteModel(
+            name='Z_laxatives',
+        ),
+        migrations.DeleteModel(
+            name='Z_leprostatics',
+        ),
+        migrations.DeleteModel(
+            name='Z_lincomycin_derivatives',
+        ),
+        migrations.DeleteModel(
+            name='Z_loop_diuretics',
+        ),
+        migrations.DeleteModel(
+            name='Z_lung_surfactants',
+        ),
+        migrations.DeleteModel(
+            name='Z_lysosomal_enzymes',
+        ),
+        migrations.DeleteModel(
+            name='Z_macrolides',
+        ),
+        migrations.DeleteModel(
+            name='Z_methylxanthines',
+        ),
+        migrations.DeleteModel(
+            name='Z_mitotic_inhibitors',
+        ),
+        migrations.DeleteModel(
+            name='Z_mydriatics',
+        ),
+        migrations.DeleteModel(
+            name='Z_nasal_steroids',
+        ),
+        migrations.DeleteModel(
+            name='Z_phosphate_binders',
+        ),
+        migrations.DeleteModel(
+            name='Z_probiotics',
+        ),
+        migrations.DeleteModel(
+            name='Z_progestins',
+        ),
+        migrations.DeleteModel(
+            name='Z_purine_nucleosides',
+        ),
+        migrations.DeleteModel(
+            name='Z_quinolones',
+        ),
+        migrations.DeleteModel(
+            name='Z_sclerosing_agents',
+        ),
+        migrations.DeleteModel(
+            name='Z_thrombolytics',
+        ),
+        migrations.DeleteModel(
+            name='Z_uterotonic_agents',
+        ),
+        migrations.DeleteModel(
+            name='Z_vasodilators',
+        ),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, transaction
+
+"""
+Gives every patient without a profile an empty one, so the staff roster can order and page on
+the profile's name columns with a plain join instead of sorting on substituted empty names.
+Patients are read a batch at a time in primary key order and each batch commits on its own,
+so a run that stops part way can simply be run again.
+"""
+
+BATCH_SIZE = 1000
+
+
+def fillProfiles(apps, schema_editor):
+    Patient = apps.get_model('HealthApp', 'Patient')
+    ProfileInfo = apps.get_model('HealthApp', 'ProfileInfo')
+    db = schema_editor.connection.alias
+
+    lastId = 0
+    while True:
+        with transaction.atomic(using=db):
+            batch = list(Patient.objects.using(db)
+                         .filter(pk__gt=lastId, profileInfo__isnull=True)
+                         .order_by('pk')
+                         .values_list('pk', flat=True)[:BATCH_SIZE])
+            if not batch:
+                return
+            lastId = batch[-1]
+            for patientId in batch:
+                profile = ProfileInfo.objects.using(db).create(firstName='', lastName='', address='', zipcode='', phoneNumber='', email='')
+                Patient.objects.using(db).filter(pk=patientId).update(profileInfo=profile)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0037_remove_medication_category_models'),
+    ]
+
+    operations = [
+        migrations.RunPython(fillProfiles, migrations.RunPython.noop, atomic=False),
+    ]
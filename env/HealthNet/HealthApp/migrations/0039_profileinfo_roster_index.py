@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0038_fill_missing_profiles'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='profileinfo',
+            index_together=set([('lastName', 'firstName', 'id')]),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management import call_command
+from django.db import migrations
+
+"""
+Makes the table behind the database cache in settings.CACHES, which every process shares, so
+migrating is all a new install needs. createcachetable skips tables that already exist and
+does nothing when no database cache is configured.
+"""
+
+
+def createCacheTable(apps, schema_editor):
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0039_profileinfo_roster_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(createCacheTable, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0040_cache_table'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MedTestResult',
+            fields=[
+                ('test', models.OneToOneField(primary_key=True, related_name='resultBody', serialize=False, to='HealthApp.MedTest')),
+                ('body', models.BinaryField()),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('compressedSize', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, transaction
+import zlib
+
+"""
+Moves every MedTest result into MedTestResult, compressed. The compression is written out here
+rather than calling the model's setText so this migration keeps doing the same thing if that
+changes later.
+
+Each batch is copied in its own transaction, so a run that is interrupted keeps the batches it
+finished. Tests that already have a MedTestResult are skipped, so running it again carries on
+where the last run stopped.
+"""
+
+BATCH_SIZE = 500
+
+
+def compressResults(apps, schema_editor):
+    MedTest = apps.get_model('HealthApp', 'MedTest')
+    MedTestResult = apps.get_model('HealthApp', 'MedTestResult')
+    db = schema_editor.connection.alias
+
+    lastId = 0
+    while True:
+        with transaction.atomic(using=db):
+            batch = list(MedTest.objects.using(db)
+                         .filter(pk__gt=lastId)
+                         .order_by('pk')
+                         .values_list('pk', 'result')[:BATCH_SIZE])
+            if not batch:
+                return
+            lastId = batch[-1][0]
+
+            copied = set(MedTestResult.objects.using(db)
+                         .filter(pk__in=[pk for pk, result in batch])
+                         .values_list('pk', flat=True))
+            rows = []
+            for pk, result in batch:
+                if pk in copied:
+                    continue
+                raw = (result or '').encode('utf-8')
+                body = zlib.compress(raw, 6)
+                rows.append(MedTestResult(test_id=pk, body=body, size=len(raw), compressedSize=len(body)))
+            MedTestResult.objects.using(db).bulk_create(rows)
+
+
+def decompressResults(apps, schema_editor):
+    MedTest = apps.get_model('HealthApp', 'MedTest')
+    MedTestResult = apps.get_model('HealthApp', 'MedTestResult')
+    db = schema_editor.connection.alias
+
+    lastId = 0
+    while True:
+        with transaction.atomic(using=db):
+            batch = list(MedTestResult.objects.using(db)
+                         .filter(pk__gt=lastId)
+                         .order_by('pk')
+                         .values_list('pk', 'body')[:BATCH_SIZE])
+            if not batch:
+                return
+            lastId = batch[-1][0]
+            for pk, body in batch:
+                MedTest.objects.using(db).filter(pk=pk).update(result=zlib.decompress(bytes(body)).decode('utf-8'))
+            MedTestResult.objects.using(db).filter(pk__in=[pk for pk, body in batch]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0041_medtestresult'),
+    ]
+
+    operations = [
+        migrations.RunPython(compressResults, decompressResults, atomic=False),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0042_compress_medtest_results'),
+    ]
+
+    #the old column gets a default first so that reversing this migration can add it back
+    #to a table that already has rows in it
+    operations = [
+        migrations.AlterField(
+            model_name='medtest',
+            name='result',
+            field=models.TextField(default=''),
+        ),
+        migrations.RemoveField(
+            model_name='medtest',
+            name='result',
+        ),
+    ]
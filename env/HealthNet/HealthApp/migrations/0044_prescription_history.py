@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0043_remove_medtest_result'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescription',
+            name='patient',
+            field=models.ForeignKey(null=True, related_name='prescriptionHistory', to='HealthApp.Patient'),
+        ),
+        migrations.AddField(
+            model_name='prescription',
+            name='prescribedBy',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='HealthApp.Doctor'),
+        ),
+        migrations.AddField(
+            model_name='prescription',
+            name='startDate',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='prescription',
+            name='stopDate',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='prescription',
+            name='active',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='prescription',
+            index_together=set([('patient', 'active')]),
+        ),
+        migrations.CreateModel(
+            name='CurrentMedication',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('medicationCategory', models.CharField(max_length=50)),
+                ('medication', models.CharField(max_length=50)),
+                ('dosage', models.CharField(max_length=50)),
+                ('frequency', models.CharField(max_length=50)),
+                ('directions', models.TextField(max_length=50)),
+                ('startDate', models.DateTimeField()),
+                ('patient', models.ForeignKey(related_name='currentMedications', to='HealthApp.Patient')),
+                ('prescription', models.OneToOneField(related_name='current', to='HealthApp.Prescription')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='currentmedication',
+            unique_together=set([('patient', 'medication')]),
+        ),
+    ]
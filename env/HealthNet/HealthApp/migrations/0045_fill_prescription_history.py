@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, transaction
+from django.utils import timezone
+
+"""
+Turns each patient's single Patient.prescriptions link into the first entry of their
+prescription history, active and started now since the old rows have no dates, with a
+CurrentMedication copy. A prescription that several patients pointed at is given to the first
+of them and copied for the rest, since history entries belong to one patient.
+
+Prescriptions no patient pointed at can't be given a history, so they are marked inactive
+rather than left looking current. Each batch is its own transaction and patients that already
+have a history are skipped, so an interrupted run can be started again.
+"""
+
+BATCH_SIZE = 1000
+
+PRESCRIPTION_FIELDS = ('medicationCategory', 'medication', 'dosage', 'frequency', 'directions', 'comments')
+CURRENT_FIELDS = ('medicationCategory', 'medication', 'dosage', 'frequency', 'directions')
+
+
+def fillHistory(apps, schema_editor):
+    Patient = apps.get_model('HealthApp', 'Patient')
+    Prescription = apps.get_model('HealthApp', 'Prescription')
+    CurrentMedication = apps.get_model('HealthApp', 'CurrentMedication')
+    db = schema_editor.connection.alias
+    now = timezone.now()
+
+    lastId = 0
+    while True:
+        with transaction.atomic(using=db):
+            batch = list(Patient.objects.using(db)
+                         .filter(pk__gt=lastId, prescriptions__isnull=False)
+                         .order_by('pk')
+                         .values_list('pk', 'prescriptions_id')[:BATCH_SIZE])
+            if not batch:
+                return
+            lastId = batch[-1][0]
+
+            filled = set(Prescription.objects.using(db)
+                         .filter(patient_id__in=[patientId for patientId, prescriptionId in batch])
+                         .values_list('patient_id', flat=True))
+            originals = Prescription.objects.using(db).in_bulk([prescriptionId for patientId, prescriptionId in batch])
+            current = []
+            for patientId, prescriptionId in batch:
+                if patientId in filled:
+                    continue
+                prescription = originals[prescriptionId]
+                if prescription.patient_id is None:
+                    prescription.patient_id = patientId
+                    prescription.startDate = now
+                    prescription.active = True
+                    prescription.save()
+                else:
+                    prescription = Prescription.objects.using(db).create(
+                        patient_id=patientId, startDate=now, active=True,
+                        **dict((field, getattr(prescription, field)) for field in PRESCRIPTION_FIELDS))
+                current.append(CurrentMedication(patient_id=patientId, prescription_id=prescription.pk, startDate=now,
+                                                 **dict((field, getattr(prescription, field)) for field in CURRENT_FIELDS)))
+            CurrentMedication.objects.using(db).bulk_create(current)
+
+
+def retireUnlinked(apps, schema_editor):
+    Prescription = apps.get_model('HealthApp', 'Prescription')
+    db = schema_editor.connection.alias
+
+    lastId = 0
+    while True:
+        with transaction.atomic(using=db):
+            batch = list(Prescription.objects.using(db)
+                         .filter(pk__gt=lastId, patient__isnull=True)
+                         .order_by('pk')
+                         .values_list('pk', flat=True)[:BATCH_SIZE])
+            if not batch:
+                return
+            lastId = batch[-1]
+            Prescription.objects.using(db).filter(pk__in=batch).update(active=False)
+
+
+def restoreLinks(apps, schema_editor):
+    #points each patient back at their newest active prescription
+    Patient = apps.get_model('HealthApp', 'Patient')
+    CurrentMedication = apps.get_model('HealthApp', 'CurrentMedication')
+    db = schema_editor.connection.alias
+
+    lastId = 0
+    while True:
+        with transaction.atomic(using=db):
+            batch = list(CurrentMedication.objects.using(db)
+                         .filter(pk__gt=lastId)
+                         .order_by('pk')
+                         .values_list('pk', 'patient_id', 'prescription_id')[:BATCH_SIZE])
+            if not batch:
+                return
+            lastId = batch[-1][0]
+            for pk, patientId, prescriptionId in batch:
+                Patient.objects.using(db).filter(pk=patientId).update(prescriptions=prescriptionId)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0044_prescription_history'),
+    ]
+
+    operations = [
+        migrations.RunPython(fillHistory, restoreLinks, atomic=False),
+        migrations.RunPython(retireUnlinked, migrations.RunPython.noop, atomic=False),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0045_fill_prescription_history'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='patient',
+            name='prescriptions',
+        ),
+    ]
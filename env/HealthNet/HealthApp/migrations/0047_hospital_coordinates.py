@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+"""
+Adds coordinates to hospitals and fills them in for the Rochester hospitals that the
+registration page used to mark on its map, matched by name. Any other hospital is left without
+coordinates until they are entered in the admin.
+"""
+
+#the marker positions from the old gMap.html
+KNOWN_HOSPITALS = {
+    'highland general': (43.135475, -77.606110),
+    'highland general hospital': (43.135475, -77.606110),
+    'highland family': (43.142106, -77.599179),
+    'highland family hospital': (43.142106, -77.599179),
+    'rochester general': (43.153636, -77.560190),
+    'rochester general hospital': (43.153636, -77.560190),
+    'unity': (43.193421, -77.705872),
+    'unity hospital': (43.193421, -77.705872),
+}
+
+
+def fillCoordinates(apps, schema_editor):
+    Hospital = apps.get_model('HealthApp', 'Hospital')
+    db = schema_editor.connection.alias
+    for hospital in Hospital.objects.using(db).all():
+        coordinates = KNOWN_HOSPITALS.get(hospital.name.strip().lower())
+        if coordinates is not None:
+            hospital.latitude, hospital.longitude = coordinates
+            hospital.save(using=db, update_fields=['latitude', 'longitude'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0046_remove_patient_prescriptions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hospital',
+            name='latitude',
+            field=models.FloatField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='hospital',
+            name='longitude',
+            field=models.FloatField(null=True, blank=True),
+        ),
+        migrations.RunPython(fillCoordinates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0047_hospital_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentReminder',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('appointmentDate', models.DateTimeField()),
+                ('status', models.CharField(max_length=10, default='pending', choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed'), ('skipped', 'Skipped')])),
+                ('claimToken', models.CharField(max_length=32, blank=True)),
+                ('claimedAt', models.DateTimeField(null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('sentAt', models.DateTimeField(null=True)),
+                ('error', models.CharField(max_length=200, blank=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='date',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AddField(
+            model_name='appointmentreminder',
+            name='appointment',
+            field=models.ForeignKey(related_name='reminders', to='HealthApp.Appointment'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='appointmentreminder',
+            unique_together=set([('appointment', 'appointmentDate')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='appointmentreminder',
+            index_together=set([('claimToken', 'status')]),
+        ),
+    ]
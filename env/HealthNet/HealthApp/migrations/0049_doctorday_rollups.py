@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0048_appointmentreminder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctorday',
+            name='appointmentCount',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='doctorday',
+            name='bookedMinutes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='doctorday',
+            name='firstSlot',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='doctorday',
+            name='lastSlot',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+    ]
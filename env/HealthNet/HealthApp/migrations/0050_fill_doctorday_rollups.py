@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, transaction
+from django.utils import timezone
+
+"""
+Fills in the appointment count, first and last slot and booked minutes of every doctor's day
+from the appointments already booked. Appointments are read a batch at a time in primary key
+order and counted per doctor and day, then the days are written a batch at a time with each
+batch committing on its own. Any slot bit an older appointment is missing is set as well.
+"""
+
+BATCH_SIZE = 1000
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+
+def fillRollups(apps, schema_editor):
+    Appointment = apps.get_model('HealthApp', 'Appointment')
+    DoctorDay = apps.get_model('HealthApp', 'DoctorDay')
+    db = schema_editor.connection.alias
+
+    #(doctor id, day) to [appointment count, bitmap]
+    days = {}
+    lastId = 0
+    while True:
+        batch = list(Appointment.objects.using(db)
+                     .filter(pk__gt=lastId, doctor__isnull=False)
+                     .order_by('pk')
+                     .values_list('pk', 'doctor_id', 'date')[:BATCH_SIZE])
+        if not batch:
+            break
+        lastId = batch[-1][0]
+        for pk, doctorId, date in batch:
+            local = timezone.localtime(date) if timezone.is_aware(date) else date
+            day = days.setdefault((doctorId, local.date()), [0, 0])
+            day[0] += 1
+            day[1] |= 1 << ((local.hour * 60 + local.minute) // SLOT_MINUTES)
+
+    keys = sorted(days)
+    for start in range(0, len(keys), BATCH_SIZE):
+        with transaction.atomic(using=db):
+            for doctorId, day in keys[start:start + BATCH_SIZE]:
+                count, bitmap = days[(doctorId, day)]
+                doctorDay, created = DoctorDay.objects.using(db).get_or_create(doctor_id=doctorId, day=day)
+                bitmap |= int(doctorDay.bookedSlots, 16)
+                doctorDay.bookedSlots = '%0*x' % (SLOTS_PER_DAY // 4, bitmap)
+                doctorDay.appointmentCount = count
+                doctorDay.firstSlot = (bitmap & -bitmap).bit_length() - 1
+                doctorDay.lastSlot = bitmap.bit_length() - 1
+                doctorDay.bookedMinutes = bin(bitmap).count('1') * SLOT_MINUTES
+                doctorDay.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HealthApp', '0049_doctorday_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(fillRollups, migrations.RunPython.noop, atomic=False),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User, AbstractBaseUser
+from django.utils import timezone
 from abc import ABCMeta, abstractclassmethod
+from .conditions import maskFor, conditionsIn
+import zlib
 """
 The models.py is essentially where objects are declared. Currently, It holds the
 PatientProfile object and the logItem object. These objects are most always referenced
@@ -15,13 +18,56 @@ MAX_LENGTH = 50
 
 
 class Appointment(models.Model):
-    doctor = models.CharField(max_length=MAX_LENGTH)
-    userName = models.CharField(max_length=MAX_LENGTH)
-    date = models.DateTimeField()
+    #Doctor and Patient are declared further down the file so they are referenced by name
+    doctor = models.ForeignKey('Doctor', null=True)
+    patient = models.ForeignKey('Patient', null=True)
+    #indexed on its own as well for the reminder job, which walks every appointment in a time range
+    date = models.DateTimeField(db_index=True)
     description = models.CharField(max_length="200")
 
+    class Meta:
+        #appointments are always looked up for one patient or one doctor inside a date window,
+        #so these let those lookups do a range scan instead of reading the whole table
+        index_together = [
+            ('patient', 'date'),
+            ('doctor', 'date'),
+        ]
+
+    def __str__(self):
+        return str(self.patient)
+
+
+class AppointmentReminder(models.Model):
+    #the reminder email for an appointment at one particular time, written by reminders.py. A
+    #moved appointment gets a new reminder for its new time, and the row for a time stops the
+    #same reminder being sent twice however often sendreminders runs.
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    SKIPPED = 'skipped'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+        (SKIPPED, 'Skipped'),
+    )
+
+    appointment = models.ForeignKey(Appointment, related_name='reminders')
+    appointmentDate = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    #which run is sending it, and since when
+    claimToken = models.CharField(max_length=32, blank=True)
+    claimedAt = models.DateTimeField(null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    sentAt = models.DateTimeField(null=True)
+    error = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        unique_together = ('appointment', 'appointmentDate')
+        index_together = [('claimToken', 'status')]
+
     def __str__(self):
-        return self.userName
+        return '%s at %s: %s' % (self.appointment_id, self.appointmentDate, self.status)
 
 
 class UserInfo(models.Model):
@@ -47,41 +93,56 @@ class ProfileInfo(models.Model):
     eName = models.CharField(max_length=MAX_LENGTH, default='none')
     ePhoneNumber = models.CharField(max_length=MAX_LENGTH, default='none')
 
+    class Meta:
+        #the order the staff roster pages through, see roster.py
+        index_together = [('lastName', 'firstName', 'id')]
+
     def __str__(self):
         return self.firstName + " " + self.lastName
 
 
+class HasAnyCondition(models.Lookup):
+    #medicalInfo__conditions__hasany=mask matches rows that have at least one of the conditions in mask
+    lookup_name = 'hasany'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhsParams = self.process_lhs(compiler, connection)
+        rhs, rhsParams = self.process_rhs(compiler, connection)
+        return '(%s & %s) != 0' % (lhs, rhs), lhsParams + rhsParams
+
+
+class HasAllConditions(models.Lookup):
+    #medicalInfo__conditions__hasall=mask matches rows that have every condition in mask
+    lookup_name = 'hasall'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhsParams = self.process_lhs(compiler, connection)
+        rhs, rhsParams = self.process_rhs(compiler, connection)
+        return '(%s & %s) = %s' % (lhs, rhs, rhs), lhsParams + rhsParams + rhsParams
+
+
+class ConditionSetField(models.BigIntegerField):
+    #a bitfield of the conditions in conditions.CONDITIONS
+    pass
+
+ConditionSetField.register_lookup(HasAnyCondition)
+ConditionSetField.register_lookup(HasAllConditions)
+
+
 class MedicalInfo(models.Model):
-    #TODO - add cancer
-    #TODO - add diabetes
-    allergies = models.BooleanField(default=False)
-    anemia = models.BooleanField(default=False)
-    arthritis = models.BooleanField(default=False)
-    chickenpox = models.BooleanField(default=False)
-    coxsackie = models.BooleanField(default=False)
-    diphtheria = models.BooleanField(default=False)
-    epilepsy = models.BooleanField(default=False)
-    frequentColds = models.BooleanField(default=False)
-    germanMeasles = models.BooleanField(default=False)
-    highBloodPressure = models.BooleanField(default=False)
-    influenza = models.BooleanField(default=False)
-    kidneyDisease = models.BooleanField(default=False)
-    measles = models.BooleanField(default=False)
-    migraines = models.BooleanField(default=False)
-    mumps = models.BooleanField(default=False)
-    obesity = models.BooleanField(default=False)
-    pneumonia = models.BooleanField(default=False)
-    polio = models.BooleanField(default=False)
-    rheumaticFever = models.BooleanField(default=False)
-    scarlatina = models.BooleanField(default=False)
-    scarletFever = models.BooleanField(default=False)
-    strokes = models.BooleanField(default=False)
-    syphilis = models.BooleanField(default=False)
-    tonsillitis = models.BooleanField(default=False)
-    tuberculosis = models.BooleanField(default=False)
-    whoopingCough = models.BooleanField(default=False)
+    #each bit is one condition from the registry in conditions.py
+    conditions = ConditionSetField(default=0)
     otherText = models.CharField(max_length=MAX_LENGTH, null=True)
 
+    def hasCondition(self, key):
+        return bool(self.conditions & maskFor([key]))
+
+    def getConditions(self):
+        return conditionsIn(self.conditions)
+
+    def setConditions(self, keys):
+        self.conditions = maskFor(keys)
+
 
 class Doctor(models.Model):
     user = models.OneToOneField(User)
@@ -100,18 +161,53 @@ class Nurse(models.Model):
 
 class Hospital(models.Model):
     name = models.CharField(max_length=MAX_LENGTH)
+    #where the hospital is, for suggesting the nearest ones to a patient's zipcode. Hospitals
+    #without coordinates are never suggested.
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
 
     def __str__(self):
         return self.name
 
 
 class Prescription(models.Model):
+    #one entry in a patient's prescription history. Entries are only ever added: changing a
+    #prescription stops the old entry and starts a new one, so the history keeps everything
+    #the patient has been on. They are written through prescriptions.py.
+    patient = models.ForeignKey('Patient', null=True, related_name='prescriptionHistory')
+    prescribedBy = models.ForeignKey(Doctor, null=True, on_delete=models.SET_NULL)
     medicationCategory = models.CharField(max_length=MAX_LENGTH)
     medication = models.CharField(max_length=MAX_LENGTH)
     dosage = models.CharField(max_length=MAX_LENGTH)
     frequency = models.CharField(max_length=MAX_LENGTH)
     directions = models.TextField(max_length=MAX_LENGTH)
     comments = models.TextField(max_length=MAX_LENGTH)
+    startDate = models.DateTimeField(default=timezone.now)
+    stopDate = models.DateTimeField(null=True, blank=True)
+    active = models.BooleanField(default=True)
+
+    class Meta:
+        index_together = [('patient', 'active')]
+
+    def __str__(self):
+        return self.medication
+
+
+class CurrentMedication(models.Model):
+    #a copy of each active Prescription, one row per patient and medication, kept up to date in
+    #the same transaction that changes the history. A patient's current medications are a read
+    #of this table by patient no matter how long their history is.
+    patient = models.ForeignKey('Patient', related_name='currentMedications')
+    prescription = models.OneToOneField(Prescription, related_name='current')
+    medicationCategory = models.CharField(max_length=MAX_LENGTH)
+    medication = models.CharField(max_length=MAX_LENGTH)
+    dosage = models.CharField(max_length=MAX_LENGTH)
+    frequency = models.CharField(max_length=MAX_LENGTH)
+    directions = models.TextField(max_length=MAX_LENGTH)
+    startDate = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('patient', 'medication')
 
     def __str__(self):
         return self.medication
@@ -122,18 +218,69 @@ class MedTest(models.Model):
     doctor = models.ForeignKey(Doctor)
     released = models.BooleanField(default = False)
     dateIssued = models.DateField()
-    result = models.TextField()
 
     def __str__(self):
         return self.name
 
+    #the result body lives compressed in MedTestResult so listing tests never reads it. It is
+    #only fetched when one of these is called for a single test.
+    def getResult(self):
+        try:
+            return self.resultBody.getText()
+        except MedTestResult.DoesNotExist:
+            return ''
+
+    def setResult(self, text):
+        body = MedTestResult(test=self)
+        body.setText(text)
+        body.save()
+        self.resultBody = body
+
+
+#the compressed body is decompressed this many bytes at a time when it is streamed
+RESULT_CHUNK_SIZE = 64 * 1024
+
+
+class MedTestResult(models.Model):
+    #the result of one test, zlib compressed. size is the length of the uncompressed utf-8 text
+    #so a download can say how big it is before anything is decompressed.
+    test = models.OneToOneField(MedTest, primary_key=True, related_name='resultBody')
+    body = models.BinaryField()
+    size = models.PositiveIntegerField(default=0)
+    compressedSize = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return "%s (%d bytes)" % (self.test_id, self.size)
+
+    def setText(self, text):
+        raw = (text or '').encode('utf-8')
+        self.body = zlib.compress(raw, 6)
+        self.size = len(raw)
+        self.compressedSize = len(self.body)
+
+    def getText(self):
+        return zlib.decompress(bytes(self.body)).decode('utf-8')
+
+    def iterBytes(self, chunkSize=RESULT_CHUNK_SIZE):
+        #yields the uncompressed utf-8 a piece at a time, so even a very large result is never
+        #held in memory whole
+        body = memoryview(bytes(self.body))
+        decompressor = zlib.decompressobj()
+        for offset in range(0, len(body), chunkSize):
+            data = decompressor.decompress(body[offset:offset + chunkSize], chunkSize)
+            while data:
+                yield data
+                data = decompressor.decompress(decompressor.unconsumed_tail, chunkSize)
+        data = decompressor.flush()
+        if data:
+            yield data
+
 
 class Patient(models.Model):
     user = models.OneToOneField(User)
     userInfo = models.OneToOneField(UserInfo, null=True)
     profileInfo = models.OneToOneField(ProfileInfo, null=True)
     medicalInfo = models.OneToOneField(MedicalInfo, null=True)
-    prescriptions = models.ForeignKey(Prescription, null=True)
     doctor = models.ForeignKey(Doctor, null=True)
     hospital = models.ForeignKey(Hospital, null=True)
 
@@ -145,470 +292,42 @@ class Patient(models.Model):
         return self.userInfo.firstName + " " + self.userInfo.lastName
 
 
-#class for medication categories that each hold a list of medications
-class Z_adamantane_antivirals(models.Model):
-    SPECIFICS = (('amantadine', 'amantadine'),('rimantadine', 'rimantadine'))
-
-class Z_adrenal_cortical_steroids(models.Model):
-    SPECIFICS = (('corticotropin', 'corticotropin'), ('corticorelin', 'corticorelin'), ('cosyntropin', 'corsyntropin'),
-
-                 ('triamcinolone', 'triamcinolone'), ('methylprednisolone', 'methylprednisolone'), ('betamethasone', 'betamethasone'),
-                 ('prednisone', 'prednisone'), ('hydrocortisone', 'hydrocortisone'), ('budesonide', 'budesonide'),
-                 ('prednisolone', 'prednisolone'), ('dexamethasone', 'dexamethasone'), ('cortisone', 'cortisone'),
-
-                 ('fludrocortisone', 'fludrocortisone'))
-
-class Z_adrenal_corticosteroid_inhibitors(models.Model):
-    SPECIFICS = (('aminoglutethimide', 'aminoglutethimide'), ('metyrapone', 'metyrapone'))
-
-class Z_adrenergic_bronchodilators(models.Model):
-    SPECIFICS = (('isoproterenol', 'isoproterenol'), ('levalbuterol', 'levalbuterol'), ('arformoterol', 'arformoterol'),
-                 ('epinephrine', 'epinephrine'), ('metaproterenol', 'metaproterenol'), ('terbutaline', 'terbutaline'),
-                 ('formoterol', 'formoterol'), ('pirbuterol', 'pirbuterol'), ('racepinephrine', 'racepinephrine'), ('albuterol', 'albuterol'),
-                 ('salmeterol', 'salmeterol'), ('bitolterol', 'bitolterol'), ('indacaterol', 'indacaterol'), ('isoetharine', 'isoetharine'), ('olodaterol', 'olodaterol'))
-
-class Z_aldosterone_receptor_agents(models.Model):
-    SPECIFICS = (('eplerenone', 'eplerenone'), ('spironolactone', 'spironolactone'))
-
-class Z_alkylating_agents(models.Model):
-    SPECIFICS = (('chlorambucil', 'chlorambucil'), ('bendamustine', 'bendamustine'), ('carboplatin', 'carboplatin'), ('cyclophosphamide', 'cyclophosphamide'), ('cisplatin', 'cisplatin'),
-                 ('temozolomide', 'temozolomide'), ('busulfan', 'busulfan'), ('oxaliplatin', 'oxaliplatin'), ('melphalan', 'melphalan'), ('carmustine', 'carmustine'), ('dacarbazine', 'dacarbazine'),
-                 ('isosfamide', 'isosfamide'), ('lomustine', 'lomustine'), ('mechlorethamine', 'mechlorethamine'), ('streptozocin', 'streptozocin'), ('thiotepa', 'thiotepa'))
-
-class Z_alphaglucosidase_inhibitors(models.Model):
-    SPECIFICS = (('miglitol', 'miglitol'), ('acarbose', 'acarbose'))
-
-class Z_amebicides(models.Model):
-    SPECIFICS = (('chloroquine', 'chloroquine'), ('nitazoxanide', 'nitazoxanide'), ('metronidazole', 'metronidazole'), ('tinidazole', 'tinidazole'), ('paromomycin', 'paromomycin'), ('iodoquinol', 'iodoquinol'))
-
-class Z_aminoglycosides(models.Model):
-    SPECIFICS = (('tobramycin', 'tobramycin'), ('paromomycin', 'paromomycin'), ('gentamicin', 'gentamicin'), ('amikacin', 'amikacin'),
-                 ('kanamycin', 'kanamycin'), ('neomycin', 'neomycin'), ('streptomycin', 'streptomycin'))
-
-class Z_aminopenicillins(models.Model):
-    SPECIFICS = (('ampicillin', 'ampicillin'), ('amoxicillin', 'amoxicillin'), ('bacampicillin', 'bacampicillin'))
-
-class Z_amylin_analogs(models.Model):
-    SPECIFICS = (('pramlintide', 'pramlintide'))
-
-class Z_analgesics(models.Model):
-    SPECIFICS = (('methysergide', 'methysergide'), ('frovatriptan', 'frovatriptan'), ('naxproxen', 'naxproxen'), ('naratriptan', 'naratriptan'), ('almotriptan', 'almotriptan'), ('caffeine', 'caffeine'),
-                 ('ergotamine', 'ergotamine'), ('rizatriptan', 'rizatriptan'), ('eletriptan', 'eletriptan'), ('acetaminophen', 'acetaminophen'), ('dichloralphenazone', 'dichloralphenazone'), ('isometheptene', 'isometheptene'),
-                 ('sumatriptan', 'sumatriptan'), ('zolmitriptan', 'zolmaitriptan'), ('dihydroergotamine', 'dihydroergotamine'),
-
-                 ('valdecoxib', 'valdecoxib'), ('rofecoxib', 'rofecoxib'), ('celecoxib', 'celecoxib'),
-
-                 ('ziconotide', 'ziconotide'), ('levorphanol', 'levorphanol'), ('meperidine', 'meperidine'), ('butorphanol', 'butorphanol'), ('methadone', 'methadone'), ('hydromorphone', 'hydromorphone'),
-                 ('oxycodone', 'oxycodone'), ('opium', 'opium'), ('fentanyl', 'fentanyl'), ('buprenorphine', 'buprenorphine'), ('oxymorphone', 'oxymorphone'), ('codeine', 'codeine'), ('morphine', 'morphine'),
-                 ('nalbuphine', 'nalbuphine'), ('hydrocodone', 'hydrocodone'), ('propoxyphene', 'propoxyphene'), ('tramadol', 'tramadol'), ('tapentadol', 'tapentadol'), ('pentazocine', 'pentazoncine'), ('alfentanil', 'alfentanil'),
-                 ('levomethadyl', 'levomethadyl'), ('remifentanil', 'remifentanil'), ('sufentanil', 'sufentanil'),
-
-                 ('magnesium-salicylate', 'magnesium-salicylate'), ('aspirin', 'aspirin'), ('diflunisal','diflunisal'), ('salsalate', 'salsalate'))
-
-class Z_anabolic_steroids(models.Model):
-    SPECIFICS = (('methyltestosterone', 'methyltestosterone'), ('oxymetholone', 'oxymetholone'), ('testosterone', 'testosterone'), ('stanozolol', 'stanozolol'),
-                 ('fluoxymesterone', 'fluoxymesterone'), ('nandrolone', 'nandrolone'), ('oxandrolone', 'oxandrolone'))
-
-class Z_angiotensin_converting_enzyme_inhibitors(models.Model):
-    SPECIFICS = (('captopril', 'captopril'), ('fosinopril', 'fosinopril'), ('moexipril', 'moexipril'), ('benazepril', 'benazepril'), ('ramipril', 'ramipril'), ('quinapril', 'quinapril'), ('enalapril', 'enalapril'),
-                 ('perindopril', 'perindopril'), ('trandolapril', 'trandolapril'), ('lisinopril', 'lisinopril'))
-
-class Z_anorexiants(models.Model):
-    SPECIFICS = (('mazindol', 'mazindol'), ('diethylpropion', 'diethylpropion'), ('methamphetamine', 'methamphetamine'), ('phentermine', 'phentermine'), ('lorcaserin', 'lorcaserin'),('phendimetrazine', 'phendimetrazine'),
-                 ('benzphetamine', 'benzphetamine'), ('sibutramine', 'sibutramine'), ('bupropion', 'bupropion'), ('phentermine', 'phentermine'))
-
-class Z_anthelmintics(models.Model):
-    SPECIFICS = (('albendazole', 'albendazole'), ('ivermectin', 'ivermectin'), ('praziquantel', 'praziquantel'), ('pyrantel', 'pyrantel'), ('mebendazole', 'mebendazole'), ('miltefosine', 'miltefosine'), ('niclosamide', 'niclosamide'),
-                 ('oxamniquine', 'oxamniquine'), ('piperazine', 'piperazine'), ('thiabendazole', 'thiabendazole'))
-
-class Z_antiandrogens(models.Model):
-    SPECIFICS = (('bicalutamide', 'bicalutamide'), ('enzalutamide', 'enzalutamide'), ('flutamide', 'flutamide'), ('nilutamide', 'nilutamide'))
-
-class Z_antianginal(models.Model):
-    SPECIFICS = (('ranolazine', 'ranolazine'), ('nitroglycerin', 'nitroglycerin'), ('isosorbide-mononitrate', 'isosorbide-mononitrate'), ('isosorbide-dinitrate', 'isosorbide-dinitrate'), ('amyl-nitrite', 'amyl-nitrate'))
-
-class Z_anticoagulants(models.Model):
-    SPECIFICS = (('warfarin', 'warfarin'), ('fondaparinux', 'fondaparinux'), ('rivaroxban', 'rivaroxban'), ('apixaban', 'apixaban'), ('edoxaban', 'edoxaban'), ('dalteparin', 'dalteparin'), ('tinzaparin', 'tinzaparin'),
-                 ('enoxaparin', 'enoxaparin'), ('heparin', 'heparin'), ('ardeparin', 'ardeparin'), ('danaparoid', 'danaparoid'),
-                 ('bivalirudin', 'bivalirudin'), ('dabigatran', 'dabigatron'), ('argatroban', 'argatroban'), ('desirudin', 'desirudin'), ('lepirudin', 'lepirudin'))
-
-class Z_anticonvulsants(models.Model):
-    SPECIFICS = (('mephobarbital', 'mephobarbital'), ('primidone', 'primidone'), ('phenobarbital', 'phenobarbital'), ('clobazam', 'clobazam'), ('clonazepam', 'clonazepam'), ('diazepam', 'diazepam'), ('lorazepam', 'lorazepam'),
-                 ('felbatol', 'felbatol'), ('acetazolamide', 'acetazolamide'), ('zonisamide', 'zonisamide'), ('topiramate', 'topiramate'), ('rufinamide', 'rufinamide'), ('oxcarbazepine', 'oxcarbazepine'), ('eslicrabazepinr', 'eslicarbazepine'),
-                 ('carbamazepine', 'carbamazepine'), ('valproic-acid', 'valproic-acid'), ('divalproex-sodium', 'divalproex-sodium'), ('pregabalin', 'pregabalin'), ('vigabatrin', 'vigabatrin'), ('tiagabine', 'tiagabine'), ('phenytoin', 'phenytoin'),
-                 ('ethotoin', 'ethotoin'), ('fosphenytoin', 'fosphenytoin'), ('mephenytoin', 'mephenytoin'), ('magnesium-sulfate', 'magnesium-sulfate'), ('lacosamide', 'lacosamide'), ('ezogabine', 'ezogabine'),
-                 ('paramethadione', 'paramethadione'), ('trimethadione', 'trimethadione'), ('levetiracetam', 'levetiracetam'), ('ethosuximide', 'ethosuximide'), ('methsuximide', 'methsuximide'),
-                 ('lamotrigine', 'lamotrigine'))
-
-
-class Z_antidepressants(models.Model):
-    SPECIFICS = (('bupropion', 'bupropion'), ('vilazodone', 'vilazodone'), ('vortioxetine', 'vortioxetine'), ('isocarboxazid', 'isocarboxazid'), ('tranycypromine', 'tranycypromine'), ('selegiline', 'selegiline'), ('phenelzine', 'phenelzine'),
-                 ('nefazodone', 'nefazodone'), ('trazodone', 'trazodone'), ('escitalopram', 'excitalopram'), ('fluoxetine', 'fluoxetine'), ('citalopram', 'citalopram'), ('sertraline', 'sertraline'), ('paroxetine', 'paroxetine'), ('fluvoxamine', 'fluvoxamine'),
-                 ('desvenlafaxine', 'desvenlafaxine'), ('venlafaxine', 'venlafaxine'), ('duloxetine', 'duloxetine'), ('milnacipran', 'milnacipran'), ('levomilnacipran', 'levomilnacipran'), ('maprotiline', 'maprotiline'), ('mirtazapine', 'mirtazapine'),
-                 ('amoxapine', 'amoxapine'), ('desipramine', 'desipramine'), ('clomipramine', 'clomipramine'), ('trimipramine', 'trimipramine'), ('amitriptyline', 'amitriptyline'), ('nortriptyline', 'nortriptyline'), ('imipramine', 'imipramine'),('doxepin', 'doxepin'))
-
-
-class Z_antidiabetic(models.Model):
-    SPECIFICS = (('miglitol', 'miglitol'), ('acarbose', 'acarbose'), ('pramlintide', 'pramlintide'), ('liraglutide', 'liraglutide'), ('exenatide', 'exenatide'), ('dulaglutide', 'dulaglutide'), ('albiglutide', 'albiglutide'),
-                 ('insulin', 'insulin'), ('repaglinide', 'repaglinide'), ('nateglinide', 'nateglinide'), ('chlorpropamide', 'chlorpropamide'), ('glimepiride', 'glimepiride'), ('glipizide', 'glipizide'), ('glyburide', 'glyburide'),
-                 ('tolazamide', 'tolazamide'), ('acetohexamide', 'acetohexamide'), ('tolbutamide', 'tolbutamide'), ('rosiglitazone', 'roziglitazone'), ('pioglitazone', 'pioglitazone'), ('troglitazone', 'troglitazone'))
-
-class Z_antidiarrheals(models.Model):
-    SPECIFICS = (('atropine', 'atropine'), ('attapulgite', 'attapulgite'), ('saccharomyces-boulardii-lyo', 'saccharomyces-boulardii-lyo'), ('loperamide', 'loperamide'), ('bismuth-subsalicylate', 'bismuth-subsalicylate'), ('lactobacillius', 'lactobacillius'),
-                 ('crofelemer', 'crofelemer'), ('kaolin', 'kaolin'), ('loperamide', 'loperamide'))
-
-
-class Z_antidiuretics(models.Model):
-    SPECIFICS = (('desmopressin', 'desmopressin'), ('vasopressin', 'vasopressin'))
-
-
-class Z_antidotes(models.Model):
-    SPECIFICS = (('prussian-blue', 'prussian-blue'), ('naloxone', 'naloxone'), ('pralidoxime', 'pralidoxime'), ('acetylcysteine', 'acetylcysteine'), ('naltrexone', 'naltrexone'), ('charcoal', 'charcoal'), ('atropine', 'atropine'),
-                 ('deferiprone', 'deferiprone'), ('deferoxamine', 'deferoxamine'), ('digoxin', 'digoxin'), ('dimercaprol', 'dimercaprol'), ('edetate-calcium-disodium', 'edetate-calcium-disodium'), ('flumazenil', 'flumazenil'),
-                 ('fomepizole', 'fomepizole'), ('glucarpidase', 'glucarpidase'), ('ipecac', 'ipecac'), ('leucovorin', 'leucovorin'), ('methylene-blue', 'methylene-blue'), ('nalmefene', 'nalmefene'), ('sodium-nirtate', 'sodium-nitrate'))
-
-
-class Z_antifungals(models.Model):
-    SPECIFICS = (('itraconazole', 'itroconazole'), ('posaconazole', 'posaconazole'), ('fluconazole', 'fluconazole'), ('ketoconazole', 'ketoconazole'), ('clotrimazole', 'clotrimazole'), ('isavuconazonium', 'isavuconazonium'), ('miconazole', 'miconazole'),
-                 ('voriconazole', 'voriconazole'), ('anidulafungin', 'anidulafungin'), ('caspofungin', 'caspofungin'), ('micafungin', 'micafungin'), ('terbinafine', 'terbinafine'), ('griseofulvin', 'griseofulvin'), ('flucytosine', 'flucytosine'), ('hydroxypropyl-chitosan', 'hydroxypropyl-chitosan'))
-
-class Z_antigonadotropic(models.Model):
-    SPECIFICS = (('danazol', 'danazol'))
-
-
-class Z_antigout(models.Model):
-    SPECIFICS = (('probenecid','probenecid'), ('sulfinpyrazone', 'sulfinpyrazone'), ('allopurinol', 'allopurinol'), ('colchicine', 'colchicine'))
-
-
-class Z_antihistamines(models.Model):
-    SPECIFICS = (('dexchlorpheniramine', 'dexchlorpheniramine'), ('phenindamine', 'phenindamine'), ('terfenadine', 'terfenadine'), ('triprolidine', 'triprolidine'), ('carbinoxamine', 'carbinoxamine'), ('brompheniramine', 'brompheniramine'),
-                 ('chlorpheniramine', 'chlorpheniramine'), ('cyproheptadine', 'cyproheptadine'), ('promethazine', 'promethazine'), ('levocetirizine', 'levocetirizine'), ('fexofenadine', 'fexofenadine'), ('clemastine', 'clemastine'), ('cetirizine', 'cetirizine'),
-                 ('diphenhydramine', 'diphenhydramine'), ('desloratadine', 'desloratadine'), ('hydroxyzine', 'hydroxyzine'), ('loratadine', 'loratadine'), ('astemizole', 'astemizole'), ('azatadine', 'azatadine'), ('dexbrompheniramine', 'dexbrompheniramine'),
-                 ('pheniramine', 'pheniramine'), ('pyrilamine', 'pyrilamine'), ('tripelennamine', 'tripelennamine'))
-
-
-class Z_antimalarial(models.Model):
-    SPECIFICS = (('chloroquine', 'chloroquine'), ('quinine', 'quinine'), ('hydroxychloroquine', 'hydroxychloroquine'), ('mefloquine', 'mefloquine'), ('primaquine', 'primaquine'), ('proguanil', 'proguanil'), ('doxycycline', 'doxycycline'), ('halofantrine', 'halofantrine'))
-
-
-class Z_antimetabolites(models.Model):
-    SPECIFICS = (('fluorouracil', 'fluorouracil'), ('cladribine', 'cladribine'), ('capecitabine', 'capecitabine'), ('methotrexate', 'methotrexate'), ('premetrexed', 'premetrexed'), ('mercaptopurine', 'mercaptopurine'), ('hydroxyurea', 'hydroxyurea'),
-                 ('fludarabine', 'fludarabine'), ('gemcitabine', 'gemcitabine'), ('clofarabine', 'clofarabine'), ('cytarabine', 'cytarabine'), ('decitabine', 'decitabine'), ('floxuridine', 'floxuridine'), ('nelarabine', 'nelarabine'), ('pralatrexate', 'pralatrexate'))
-
-
-class Z_anitmigraine(models.Model):
-    SPECIFICS = (('methysergide', 'methysergide'), ('frovatriptan', 'frovatriptan'), ('naxproxen', 'naxproxen'), ('naratriptan', 'naratriptan'), ('almotriptan', 'almotriptan'), ('caffeine', 'caffeine'),
-                 ('ergotamine', 'ergotamine'), ('rizatriptan', 'rizatriptan'), ('eletriptan', 'eletriptan'), ('acetaminophen', 'acetaminophen'), ('dichloralphenazone', 'dichloralphenazone'), ('isometheptene', 'isometheptene'),
-                 ('sumatriptan', 'sumatriptan'), ('zolmitriptan', 'zolmaitriptan'), ('dihydroergotamine', 'dihydroergotamine'))
-
-class Z_antiparkinson_agents(models.Model):
-    SPECIFICS = (('benztropine', 'benztropine'), ('diphenhydramine', 'diphenhydramine'), ('trihexyphenidyl', 'trihexyphenidyl'), ('procyclidine', 'procyclidine'), ('biperiden', 'biperiden'))
-
-
-
-class Z_antipsoriatics(models.Model):
-    SPECIFICS = (('methotrexate', 'methotrexate'), ('acitretin', 'acitretin'))
-
-
-class Z_antirheumatics(models.Model):
-    SPECIFICS = (('auranofin', 'auranofin'), ('anakinra', 'anakinra'), ('infliximab', 'infliximab'), ('etanercept', 'etanercept'), ('rituximab', 'rituximab'), ('adalimumab', 'adalimumab'), ('penicillamine', 'penicillamine'), ('methotrexate', 'methotrexate'),
-                 ('hyroxychloroquine', 'hydroxychloroquine'), ('tofacitinib', 'tofacitinib'), ('apremilast', 'apremilast'), ('leflunomide', 'leflunomide'), ('azathioprine', 'azathioprine'), ('abatacept', 'abatacept'), ('aurothioglucose', 'aurothioglucose'))
-
-
-class Z_antiseptics(models.Model):
-    SPECIFICS = (('hexachlorophene', 'hexachlorophene'), ('sodium-hypochlorite', 'sodium-hypochlorite'), ('chlorhexidine', 'chlorhexidine'), ('benalkonium', 'benalkonium'), ('iodine-topical', 'iodine-topical'), ('isopropanol', 'isopropanol'), ('povidone-iodine', 'povidone-iodine'))
-
-
-class Z_antithyroid(models.Model):
-    SPECIFICS = (('potassium-iodide', 'potassium-iodide'), ('propylthiouracil', 'propylthiouracil'), ('methimazole', 'methimazole'))
-
-
-class Z_barbiturates(models.Model):
-    SPECIFICS = (('secobarbital', 'secobarbital'), ('mephobarbital', 'mephobarbital'), ('pentobarbital', 'pentobarbital'), ('phenobarbital', 'phenobarbital'), ('butabarbital', 'butabarbital'), ('amobarbital', 'amobarbital'))
+#appointments are booked in fixed slots of this many minutes
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
 
+#the working hours patients are offered slots in, from the start of FIRST_HOUR to the start of LAST_HOUR
+FIRST_HOUR = 9
+LAST_HOUR = 17
 
-class Z_benzodiazepines(models.Model):
-    SPECIFICS = (('quazepam', 'quazepam'), ('estazolam', 'estazolam'), ('clobazam', 'clobazam'), ('alphrazolam', 'alphrazolam'), ('flurazepam', 'flurazepam'), ('oxazepam', 'oxazepam'), ('chlordiazepoxide', 'chlordiazepoxide'), ('clonazepam', 'cloneazapam'),
-                 ('diazepam', 'diazepam'), ('lorazepam', 'lorazepam'), ('clorazepate', 'clorazepate'), ('triazolam', 'triazolam'), ('midazolam', 'midazolam'), ('temazepam', 'temazepam'), ('halazepam', 'halazepam'))
 
+class DoctorDay(models.Model):
+    #one row per doctor per day. bookedSlots is a bitmap of the day's slots stored as hex, where
+    #bit n is set when the slot starting n * SLOT_MINUTES after midnight is taken. The row is
+    #also what gets locked while a booking is made so two bookings can't take the same slot.
+    doctor = models.ForeignKey(Doctor)
+    day = models.DateField()
+    bookedSlots = models.CharField(max_length=SLOTS_PER_DAY // 4, default='0' * (SLOTS_PER_DAY // 4))
+    #the day at a glance for the staff calendar, kept up to date with every appointment saved or
+    #deleted. Appointments from before slots were tracked can share a slot, so the count can be
+    #more than the booked slots.
+    appointmentCount = models.PositiveIntegerField(default=0)
+    firstSlot = models.PositiveSmallIntegerField(null=True)
+    lastSlot = models.PositiveSmallIntegerField(null=True)
+    bookedMinutes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('doctor', 'day')
 
-class Z_bisphosphonates(models.Model):
-    SPECIFICS = (('alendronate', 'alendronate'), ('etidronate', 'etidronate'), ('zoledronic-acid', 'zoledronic-acid'), ('ibandronate', 'ibandronate'), ('alendronate', 'alendronate'), ('risedronate', 'risedronate'), ('pamidronate', 'pamidronate'), ('tiludronate', 'tiludronate'))
-
-
-class Z_calcineurin_inhibitors(models.Model):
-    SPECIFICS = (('cyclosporine', 'cyclosporine'), ('tacrolimus', 'tacrolimus'))
-
-
-class Z_calcitonin(models.Model):
-    SPECIFICS = (('calcitonin', 'calcitonin'))
-
-
-class Z_carbapenems(models.Model):
-    SPECIFICS = (('doripenem', 'doripenem'), ('meropenem', 'meropenem'), ('cilastatin', 'cilastatin'), ('ertapenem', 'ertapenem'))
-
-
-class Z_cardiac_stressing_agents(models.Model):
-    SPECIFICS = (('adenosine', 'adenosine'), ('regadensoson', 'regadensoson'), ('dobutamine', 'dobutamine'), ('dipyridamole', 'dipyridamole'))
-
-
-class Z_catecholamines(models.Model):
-    SPECIFICS = (('isoproterenol', 'isoproterenol'), ('epinephrine', 'epinephrine'), ('norepinephrine', 'norepinephrine'), ('dobutamine', 'dobutamine'), ('dopamine', 'dopamine'))
-
-
-class Z_cerumenolytics(models.Model):
-    SPECIFICS = (('carbamide-peroxide', 'carbamide-peroxide'), ('trithanolamine-polypeptide-oleate', 'trithanolamine-polypeptide-oleate'))
-
-
-class Z_chelating_agents(models.Model):
-    SPECIFICS = (('deferasirox', 'deferasirox'), ('deferiprone', 'deferiprone'), ('deferoxamine', 'deferoxamine'), ('succimer', 'succimer'), ('trientine', 'trientine'))
-
-
-class Z_cholinergic_muscle_stimulants(models.Model):
-    SPECIFICS = (('dalfampridine', 'dalfampridine'), ('neostigmine', 'neostigmine'), ('pyridostigmine', 'pyridostigmine'), ('ambenonium', 'ambenonium'), ('atropine', 'atropine'), ('edrophonium', 'edrophonium'), ('guanidine', 'guanidine'))
-
-
-class Z_cholinesterase_inhibitors(models.Model):
-    SPECIFICS = (('tacrine', 'tacrine'), ('galantamine', 'galantamine'), ('rivastigmine', 'rivastigmine'), ('donepezil', 'donepezil'))
-
-
-class Z_contraceptives(models.Model):
-    SPECIFICS = (('ethinyl-estradiol', 'ethinyl-estradiol'), ('levonorgestrel', 'levonorgestrel'), ('dienogest', 'dienogest'), ('mestranol', 'mestranol'), ('drospirenone', 'drospirenone'), ('desogestrel', 'desogestrel'))
-
-
-class Z_decongestants(models.Model):
-    SPECIFICS = (('phenylpropanolamine', 'phenylpropanolamine'), ('pseudoephedrine', 'pseudoephedrine'), ('ephedrine', 'ephedrine'), ('phenylephrine', 'phenylephrine'))
-
-
-class Z_digestive_enzymes(models.Model):
-    SPECIFICS = (('pancrelipase', 'pancrelipase'), ('pancreatin', 'pancreatin'), ('lactase', 'lactase'), ('amylase', 'amylase'), ('cholic-acid', 'cholic-acid'), ('sacrosidase', 'sacrosidase'))
-
-
-class Z_echinocandins(models.Model):
-    SPECIFICS = (('caspofungin', 'caspofungin'), ('anidulafungin', 'anidulafungin'), ('micfungin', 'micafungin'))
-
-
-class Z_estrogens(models.Model):
-    SPECIFICS = (('estropipate', 'estropipate'), ('esterified', 'esterified'), ('estadiol', 'estradiol'), ('chlorotrianisene', 'chlorotrianisene'))
-
-
-class Z_expectorants(models.Model):
-    SPECIFICS = (('potassium-iodide', 'potassium-iodide'), ('guaifenesin', 'guaifenesin'), ('carbocysteine', 'carbocysteine'), ('potassium-guaiacolsulfonate', 'potassium-guaiacolsulfonate'))
-
-
-class Z_fibric_acid_derivatives(models.Model):
-    SPECIFICS = (('gemfibrozil', 'gemfibrozil'), ('fenofibrate', 'fenofibrate'), ('clofibrate', 'clofibrate'))
-
-
-class Z_gallstone_solubilizing_agents(models.Model):
-    SPECIFICS = (('ursodiol', 'ursodiol'), ('chenodeoxycholic-acid', 'chenodeoxycholic-acid'), ('monoctanoin', 'monoctanoin'))
-
-
-class Z_general_anesthetics(models.Model):
-    SPECIFICS = (('propofol', 'propofol'), ('thiopental', 'thiopental'), ('ketamine', 'ketamine'), ('desflurane', 'desflurane'), ('droperidol', 'droperidol'), ('enflurane', 'enflurane'), ('etomidate', 'etomidate'), ('fospropofol', 'forpropofol'), ('halothane', 'halothane'),
-                 ('isoflurane', 'isoflurane'), ('methohexital', 'methohexital'), ('nitrous-oxide', 'nitrous-oxide'), ('sevoflurane', 'sevoflurane'))
-
-
-class Z_gi_stimulants(models.Model):
-    SPECIFICS = (('metoclopramide', 'metoclopramide'), ('cisapride', 'cisapride'), ('choline-bitartrate', 'choline-bitartrate'))
-
-
-class Z_growth_hormones(models.Model):
-    SPECIFICS = (('somatropin', 'somatropin'), ('tesamorelin', 'tesamorelin'), ('serorelin', 'sermorelin'))
-
-
-class Z_impotence_agents(models.Model):
-    SPECIFICS = (('tadalafil', 'tadalafil'), ('sildenafil', 'sildenafil'), ('vardenafil', 'vardenafil'), ('alprostadil', 'alprostadil'), ('avanafil', 'avanafil'), ('yohimbine', 'yohimbine'))
-
-
-class Z_inhaled_antiinfectives(models.Model):
-    SPECIFICS = (('tobramycin', 'tobramycin'), ('zanamivir', 'zanamivir'), ('ribavirin', 'ribavirin'), ('pentamidine', 'pentamidine'))
-
-
-class Z_inhaled_corticosteroids(models.Model):
-    SPECIFICS = (('flunisolide', 'flunisolide'), ('fluticasone', 'fluticasone'), ('ciclesonide', 'ciclesonide'), ('beclomethasone', 'beclomethasone'), ('budesonide', 'budesonide'), ('mometasone', 'mometasone'))
-
-
-class Z_inotropic_agents(models.Model):
-    SPECIFICS = (('digoxin', 'digoxin'), ('dobutamine', 'dobutamine'), ('dopamine', 'dopamine'), ('inamrinone', 'inamrinone'), ('milrinone', 'milrinone'))
-
-
-class Z_interleukins(models.Model):
-    SPECIFICS = (('proleukin', 'proleukin'), ('neumega', 'neumega'))
-
-
-class Z_ketolides(models.Model):
-    SPECIFICS = (('telithromycin', 'telithromycin'))
-
-
-class Z_laxatives(models.Model):
-    SPECIFICS = (('magnesium-citrate', 'magnesium-citrate'), ('lactulose', 'lactulose'), ('cascara-sagrada', 'cascara-sagrada'), ('polycarbophil', 'polycarbophil'), ('magnesium-hydroxide', 'magnesium-hydroxide'),
-                 ('glycerin', 'glycerin'), ('polyethylene-glycol-3350', 'polythylene-glycol-3350'), ('sodium-biphosphate', 'sodium-biphosphate'), ('docusate', 'docusate'), ('psyllium', 'psyllium'),
-                 ('magnesium-sulfate', 'magnesium-sulfate'), ('methylcellulose', 'methylcellulose'), ('docusate', 'docusate'), ('bisacodyl', 'bisacodyl'), ('senna', 'senna'), ('castor-oil', 'castor-oil'),
-                 ('guar-gum', 'guar-gum'), ('hydrocortisone', 'hydrocortisone'), ('inulin', 'inulin'), ('magnesium-sulfate', 'magnesium-sulfate'), ('mineral-oil', 'mineral-oil'), ('sorbitol', 'sorbitol'))
-
-class Z_leprostatics(models.Model):
-    SPECIFICS = (('clofazimine', 'clofazimine'), ('thalidomide', 'thalidomide'))
-
-
-class Z_lincomycin_derivatives(models.Model):
-    SPECIFICS = (('lincomycin', 'lincomycin'), ('clindamycin', 'clindamycin'))
-
-
-class Z_loop_diuretics(models.Model):
-    SPECIFICS = (('bumetanide', 'bumetanide'), ('ethacrynic-acid', 'ethacrynic-acid'), ('furosemide', 'furosemide'), ('torsemide', 'torsemide'))
-
-
-class Z_lung_surfactants(models.Model):
-    SPECIFICS = (('poractant', 'poractant'), ('lucinactant', 'lucinactant'), ('beractant', 'beractant'), ('calfactant', 'calfactant'))
-
-
-class Z_lysosomal_enzymes(models.Model):
-    SPECIFICS = (('imiglucerase', 'imiglucerase'), ('alglucosidase', 'alglucosidase'), ('alglucerase', 'alglucerase'), ('elosulfase', 'elosulfase'), ('galsulfase', 'galsulfase'), ('idursulfase', 'idursulfase'), ('laronidase', 'laronidase'),
-                 ('taliglucerase', 'taliglucerase'), ('velaglucerase', 'velaglucerase'))
-
-
-class Z_macrolides(models.Model):
-    SPECIFICS = (('dirithromycin', 'dirithromycin'), ('fidaxomicin', 'fidazomicin'), ('azithromycin', 'azithromycin'), ('clarithromycin', 'clarithromycin'), ('erythromycin', 'erythromycin'), ('troleandomycin', 'troleandomycin'))
-
-
-class Z_methylxanthines(models.Model):
-    SPECIFICS = (('oxtriphylline', 'oxtriphylline'), ('theophylline', 'theophylline'), ('aminophylline', 'aminophylline'), ('dyphylline', 'dyphylline'))
-
-
-class Z_mitotic_inhibitors(models.Model):
-    SPECIFICS = (('eribulin', 'eribulin'), ('paclitaxel', 'paclitaxel'), ('vincristine', 'vincristine'), ('paclitaxel', 'paclitaxel'), ('etoposide', 'etoposide'), ('docetaxel', 'docetaxel'), ('cabazitaxel', 'cabazitazel'), ('estramustine', 'estramustine'),
-                 ('ixabepilone', 'ixabepilone'), ('teniposide', 'teniposide'), (' vinblastine', 'vinblastine'), ('vincristine', 'vincristine'), ('vinorelbine', 'vinorelbine'))
-
-
-class Z_mydriatics(models.Model):
-    SPECIFICS = (('cyclopentolate', 'cyclopentolate'), ('tropicamide', 'tropicamide'), ('atropine', 'atropine'), ('homatropine', 'homatropine'), ('hydroxyamphetamine', 'hydroxyamphetamine'), ('phenylephrine', 'phenylephrine'), ('scopolamine', 'scopolamine'))
-
-
-class Z_nasal_steroids(models.Model):
-    SPECIFICS = (('flunisolide', 'flunisolide'), ('budesonide', 'budesonide'), ('beclomehtasone', 'beclomethasone'), ('ciclesonide', 'ciclesonide'), ('mometasone', 'mometasone'), ('azelastine', 'azelastine'), ('fluticasone', 'fluticasone'), ('triamcinolone', 'triamcinolone'))
-
-
-class Z_phosphate_binders(models.Model):
-    SPECIFICS = (('sucroferric-oxyhydroxide', 'sucroferric-oxyhydroxide'), ('sevelamer', 'sevelamer'), ('aluminum-hydroxide', 'aluminum-hydroxide'), ('lanthanum-carbonate', 'lanthanum-carbonate'), ('calcium-acetate', 'calcium-acetate'), ('ferric-citrate', 'ferric-citrate'))
-
-
-class Z_probiotics(models.Model):
-    SPECIFICS = (('saccharomyces-boulardii-lyo', 'saccharomyces-boulardii-lyo'), ('bifidobacterium-infantis', 'bifidobacterium-infantis'), ('lactobacillus', 'lactobacillus'))
-
-
-class Z_progestins(models.Model):
-    SPECIFICS = (('hydroxyprogesterone', 'hydroxyprogesterone'), ('megestrol', 'megestrol'), ('levonorgestrel', 'levonorgestrel'), ('progesterone', 'progesterone'), ('etonogestrel','etonogestrel'), ('norethindrone', 'norethindrone'))
-
-
-class Z_purine_nucleosides(models.Model):
-    SPECIFICS = (('ganciclovir', 'ganciclovir'), ('valacyclovir', 'valacyclovir'), ('famciclovir', 'famciclovir'), ('acyclovir', 'acyclovir'), ('ribavirin', 'ribavirin'), ('cidofovir', 'cidofovir'), ('valganciclovir', 'valganciclovir'))
-
-
-class Z_quinolones(models.Model):
-    SPECIFICS = (('lomefloxacin', 'lomefloxacin'), ('norfloxacin', 'norfloxacin'), ('ofloxacin', 'ofloxacin'), ('gatifloxacin', 'gatifloxacin'), ('moxifloxacin', 'moxifloxacin'), ('ciprofloxacin', 'ciprofloxacin'), ('levofloxacin', 'levofloxacin'),
-                 ('gemifloxacin', 'gemifloxacin'), ('cinoxacin', 'cinoxacin'), ('enoxacin', 'enoxacin'), ('grepafloxacin', 'grepafloxacin'), ('nalidixic', 'nalidixic'), ('sparfloxacin', 'sparfloxacin'), ('trovafloxacin', 'trovafloxacin'))
-
-
-class Z_sclerosing_agents(models.Model):
-    SPECIFICS = (('ethanolamine-oleate', 'ethanolamine-oleate'), ('morrhuate', 'morrhuate'), ('polidocanol', 'polidocanol'), ('sodium-tetradecyl-sulfate', 'sodium-tetradecyl-sulfate'))
-
-
-class Z_thrombolytics(models.Model):
-    SPECIFICS = (('alteplase', 'alteplase'), ('streptokinase', 'streptokinase'), ('reteplase', 'reteplase'), ('tenecteplase', 'tenecteplase'), ('urokinase', 'urokinase'))
-
-
-class Z_uterotonic_agents(models.Model):
-    SPECIFICS = (('carboprost', 'carboprost'), ('mifepristone', 'mifepristone'), ('methylergonovine', 'methylergonovine'), ('oxytocin', 'oxytocin'), ('dinoprostone', 'dinoprostone'), ('ergonovine', 'ergonovine'))
-
-
-class Z_vasodilators(models.Model):
-    SPECIFICS = (('nitroglycerin', 'nitroglycerin'), ('alprostadil', 'alprostadil'), ('hydralazine', 'hydralazine'), ('minoxidil', 'minoxidil'), ('nesiritide', 'nesiritide'), ('nitroprusside', 'nitroprusside'), ('riociguat', 'riociguat'))
-
+    def __str__(self):
+        return "%s %s" % (self.doctor_id, self.day)
 
+    def getBitmap(self):
+        return int(self.bookedSlots, 16)
 
-MEDICINE_CATEGORIES = (('adrenal_cortical_steroids', Z_adrenal_cortical_steroids),
-                       ('adrenal_corticosteroid_inhibitors', Z_adrenal_corticosteroid_inhibitors),
-                       ('adrenergic_bronchodilators', Z_adrenergic_bronchodilators),
-                       ('aldosterone_receptor_agents', Z_aldosterone_receptor_agents),
-                       ('alkylating_agents', Z_alkylating_agents),
-                       ('alphaglucosidase_inhibitors', Z_alphaglucosidase_inhibitors),
-                       ('amebicides', Z_amebicides),
-                       ('aminoglycosides', Z_aminoglycosides),
-                       ('aminopenicillins', Z_aminopenicillins),
-                       ('amylin_analogs', Z_amylin_analogs),
-                       ('analgesics', Z_analgesics),
-                       ('anabolic_steroids', Z_anabolic_steroids),
-                       ('angiotensin_converting_enzyme_inhibitors', Z_angiotensin_converting_enzyme_inhibitors),
-                       ('anorexiants', Z_anorexiants),
-                       ('anthelmintics', Z_anthelmintics),
-                       ('antiandrogens', Z_antiandrogens),
-                       ('antianginal', Z_antianginal),
-                       ('anticoagulants', Z_anticoagulants),
-                       ('anticonvulsants', Z_anticonvulsants),
-                       ('antidepressants', Z_antidepressants),
-                       ('antidiabetic', Z_antidiabetic),
-                       ('antidiarrheals', Z_antidiarrheals),
-                       ('antidiuretics', Z_antidiuretics),
-                       ('antidotes', Z_antidotes),
-                       ('antifungals', Z_antifungals),
-                       ('antigonadotropic', Z_antigonadotropic),
-                       ('antigout', Z_antigout),
-                       ('antihistamines', Z_antihistamines),
-                       ('antimalarial', Z_antimalarial),
-                       ('antimetabolites', Z_antimetabolites),
-                       ('anitmigraine', Z_anitmigraine),
-                       ('antiparkinson_agents', Z_antiparkinson_agents),
-                       ('antipsoriatics', Z_antipsoriatics),
-                       ('antirheumatics', Z_antirheumatics),
-                       ('antiseptics', Z_antiseptics),
-                       ('antithyroid', Z_antithyroid),
-                       ('barbiturates', Z_barbiturates),
-                       ('benzodiazepines', Z_benzodiazepines),
-                       ('bisphosphonates', Z_bisphosphonates),
-                       ('calcineurin_inhibitors', Z_calcineurin_inhibitors),
-                       ('calcitonin', Z_calcitonin),
-                       ('carbapenems', Z_carbapenems),
-                       ('cardiac_stressing_agents', Z_cardiac_stressing_agents),
-                       ('catecholamines', Z_catecholamines),
-                       ('cerumenolytics', Z_cerumenolytics),
-                       ('chelating_agents', Z_chelating_agents),
-                       ('cholinergic_muscle_stimulants', Z_cholinergic_muscle_stimulants),
-                       ('cholinesterase_inhibitors', Z_cholinesterase_inhibitors),
-                       ('contraceptives', Z_contraceptives),
-                       ('decongestants', Z_decongestants),
-                       ('digestive_enzymes', Z_digestive_enzymes),
-                       ('echinocandins', Z_echinocandins),
-                       ('estrogens', Z_estrogens),
-                       ('expectorants', Z_expectorants),
-                       ('fibric_acid_derivatives', Z_fibric_acid_derivatives),
-                       ('gallstone_solubilizing_agents', Z_gallstone_solubilizing_agents),
-                       ('general_anesthetics', Z_general_anesthetics),
-                       ('gi_stimulants', Z_gi_stimulants),
-                       ('growth_hormones', Z_growth_hormones),
-                       ('impotence_agents', Z_impotence_agents),
-                       ('inhaled_antiinfectives', Z_inhaled_antiinfectives),
-                       ('inhaled_corticosteroids', Z_inhaled_corticosteroids),
-                       ('inotropic_agents', Z_inotropic_agents),
-                       ('interleukins', Z_interleukins),
-                       ('ketolides', Z_ketolides),
-                       ('laxatives', Z_laxatives),
-                       ('leprostatics', Z_leprostatics),
-                       ('lincomycin_derivatives', Z_lincomycin_derivatives),
-                       ('loop_diuretics', Z_loop_diuretics),
-                       ('lung_surfactants', Z_lung_surfactants),
-                       ('lysosomal_enzymes', Z_lysosomal_enzymes),
-                       ('macrolides', Z_macrolides),
-                       ('methylxanthines', Z_methylxanthines),
-                       ('mitotic_inhibitors', Z_mitotic_inhibitors),
-                       ('mydriatics', Z_mydriatics),
-                       ('nasal_steroids', Z_nasal_steroids),
-                       ('phosphate_binders', Z_phosphate_binders),
-                       ('probiotics', Z_probiotics),
-                       ('progestins', Z_progestins),
-                       ('purine_nucleosides', Z_purine_nucleosides),
-                       ('quinolones', Z_quinolones),
-                       ('sclerosing_agents', Z_sclerosing_agents),
-                       ('thrombolytics', Z_thrombolytics),
-                       ('uterotonic_agents', Z_uterotonic_agents),
-                       ('vasodilators', Z_vasodilators))
\ No newline at end of file
+    def setBitmap(self, bitmap):
+        #the first and last slots and the booked minutes all come from the bitmap, so they are set with it
+        self.bookedSlots = '%0*x' % (SLOTS_PER_DAY // 4, bitmap)
+        self.firstSlot = (bitmap & -bitmap).bit_length() - 1 if bitmap else None
+        self.lastSlot = bitmap.bit_length() - 1 if bitmap else None
+        self.bookedMinutes = bin(bitmap).count('1') * SLOT_MINUTES
@@ -0,0 +1,96 @@
+from django.db import transaction
+from django.utils import timezone
+from .models import Patient, Prescription, CurrentMedication
+from .interactions import getInteractions
+
+"""
+A patient's prescriptions are kept as a history in Prescription, one entry per medication the
+patient was put on, with the dates it started and stopped. Entries are never edited or deleted
+apart from being stopped. Prescribing a medication the patient is already on stops the entry
+for it and starts a new one with the new dose, so the old dose is still in the history.
+
+CurrentMedication holds a copy of every entry that is still active. It is what the profile
+and roster pages show, so listing a patient's medications is one indexed read whether their
+history has five entries or five thousand. Both tables are only written by prescribe and
+discontinue here, which lock the patient's row and change the two tables in one transaction,
+so the copy never disagrees with the history.
+
+Before anything is written, prescribe checks the new medication against the patient's other
+current medications and their conditions with the rules in interactions.py. If it clashes with
+any of them it raises InteractionsFound instead, unless the doctor has acknowledged them.
+"""
+
+#the fields copied from a Prescription into its CurrentMedication
+CURRENT_FIELDS = ('medicationCategory', 'medication', 'dosage', 'frequency', 'directions', 'startDate')
+
+
+class NotActive(Exception):
+    pass
+
+
+class InteractionsFound(Exception):
+    def __init__(self, interactions):
+        super(InteractionsFound, self).__init__("%d interactions found" % len(interactions))
+        self.interactions = interactions
+
+
+def lockPatient(patient):
+    #prescriptions for one patient are made one at a time so two doctors changing the same
+    #medication can't both leave an active entry behind
+    list(Patient.objects.select_for_update().filter(pk=patient.pk).values_list('pk', flat=True))
+
+
+def stop(prescription, when):
+    Prescription.objects.filter(pk=prescription.pk).update(active=False, stopDate=when)
+    CurrentMedication.objects.filter(prescription=prescription).delete()
+    prescription.active = False
+    prescription.stopDate = when
+
+
+def checkInteractions(patient, medication):
+    #what starting medication would clash with, leaving out the medication itself since a new
+    #prescription for it replaces the old one
+    current = CurrentMedication.objects.filter(patient=patient).exclude(medication=medication).values_list('medication', flat=True)
+    conditions = Patient.objects.filter(pk=patient.pk).values_list('medicalInfo__conditions', flat=True).first() or 0
+    return getInteractions().check(medication, current, conditions)
+
+
+def prescribe(patient, doctor, prescription, acknowledged=False):
+    #starts an unsaved Prescription for the patient, stopping any active one for the same medication
+    now = timezone.now()
+    with transaction.atomic():
+        lockPatient(patient)
+        interactions = checkInteractions(patient, prescription.medication)
+        if interactions and not acknowledged:
+            raise InteractionsFound(interactions)
+        for previous in Prescription.objects.filter(patient=patient, active=True, medication=prescription.medication):
+            stop(previous, now)
+
+        prescription.patient = patient
+        prescription.prescribedBy = doctor
+        prescription.startDate = now
+        prescription.stopDate = None
+        prescription.active = True
+        prescription.save(force_insert=True)
+        CurrentMedication.objects.create(patient=patient, prescription=prescription,
+                                         **dict((field, getattr(prescription, field)) for field in CURRENT_FIELDS))
+    return prescription
+
+
+def discontinue(prescription):
+    with transaction.atomic():
+        lockPatient(prescription.patient)
+        #read again under the lock in case it was stopped while this request was waiting
+        if not Prescription.objects.filter(pk=prescription.pk, active=True).exists():
+            raise NotActive("%s has already been stopped" % prescription)
+        stop(prescription, timezone.now())
+    return prescription
+
+
+def currentMedications(patient):
+    return CurrentMedication.objects.filter(patient=patient).order_by('medication')
+
+
+def history(patient):
+    #newest first, every entry the patient has ever had
+    return Prescription.objects.filter(patient=patient).select_related('prescribedBy__user').order_by('-startDate', '-pk')
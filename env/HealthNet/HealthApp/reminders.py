@@ -0,0 +1,185 @@
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction, IntegrityError
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import Appointment, AppointmentReminder
+import datetime, smtplib, uuid
+
+"""
+Reminder emails for upcoming appointments, sent by the sendreminders command.
+
+A run walks every appointment in the next few hours in (date, id) order a page at a time,
+each page starting after the last appointment of the one before, so no page gets slower the
+further the run is and nothing holds a transaction open between pages. For each page:
+
+1. The patients on the page have the rest of their appointments in the window read too, so a
+   patient with several appointments gets one email listing them all.
+2. The reminders for those appointments are claimed: rows are inserted for appointments that
+   have none yet, and reminders that failed or were claimed by a run that died are taken over
+   with one conditional update. Every claimed row carries this run's token, and the unique
+   (appointment, appointmentDate) pair means two runs can never claim the same reminder.
+3. One email is sent per recipient over a single SMTP connection kept open for the whole run.
+4. What was sent and what failed is recorded with one update each.
+
+Running it again sends nothing that was already sent, so it is safe to run from cron every
+few minutes.
+"""
+
+REMINDER_HOURS = 24
+
+PAGE_SIZE = 1000
+
+#a failed reminder is tried again by later runs until it has failed this many times
+MAX_ATTEMPTS = 3
+
+#a claim older than this is from a run that died before recording what it sent
+CLAIM_TIMEOUT = datetime.timedelta(minutes=30)
+
+SUBJECT = 'Appointment reminder'
+
+#the columns read for every claimed reminder, in the order dispatch() unpacks them
+REMINDER_FIELDS = ('pk', 'appointmentDate', 'appointment__description', 'appointment__patient__profileInfo__email',
+                   'appointment__patient__profileInfo__firstName', 'appointment__doctor__user__first_name',
+                   'appointment__doctor__user__last_name')
+
+
+class Dispatcher(object):
+
+    def __init__(self, connection=None, hours=REMINDER_HOURS, pageSize=PAGE_SIZE, now=None, fromEmail=None):
+        self.connection = connection or get_connection()
+        self.pageSize = pageSize
+        self.start = now or timezone.now()
+        self.end = self.start + datetime.timedelta(hours=hours)
+        self.fromEmail = fromEmail or settings.REMINDER_FROM_EMAIL
+        self.token = uuid.uuid4().hex
+        self.counts = {'appointments': 0, 'claimed': 0, 'messages': 0, 'sent': 0, 'failed': 0, 'skipped': 0}
+
+    def run(self):
+        self.connection.open()
+        try:
+            for page in self.pages():
+                self.counts['appointments'] += len(page)
+                self.dispatch(page)
+        finally:
+            self.connection.close()
+        return self.counts
+
+    def window(self):
+        return Appointment.objects.filter(date__gte=self.start, date__lt=self.end)
+
+    def pages(self):
+        #keyset pages of (pk, date, patient id) in date order
+        appointments = self.window().order_by('date', 'pk').values_list('pk', 'date', 'patient_id')
+        last = None
+        while True:
+            page = appointments
+            if last is not None:
+                page = page.filter(Q(date__gt=last[1]) | Q(date=last[1], pk__gt=last[0]))
+            page = list(page[:self.pageSize])
+            if not page:
+                return
+            last = page[-1]
+            yield page
+
+    def dispatch(self, page):
+        patientIds = set(patientId for pk, date, patientId in page if patientId is not None)
+        appointments = set(page)
+        if patientIds:
+            appointments.update(self.window().filter(patient_id__in=patientIds).values_list('pk', 'date', 'patient_id'))
+
+        self.claim(appointments)
+        claimed = (AppointmentReminder.objects.filter(claimToken=self.token, status=AppointmentReminder.PENDING,
+                                                      appointment_id__in=[pk for pk, date, patientId in appointments])
+                   .order_by('appointmentDate').values_list(*REMINDER_FIELDS))
+        self.counts['claimed'] += len(claimed)
+
+        byRecipient = {}
+        skipped = []
+        for row in claimed:
+            email = (row[3] or '').strip().lower()
+            if email:
+                byRecipient.setdefault(email, []).append(row)
+            else:
+                skipped.append(row[0])
+
+        sent, failed = [], {}
+        for email, rows in byRecipient.items():
+            error = self.send(self.message(email, rows))
+            if error is None:
+                sent.extend(row[0] for row in rows)
+            else:
+                failed.setdefault(error, []).extend(row[0] for row in rows)
+        self.record(sent, failed, skipped)
+
+    def claim(self, appointments):
+        #takes this run's reminders for a set of (pk, date, patient id) appointments
+        now = timezone.now()
+        current = set((pk, date) for pk, date, patientId in appointments)
+        #reminders for the time an appointment had before it was moved are left alone
+        existing = dict(((appointmentId, date), pk) for pk, appointmentId, date
+                        in AppointmentReminder.objects.filter(appointment_id__in=[pk for pk, date in current])
+                        .values_list('pk', 'appointment_id', 'appointmentDate')
+                        if (appointmentId, date) in current)
+        new = [AppointmentReminder(appointment_id=pk, appointmentDate=date, claimToken=self.token, claimedAt=now)
+               for pk, date in current if (pk, date) not in existing]
+        try:
+            with transaction.atomic():
+                AppointmentReminder.objects.bulk_create(new)
+        except IntegrityError:
+            #another run got to some of them first, so they are inserted one at a time and theirs skipped
+            for reminder in new:
+                try:
+                    with transaction.atomic():
+                        reminder.save()
+                except IntegrityError:
+                    pass
+
+        if existing:
+            #the conditions are checked again by the update itself, so of two runs only one takes each
+            retry = (Q(status=AppointmentReminder.FAILED, attempts__lt=MAX_ATTEMPTS) |
+                     Q(status=AppointmentReminder.PENDING, claimedAt__lt=now - CLAIM_TIMEOUT))
+            (AppointmentReminder.objects.filter(retry, pk__in=list(existing.values()))
+             .update(status=AppointmentReminder.PENDING, claimToken=self.token, claimedAt=now))
+
+    def message(self, email, rows):
+        lines = ['Hello %s,' % (rows[0][4] or ''), '', 'This is a reminder of your upcoming appointments:', '']
+        for pk, date, description, recipient, firstName, doctorFirst, doctorLast in rows:
+            when = timezone.localtime(date).strftime('%A %B %d at %I:%M %p')
+            doctor = ' with Dr. %s %s' % (doctorFirst, doctorLast) if doctorLast else ''
+            lines.append('  %s%s: %s' % (when, doctor, description))
+        lines += ['', 'If you can no longer make it, please cancel from your HealthNet profile.']
+        return EmailMessage(SUBJECT, '\n'.join(lines), self.fromEmail, [email], connection=self.connection)
+
+    def send(self, message):
+        #sends one message, opening the connection again once if the server dropped it, and
+        #returns None or what went wrong
+        for attempt in range(2):
+            try:
+                self.connection.send_messages([message])
+                self.counts['messages'] += 1
+                return None
+            except smtplib.SMTPServerDisconnected as e:
+                error = e
+                self.connection.close()
+                try:
+                    self.connection.open()
+                except (smtplib.SMTPException, OSError) as e:
+                    error = e
+                    break
+            except (smtplib.SMTPException, OSError) as e:
+                error = e
+                break
+        return ('%s: %s' % (error.__class__.__name__, error))[:200]
+
+    def record(self, sent, failed, skipped):
+        now = timezone.now()
+        if sent:
+            AppointmentReminder.objects.filter(pk__in=sent).update(status=AppointmentReminder.SENT, sentAt=now, attempts=F('attempts') + 1, error='')
+            self.counts['sent'] += len(sent)
+        for error, reminderIds in failed.items():
+            AppointmentReminder.objects.filter(pk__in=reminderIds).update(status=AppointmentReminder.FAILED, attempts=F('attempts') + 1, error=error)
+            self.counts['failed'] += len(reminderIds)
+        if skipped:
+            AppointmentReminder.objects.filter(pk__in=skipped).update(status=AppointmentReminder.SKIPPED, error='the patient has no email address')
+            self.counts['skipped'] += len(skipped)
@@ -0,0 +1,79 @@
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from .models import ProfileInfo
+import base64, json
+
+"""
+The patient roster shown to doctors and nurses. The roster itself only lists names, so a page
+is read with one query that joins in just the user and profile rows. Everything else about a
+patient is shown in their detail panels, which the staff page fetches one patient at a time
+when a patient is chosen, joining in the rest of DETAIL_RELATED.
+
+Pages are ordered by last name, first name and then profile id, and are fetched by keyset
+instead of by offset. The cursor for the next page holds the sort values of the last patient on
+the current page and the next query asks for the patients that sort after it. The order is on
+the profile columns themselves, so the (lastName, firstName, id) index on ProfileInfo can serve
+both the order and the seek without sorting the hospital's patients first. Every patient has a
+profile (migration 0038 gave one to those that didn't), so the join loses nobody. This costs
+the same on the last page of a 20000 patient hospital as on the first, and a patient being
+added while someone pages through doesn't shift rows between pages. Cursors are handed to the
+browser as an opaque urlsafe string.
+"""
+
+ROSTER_PAGE_SIZE = 50
+
+ROSTER_RELATED = ('user', 'profileInfo')
+
+DETAIL_RELATED = ('user', 'userInfo', 'profileInfo', 'medicalInfo', 'hospital', 'doctor__user')
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def profileIdColumn():
+    #ordering on profileInfo__id would be rewritten to the patient's own profileInfo_id column,
+    #which the index can't serve, so the profile table's id is named directly
+    quote = connection.ops.quote_name
+    return RawSQL('%s.%s' % (quote(ProfileInfo._meta.db_table), quote('id')), ())
+
+
+def rosterQuery(patients):
+    return patients.filter(profileInfo__isnull=False).select_related(*ROSTER_RELATED).order_by(
+        'profileInfo__lastName', 'profileInfo__firstName', profileIdColumn().asc())
+
+
+def encodeCursor(patient):
+    key = json.dumps([patient.profileInfo.lastName, patient.profileInfo.firstName, patient.profileInfo_id])
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii')
+
+
+def decodeCursor(cursor):
+    try:
+        lastName, firstName, pk = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        if not isinstance(lastName, str) or not isinstance(firstName, str):
+            raise ValueError(cursor)
+        return lastName, firstName, int(pk)
+    except (TypeError, ValueError, UnicodeError):
+        raise InvalidCursor(cursor)
+
+
+def rosterPage(patients, cursor=None, pageSize=ROSTER_PAGE_SIZE):
+    #returns one page of patients and the cursor for the page after it, which is None on the last page
+    query = rosterQuery(patients)
+    if cursor:
+        lastName, firstName, pk = decodeCursor(cursor)
+        #the lastName >= bound on its own is what lets the index range scan start at the cursor
+        query = query.filter(Q(profileInfo__lastName__gte=lastName), (
+            Q(profileInfo__lastName__gt=lastName) |
+            Q(profileInfo__lastName=lastName, profileInfo__firstName__gt=firstName) |
+            Q(profileInfo__lastName=lastName, profileInfo__firstName=firstName, profileInfo__id__gt=pk)
+        ))
+
+    #one extra row is read to find out whether there is another page without a count query
+    page = list(query[:pageSize + 1])
+    if len(page) > pageSize:
+        page = page[:pageSize]
+        return page, encodeCursor(page[-1])
+    return page, None
@@ -0,0 +1,267 @@
+from array import array
+from .models import Patient
+from .indexes import LiveIndex
+import bisect, re, threading, time
+
+"""
+The patient search behind the search box on the staff page. It finds patients by any part of
+their first or last name, username, email or phone number, and ranks whole word matches above
+prefix matches above matches inside a word.
+
+Every indexed word is broken into trigrams, the three character pieces of the word with two
+spaces added in front, so "smith" gives "  s", " sm", "smi", "mit" and "ith". The trigrams are
+kept per hospital: each hospital has a posting list for every trigram, a sorted array of the
+ids of its patients with that trigram somewhere in their words. A query word of three
+characters or more needs all of its own trigrams, which finds it anywhere inside a word, and a
+shorter one needs the padded trigram, which only occurs at the start of a word.
+
+A nurse's search intersects the shortest few of their hospital's lists for the query and
+checks what is left against the stored words, which is also what decides the rank. Because the
+lists are per hospital a search costs the same on a million patients as on a thousand, as long
+as hospitals stay the same size. A doctor's own patients are listed too, and are few enough to
+be checked directly.
+
+Like the cohort index it is built from one query the first time it is used in a process and
+kept current by a LiveIndex from indexes.py. Saves to patients, their profiles and their users
+are applied once they are committed, and the index is rebuilt in the background once it is
+older than REBUILD_SECONDS.
+"""
+
+REBUILD_SECONDS = 300
+
+#this many of the shortest posting lists are intersected, the rest is checked word by word
+INTERSECT_LISTS = 3
+
+#candidates beyond this many aren't ranked, which only happens for very short queries
+CANDIDATE_LIMIT = 20000
+
+WORD = re.compile(r'[^\s,]+')
+PHONE = re.compile(r'^[\d\-().+]+$')
+NOT_DIGIT = re.compile(r'\D')
+
+#the columns read for every patient, in the order Document takes them
+ROW_FIELDS = ('pk', 'doctor_id', 'hospital_id', 'profileInfo__firstName', 'profileInfo__lastName',
+              'user__username', 'profileInfo__email', 'profileInfo__phoneNumber')
+
+
+def normalizeWord(word):
+    #lowercases a word, and reduces one made of phone number characters to just its digits
+    word = word.lower()
+    if PHONE.match(word) and any(character.isdigit() for character in word):
+        return NOT_DIGIT.sub('', word)
+    return word
+
+
+def queryWords(query):
+    return [word for word in (normalizeWord(word) for word in WORD.findall(query or '')) if word]
+
+
+def trigrams(word):
+    padded = '  ' + word
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def queryTrigrams(word):
+    #a short word has to start an indexed word, a longer one can be anywhere in one
+    if len(word) < 3:
+        return set([('  ' + word)[-3:]])
+    return set(word[i:i + 3] for i in range(len(word) - 2))
+
+
+class Document(object):
+    __slots__ = ('patientId', 'doctorId', 'hospitalId', 'firstName', 'lastName', 'username', 'words')
+
+    def __init__(self, patientId, doctorId, hospitalId, firstName, lastName, username, email, phoneNumber):
+        self.patientId = patientId
+        self.doctorId = doctorId
+        self.hospitalId = hospitalId
+        self.firstName = firstName or ''
+        self.lastName = lastName or ''
+        self.username = username or ''
+        words = [self.firstName.lower(), self.lastName.lower(), self.username.lower()]
+        if email:
+            email = email.lower()
+            #the part before the @ on its own too, so searching a mailbox name ranks as a whole word
+            words += [email, email.split('@', 1)[0]]
+        if phoneNumber:
+            words.append(NOT_DIGIT.sub('', phoneNumber))
+        self.words = tuple(word for word in words if word)
+
+    def trigrams(self):
+        found = set()
+        for word in self.words:
+            found |= trigrams(word)
+        return found
+
+    def score(self, queryWords):
+        #3 for a whole word, 2 for the start of a word and 1 for inside one, summed over the
+        #query words, or None when a query word isn't found at all
+        total = 0
+        for queryWord in queryWords:
+            best = 0
+            for word in self.words:
+                if word == queryWord:
+                    best = 3
+                    break
+                if word.startswith(queryWord):
+                    best = 2
+                elif best < 1 and len(queryWord) >= 3 and queryWord in word:
+                    best = 1
+            if not best:
+                return None
+            total += best
+        return total
+
+
+def addPosting(postings, key, patientId):
+    posting = postings.get(key)
+    if posting is None:
+        postings[key] = array('i', [patientId])
+    elif not posting or posting[-1] < patientId:
+        posting.append(patientId)
+    else:
+        position = bisect.bisect_left(posting, patientId)
+        if position == len(posting) or posting[position] != patientId:
+            posting.insert(position, patientId)
+
+
+def removePosting(postings, key, patientId):
+    posting = postings.get(key)
+    if posting is None:
+        return
+    position = bisect.bisect_left(posting, patientId)
+    if position < len(posting) and posting[position] == patientId:
+        del posting[position]
+        if not posting:
+            del postings[key]
+
+
+def contains(posting, patientId):
+    position = bisect.bisect_left(posting, patientId)
+    return position < len(posting) and posting[position] == patientId
+
+
+class SearchIndex(object):
+
+    def __init__(self):
+        self.documents = {}
+        #hospital id to trigram to posting list. Patients without a hospital are under None.
+        self.trigrams = {}
+        self.doctors = {}
+        self.builtAt = time.time()
+        self.lock = threading.RLock()
+
+    @classmethod
+    def build(cls):
+        return cls.fromRows(Patient.objects.order_by('pk').values_list(*ROW_FIELDS).iterator())
+
+    @classmethod
+    def fromRows(cls, rows):
+        #the ids are collected into lists and each list is sorted and packed into an array once
+        #at the end, rather than inserting into the arrays one patient at a time
+        index = cls()
+        trigramIds = {}
+        doctorIds = {}
+        for row in rows:
+            document = Document(*row)
+            index.documents[document.patientId] = document
+            hospitalTrigrams = trigramIds.setdefault(document.hospitalId, {})
+            for trigram in document.trigrams():
+                hospitalTrigrams.setdefault(trigram, []).append(document.patientId)
+            if document.doctorId is not None:
+                doctorIds.setdefault(document.doctorId, []).append(document.patientId)
+
+        for hospitalId, hospitalTrigrams in trigramIds.items():
+            index.trigrams[hospitalId] = packPostings(hospitalTrigrams)
+        index.doctors = packPostings(doctorIds)
+        return index
+
+    def add(self, row):
+        document = Document(*row)
+        with self.lock:
+            self.remove(document.patientId)
+            self.documents[document.patientId] = document
+            hospitalTrigrams = self.trigrams.setdefault(document.hospitalId, {})
+            for trigram in document.trigrams():
+                addPosting(hospitalTrigrams, trigram, document.patientId)
+            if document.doctorId is not None:
+                addPosting(self.doctors, document.doctorId, document.patientId)
+
+    def remove(self, patientId):
+        with self.lock:
+            document = self.documents.pop(patientId, None)
+            if document is None:
+                return
+            hospitalTrigrams = self.trigrams[document.hospitalId]
+            for trigram in document.trigrams():
+                removePosting(hospitalTrigrams, trigram, patientId)
+            if document.doctorId is not None:
+                removePosting(self.doctors, document.doctorId, patientId)
+
+    def search(self, query, doctorId=None, hospitalIds=(), limit=20):
+        #the best matches among a doctor's patients, or a nurse's hospitals' patients, as
+        #(score, document) pairs best first
+        words = queryWords(query)
+        if not words:
+            return []
+
+        with self.lock:
+            if doctorId is not None:
+                #a doctor's own patients are few enough to check against their words directly
+                candidates = self.doctors.get(doctorId, ())
+            else:
+                candidates = []
+                for hospitalId in hospitalIds:
+                    candidates.extend(self.hospitalCandidates(hospitalId, words))
+
+            matches = []
+            for patientId in candidates[:CANDIDATE_LIMIT]:
+                document = self.documents[patientId]
+                score = document.score(words)
+                if score is not None:
+                    matches.append((score, document))
+
+        matches.sort(key=lambda match: (-match[0], match[1].lastName.lower(), match[1].firstName.lower(), match[1].patientId))
+        return matches[:limit]
+
+    def hospitalCandidates(self, hospitalId, words):
+        #the patients of one hospital that have every trigram of the query, from intersecting
+        #the shortest few of their posting lists
+        hospitalTrigrams = self.trigrams.get(hospitalId, {})
+        lists = []
+        for word in words:
+            for trigram in queryTrigrams(word):
+                posting = hospitalTrigrams.get(trigram)
+                if posting is None:
+                    return []
+                lists.append(posting)
+        lists.sort(key=len)
+
+        candidates = lists[0]
+        for posting in lists[1:INTERSECT_LISTS]:
+            candidates = [patientId for patientId in candidates if contains(posting, patientId)]
+        return list(candidates)
+
+
+def packPostings(ids):
+    postings = {}
+    for key, patientIds in ids.items():
+        patientIds.sort()
+        postings[key] = array('i', patientIds)
+    return postings
+
+
+def applyChanges(index, patientIds):
+    rows = dict((row[0], row) for row in Patient.objects.filter(pk__in=patientIds).values_list(*ROW_FIELDS))
+    for patientId in patientIds:
+        if patientId in rows:
+            index.add(rows[patientId])
+        else:
+            index.remove(patientId)
+
+
+live = LiveIndex(SearchIndex, applyChanges, REBUILD_SECONDS)
+
+
+def getIndex():
+    return live.get()
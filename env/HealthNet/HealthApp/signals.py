@@ -0,0 +1,90 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from .models import Appointment, Patient, ProfileInfo, MedicalInfo, Doctor, Hospital
+from . import availability, caches, indexes
+
+"""
+Signal receivers that keep the derived data in sync with the models it is built from. They
+are connected when the app is loaded by HealthAppConfig.ready in apps.py.
+"""
+
+
+#every saved appointment is counted into its doctor's day. The doctor and time an appointment
+#was read with are kept on the instance, so when it is saved again it can be taken out of the
+#day it was on if it has moved without reading the row back first. Changes that skip these
+#receivers aren't seen: queryset updates, and instances read with only() or defer(), whose
+#signals are sent for a deferred subclass. 0050_fill_doctorday_rollups counts the days again.
+
+@receiver(post_init, sender=Appointment)
+def appointmentLoaded(sender, instance, **kwargs):
+    instance._savedBooking = (instance.doctor_id, instance.date) if instance.pk is not None else None
+
+
+@receiver(post_save, sender=Appointment)
+def appointmentSaved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_savedBooking', None)
+    current = (instance.doctor_id, instance.date)
+    instance._savedBooking = current
+    if previous == current:
+        return
+    if previous is not None:
+        availability.appointmentRemoved(previous[0], previous[1], instance.pk)
+    availability.appointmentAdded(instance.doctor_id, instance.date)
+
+
+@receiver(post_delete, sender=Appointment)
+def appointmentDeleted(sender, instance, **kwargs):
+    availability.appointmentRemoved(instance.doctor_id, instance.date, instance.pk)
+
+
+#the cohort and search indexes read patients with their profile and medical rows, and the
+#search index also reads the username. The indexes are only told which rows changed here, and
+#read the patients again once the change is committed, see indexes.py.
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def patientChanged(sender, instance, **kwargs):
+    indexes.noteChanges(patientIds=[instance.pk])
+
+
+@receiver(post_save, sender=ProfileInfo)
+def profileInfoSaved(sender, instance, **kwargs):
+    indexes.noteChanges(profileInfoIds=[instance.pk])
+
+
+@receiver(post_save, sender=MedicalInfo)
+def medicalInfoSaved(sender, instance, **kwargs):
+    indexes.noteChanges(medicalInfoIds=[instance.pk])
+
+
+@receiver(post_save, sender=User)
+def userSaved(sender, instance, created=False, update_fields=None, **kwargs):
+    #a new user has no patient yet, which is indexed when it is saved, and every login saves
+    #last_login, which no index shows
+    if created or (update_fields is not None and set(update_fields) == set(['last_login'])):
+        return
+    indexes.noteChanges(userIds=[instance.pk])
+
+
+#the doctor and hospital lists in caches.py show doctors' names, so a change to a doctor, their
+#user or a hospital moves the reference stamp and every process reads its lists again
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def userReferenceChanged(sender, instance, created=False, update_fields=None, **kwargs):
+    #every login saves last_login, which the lists don't show, and a new user isn't a doctor yet
+    if created or (update_fields is not None and set(update_fields) == set(['last_login'])):
+        return
+    if Doctor.objects.filter(user=instance).exists():
+        caches.bumpReferenceStamp()
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_save, sender=Hospital)
+@receiver(post_delete, sender=Hospital)
+def referenceChanged(sender, instance, **kwargs):
+    caches.bumpReferenceStamp()
@@ -1,2 +1,1039 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection, transaction, IntegrityError
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from unittest import mock, skipIf
+from . import availability, caches, cohorts, dashboard, geo, indexes, middleware, prescriptions, reminders, roster, searchindex, views
+from .management.commands import importpatients
+from .conditions import maskFor
+from .medications import getCatalog
+from .views import staffExportHeader
+from .models import (Patient, Doctor, Nurse, Hospital, Appointment, AppointmentReminder, DoctorDay, UserInfo, ProfileInfo,
+                     MedicalInfo, MedTest, MedTestResult, Prescription, CurrentMedication, SLOT_MINUTES, FIRST_HOUR, LAST_HOUR,
+                     RESULT_CHUNK_SIZE)
+import base64, csv, datetime, importlib, io, json, multiprocessing, os, random, smtplib, tempfile, time
 
+"""
+Tests for HealthApp. Run them with: python manage.py test HealthApp
+
+The helpers below make the smallest set of rows each kind of account needs. Every user is made
+with the password 'pw' so the test client can log in as them.
+"""
+
+#session, user, staff member, the patient with its related rows and their current medications
+DETAIL_QUERIES = 5
+
+#session, user, staff member and the page of patients with their users and profiles
+ROSTER_QUERIES = 4
+
+
+@override_settings(PASSWORD_HASHERS=('django.contrib.auth.hashers.MD5PasswordHasher',))
+class HealthAppTestCase(TestCase):
+    #the default hasher is slow on purpose, which adds up over the hundreds of accounts some tests make
+    pass
+
+
+def makeDoctor(username):
+    user = User.objects.create_user(username, password='pw', first_name=username.title(), last_name='Doctor')
+    user.is_staff = True
+    user.save()
+    return Doctor.objects.create(user=user)
+
+
+def makeNurse(username, hospital=None):
+    user = User.objects.create_user(username, password='pw')
+    user.is_staff = True
+    user.save()
+    return Nurse.objects.create(user=user, hospital=hospital)
+
+
+def makePatient(username, doctor=None, hospital=None, lastName='Smith', **profile):
+    user = User.objects.create_user(username, password='pw')
+    fields = dict(firstName=username.title(), lastName=lastName, address='1 Main St', city='Rochester', state='NY',
+                  zipcode='14620', phoneNumber='5551234', email='%s@example.com' % username)
+    fields.update(profile)
+    return Patient.objects.create(user=user, doctor=doctor, hospital=hospital,
+                                  userInfo=UserInfo.objects.create(policyNumber='P' + username, provider='Provider', groupNumber='G'),
+                                  profileInfo=ProfileInfo.objects.create(**fields),
+                                  medicalInfo=MedicalInfo.objects.create())
+
+
+class StaffExportTests(HealthAppTestCase):
+
+    def setUp(self):
+        self.doctor = makeDoctor('doctor')
+        strong = Hospital.objects.create(name='Strong')
+        highland = Hospital.objects.create(name='Highland')
+        makeNurse('nurse', 'Strong')
+        alice = makePatient('alice', self.doctor, strong)
+        alice.medicalInfo.setConditions(['diabetes'])
+        alice.medicalInfo.save()
+        makePatient('bob', self.doctor, highland)
+        makePatient('carol', makeDoctor('other'), strong)
+
+    def export(self, username):
+        self.client.login(username=username, password='pw')
+        response = self.client.get('/staffExport/')
+        self.assertTrue(response.streaming)
+        return list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+
+    def testDoctorExportsTheirPatients(self):
+        rows = self.export('doctor')
+        self.assertEqual(rows[0], views.staffExportHeader())
+        byUsername = dict((row[0], dict(zip(rows[0], row))) for row in rows[1:])
+        self.assertEqual(sorted(byUsername), ['alice', 'bob'])
+        self.assertEqual(byUsername['alice']['Diabetes'], 'True')
+        self.assertEqual(byUsername['alice']['Allergies'], 'False')
+        self.assertEqual(byUsername['bob']['Hospital'], 'Highland')
+
+    def testNurseExportsTheirHospital(self):
+        self.assertEqual(sorted(row[0] for row in self.export('nurse')[1:]), ['alice', 'carol'])
+
+    def testPatientIsTurnedAway(self):
+        self.client.login(username='alice', password='pw')
+        self.assertRedirects(self.client.get('/staffExport/'), '/alice/profile', fetch_redirect_response=False)
+
+    def testChunksCoverEveryPatient(self):
+        found = [patient.user.username for patient in views.iterPatientChunks(Patient.objects.all(), chunkSize=2)]
+        self.assertEqual(found, ['alice', 'bob', 'carol'])
+
+
+class AppointmentEventsTests(HealthAppTestCase):
+
+    def setUp(self):
+        self.doctor = makeDoctor('doctor')
+        self.patient = makePatient('patient', self.doctor)
+        self.when = timezone.now().replace(hour=10, minute=0, second=0, microsecond=0) + datetime.timedelta(days=1)
+        Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=self.when, description='checkup')
+        #an appointment that has lost its patient must not show up on anyone else's calendar
+        Appointment.objects.create(doctor=self.doctor, patient=None, date=self.when + datetime.timedelta(hours=1), description='orphan')
+
+    def events(self, username):
+        self.client.login(username=username, password='pw')
+        window = {'start': (self.when - datetime.timedelta(days=1)).date().isoformat(),
+                  'end': (self.when + datetime.timedelta(days=1)).date().isoformat()}
+        response = self.client.get('/appointmentEvents/', window)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode())
+
+    def testPatientSeesOwnAppointments(self):
+        self.assertEqual([event['description'] for event in self.events('patient')], ['checkup'])
+
+    def testDoctorSeesTheirAppointments(self):
+        self.assertEqual(sorted(event['description'] for event in self.events('doctor')), ['checkup', 'orphan'])
+
+    def testNurseSeesNothing(self):
+        makeNurse('nurse', 'Strong')
+        self.assertEqual(self.events('nurse'), [])
+
+    def testLoginRequired(self):
+        response = self.client.get('/appointmentEvents/', {'start': '2020-01-01', 'end': '2020-01-02'})
+        self.assertEqual(response.status_code, 302)
+
+
+class CreateAppointmentTests(HealthAppTestCase):
+
+    def setUp(self):
+        self.doctor = makeDoctor('doctor')
+        makePatient('first', self.doctor)
+        makePatient('second', self.doctor)
+        self.booking = {'doctor': 'doctor', 'date': (timezone.localtime(timezone.now()).date() + datetime.timedelta(days=1)).isoformat(),
+                        'time': '10:00', 'description': 'checkup'}
+
+    def book(self, username):
+        self.client.login(username=username, password='pw')
+        response = self.client.post('/createAppForm/', self.booking)
+        self.assertEqual(response.status_code, 302)
+        return [(message.tags, str(message)) for message in get_messages(response.wsgi_request)]
+
+    def testBookingIsConfirmed(self):
+        self.assertEqual([tags for tags, text in self.book('first')], ['success'])
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def testTakenSlotIsReported(self):
+        self.book('first')
+        self.client.logout()
+        found = self.book('second')
+        self.assertEqual([tags for tags, text in found], ['error'])
+        self.assertIn('already booked', found[0][1])
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def testIncompleteFormIsReported(self):
+        del self.booking['time']
+        self.assertEqual([tags for tags, text in self.book('first')], ['error'])
+
+
+class BookingTests(HealthAppTestCase):
+
+    def setUp(self):
+        self.doctor = makeDoctor('doctor')
+        self.patient = makePatient('patient', self.doctor)
+        self.day = timezone.localtime(timezone.now()).date() + datetime.timedelta(days=1)
+        self.when = availability.slotTime(self.day, 40)
+
+    def rollups(self, days=2):
+        return availability.dayRollups(self.doctor.pk, self.day, self.day + datetime.timedelta(days=days))
+
+    def testSlotTakenWhileWaitingForTheLockIsRefused(self):
+        realGetDoctorDay = availability.getDoctorDay
+        raced = []
+
+        def otherBookingFirst(doctorId, day):
+            #another request books the slot between this one's first look and it taking the lock
+            realGetDoctorDay(doctorId, day)
+            if not raced:
+                raced.append(True)
+                Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=self.when, description='other')
+
+        with mock.patch.object(availability, 'getDoctorDay', otherBookingFirst):
+            self.assertRaises(availability.SlotUnavailable, availability.bookAppointment, self.doctor, self.patient, self.when, 'checkup')
+        self.assertEqual(list(Appointment.objects.values_list('description', flat=True)), ['other'])
+
+    def testBookedSlotIsNoLongerFree(self):
+        availability.bookAppointment(self.doctor, self.patient, self.when, 'checkup')
+        self.assertFalse(availability.isSlotFree(self.doctor, self.when))
+        self.assertNotIn(self.when, availability.freeSlots(self.doctor, self.day, days=1))
+        self.assertRaises(availability.SlotUnavailable, availability.bookAppointment, self.doctor, self.patient, self.when, 'again')
+
+    def testOnlyWorkingHoursAreOffered(self):
+        slots = availability.freeSlots(self.doctor, self.day, days=1)
+        self.assertEqual(len(slots), (LAST_HOUR - FIRST_HOUR) * 60 // SLOT_MINUTES)
+        self.assertEqual(timezone.localtime(slots[0]).hour, FIRST_HOUR)
+        self.assertEqual(timezone.localtime(slots[-1]).hour, LAST_HOUR - 1)
+
+    def testRollupsFollowAppointmentsThatMoveOrGo(self):
+        first = availability.bookAppointment(self.doctor, self.patient, self.when, 'first')
+        later = availability.slotTime(self.day, 50)
+        availability.bookAppointment(self.doctor, self.patient, later, 'second')
+        self.assertEqual(self.rollups(), [(self.day, 2, 40, 50, 2 * SLOT_MINUTES)])
+
+        first.date = availability.slotTime(self.day + datetime.timedelta(days=1), 37)
+        first.save()
+        self.assertEqual(self.rollups(), [(self.day, 1, 50, 50, SLOT_MINUTES),
+                                          (self.day + datetime.timedelta(days=1), 1, 37, 37, SLOT_MINUTES)])
+        self.assertTrue(availability.isSlotFree(self.doctor, self.when))
+
+        first.delete()
+        self.assertEqual(self.rollups(), [(self.day, 1, 50, 50, SLOT_MINUTES)])
+
+    def testSavingWithoutAMoveLeavesTheRollupsAlone(self):
+        availability.bookAppointment(self.doctor, self.patient, self.when, 'checkup')
+        appointment = Appointment.objects.get()
+        appointment.description = 'follow up'
+        #only the update itself, the appointment isn't read back to see whether it moved
+        with self.assertNumQueries(1):
+            appointment.save()
+        self.assertEqual(self.rollups(), [(self.day, 1, 40, 40, SLOT_MINUTES)])
+
+    def testMovingAnAppointmentThatWasReadBack(self):
+        availability.bookAppointment(self.doctor, self.patient, self.when, 'checkup')
+        appointment = Appointment.objects.get()
+        appointment.date = availability.slotTime(self.day, 56)
+        appointment.save()
+        self.assertEqual(self.rollups(), [(self.day, 1, 56, 56, SLOT_MINUTES)])
+
+    def testDriftIsLoggedRatherThanHidden(self):
+        appointment = availability.bookAppointment(self.doctor, self.patient, self.when, 'checkup')
+        DoctorDay.objects.filter(doctor=self.doctor, day=self.day).update(appointmentCount=0)
+        with self.assertLogs('HealthApp.availability', 'ERROR'):
+            appointment.delete()
+        self.assertEqual(self.rollups(), [])
+
+
+class ConditionLookupTests(HealthAppTestCase):
+
+    def setUp(self):
+        for username, keys in (('none', []), ('asthmatic', ['allergies']), ('both', ['allergies', 'diabetes']), ('diabetic', ['diabetes'])):
+            patient = makePatient(username)
+            patient.medicalInfo.setConditions(keys)
+            patient.medicalInfo.save()
+
+    def usernames(self, **lookup):
+        return sorted(Patient.objects.filter(**lookup).values_list('user__username', flat=True))
+
+    def testHasAnyMatchesPatientsWithOneOfTheConditions(self):
+        self.assertEqual(self.usernames(medicalInfo__conditions__hasany=maskFor(['allergies', 'diabetes'])), ['asthmatic', 'both', 'diabetic'])
+        self.assertEqual(self.usernames(medicalInfo__conditions__hasany=maskFor(['cancer'])), [])
+
+    def testHasAllMatchesPatientsWithEveryCondition(self):
+        self.assertEqual(self.usernames(medicalInfo__conditions__hasall=maskFor(['allergies', 'diabetes'])), ['both'])
+        self.assertEqual(self.usernames(medicalInfo__conditions__hasall=maskFor(['diabetes'])), ['both', 'diabetic'])
+
+
+class CohortIndexTests(HealthAppTestCase):
+
+    def setUp(self):
+        cohorts.live.reset()
+        self.addCleanup(cohorts.live.reset)
+        self.doctor = makeDoctor('doctor')
+        self.patient = makePatient('patient', self.doctor)
+
+    def count(self, **filters):
+        return cohorts.popcount(cohorts.getIndex().select(filters))
+
+    def testStaleIndexKeepsAnsweringWhileItIsRebuilt(self):
+        index = cohorts.getIndex()
+        index.builtAt = time.time() - cohorts.REBUILD_SECONDS - 1
+        with mock.patch.object(indexes.threading, 'Thread') as thread, mock.patch.object(cohorts.CohortIndex, 'build') as build:
+            self.assertIs(cohorts.getIndex(), index)
+            self.assertIs(cohorts.getIndex(), index)
+        self.assertFalse(build.called)
+        thread.assert_called_once_with(target=cohorts.live.rebuild, daemon=True)
+        self.assertTrue(cohorts.live.rebuilding)
+
+    def testChangesDuringARebuildAreReplayed(self):
+        index = cohorts.getIndex()
+        #what a rebuild reads before the patient below moves to NJ
+        readEarly = cohorts.CohortIndex.build()
+        index.builtAt = time.time() - cohorts.REBUILD_SECONDS - 1
+        with mock.patch.object(indexes.threading, 'Thread'):
+            cohorts.getIndex()
+
+        profile = self.patient.profileInfo
+        profile.state = 'NJ'
+        profile.save()
+        indexes.applyPendingChanges()
+
+        with mock.patch.object(cohorts.CohortIndex, 'build', return_value=readEarly), mock.patch.object(indexes, 'connection'):
+            cohorts.live.rebuild()
+        self.assertIs(cohorts.live.index, readEarly)
+        self.assertFalse(cohorts.live.rebuilding)
+        self.assertEqual(self.count(state=['NJ']), 1)
+        self.assertEqual(self.count(state=['NY']), 0)
+
+    def testChangesWaitForTheTransactionToEnd(self):
+        cohorts.getIndex()
+        profile = self.patient.profileInfo
+        profile.state = 'NJ'
+        #the test itself runs in a transaction, so the save is still uncommitted here
+        profile.save()
+        self.assertEqual(self.count(state=['NJ']), 0)
+        indexes.applyPendingChanges()
+        self.assertEqual(self.count(state=['NJ']), 1)
+
+    def testRolledBackPatientsAreNotIndexed(self):
+        cohorts.getIndex()
+        try:
+            with transaction.atomic():
+                makePatient('phantom', self.doctor)
+                raise IntegrityError('rolled back')
+        except IntegrityError:
+            pass
+        indexes.applyPendingChanges()
+        self.assertEqual(self.count(doctor=[self.doctor.pk]), 1)
+
+    def testChangedRowsAreLookedUpTogether(self):
+        other = makePatient('other', self.doctor)
+        cohorts.getIndex()
+        for patient in (self.patient, other):
+            patient.profileInfo.save()
+            patient.medicalInfo.save()
+        #one query finds the patients behind the four rows, and one reads them again
+        with self.assertNumQueries(2):
+            indexes.applyPendingChanges()
+
+    def testRequestAppliesItsChanges(self):
+        cohorts.getIndex()
+        self.client.post('/login/', {'username': 'nobody', 'password': 'pw'})
+        profile = self.patient.profileInfo
+        profile.state = 'NJ'
+        profile.save()
+        self.client.get('/login/')
+        self.assertEqual(self.count(state=['NJ']), 1)
+
+
+class SearchIndexTests(HealthAppTestCase):
+
+    def setUp(self):
+        searchindex.live.reset()
+        self.addCleanup(searchindex.live.reset)
+        self.doctor = makeDoctor('doctor')
+        self.strong = Hospital.objects.create(name='Strong')
+        highland = Hospital.objects.create(name='Highland')
+        makeNurse('nurse', 'Strong')
+        makePatient('p1', self.doctor, self.strong, lastName='Ashlee')
+        makePatient('p2', self.doctor, highland, lastName='Lee')
+        makePatient('p3', makeDoctor('other'), self.strong, lastName='Leeson')
+        #built up front so the searches below are the ones a warm process runs
+        searchindex.getIndex()
+        caches.getReferenceLists()
+
+    def search(self, username, query):
+        self.client.login(username=username, password='pw')
+        response = self.client.get('/patientSearch/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [match['username'] for match in json.loads(response.content.decode())]
+
+    def testWholeWordsRankAbovePrefixesAboveInfixes(self):
+        matches = searchindex.getIndex().search('lee', hospitalIds=[hospital.pk for hospital in Hospital.objects.all()])
+        self.assertEqual([(score, document.username) for score, document in matches], [(3, 'p2'), (2, 'p3'), (1, 'p1')])
+
+    def testDoctorSearchesTheirOwnPatients(self):
+        self.assertEqual(self.search('doctor', 'lee'), ['p2', 'p1'])
+
+    def testNurseSearchesTheirHospitalsPatients(self):
+        self.assertEqual(self.search('nurse', 'lee'), ['p3', 'p1'])
+
+    def testPatientsCannotSearch(self):
+        self.client.login(username='p1', password='pw')
+        self.assertEqual(self.client.get('/patientSearch/', {'q': 'lee'}).status_code, 403)
+
+    def testSavedProfilesAreSearchedAgain(self):
+        searchindex.getIndex()
+        profile = Patient.objects.get(user__username='p1').profileInfo
+        profile.lastName = 'Brown'
+        profile.save()
+        indexes.applyPendingChanges()
+        self.assertEqual(self.search('doctor', 'brown'), ['p1'])
+        self.assertEqual(self.search('doctor', 'ashlee'), [])
+
+    def testNewPatientsAreSearchedOnceCommitted(self):
+        searchindex.getIndex()
+        makePatient('p4', self.doctor, self.strong, lastName='Leeward')
+        self.assertEqual(self.search('nurse', 'leeward'), [])
+        indexes.applyPendingChanges()
+        self.assertEqual(self.search('nurse', 'leeward'), ['p4'])
+
+
+class NearestHospitalTests(HealthAppTestCase):
+
+    def setUp(self):
+        Hospital.objects.create(name='Strong', latitude=43.1226, longitude=-77.6247)
+        Hospital.objects.create(name='Rochester General', latitude=43.1914, longitude=-77.5856)
+        Hospital.objects.create(name='Bellevue', latitude=40.7391, longitude=-73.9757)
+        Hospital.objects.create(name='Unmapped')
+        caches.getReferenceLists()
+
+    def nearest(self, **params):
+        response = self.client.get('/nearestHospitals/', params)
+        self.assertEqual(response.status_code, 200)
+        return [hospital['name'] for hospital in json.loads(response.content.decode())]
+
+    def testNearestHospitalsComeFirst(self):
+        self.assertEqual(self.nearest(zipcode='14620', k=3), ['Strong', 'Rochester General', 'Bellevue'])
+        self.assertEqual(self.nearest(zipcode='14620-1234', k=1), ['Strong'])
+
+    def testZipcodeMissingFromTheTableUsesItsPrefix(self):
+        table = geo.getZipTable()
+        self.assertNotIn(14642, table.codes)
+        self.assertEqual(table.lookup('14642'), table.prefixes[146])
+        self.assertEqual(sorted(self.nearest(zipcode='14642', k=2)), ['Rochester General', 'Strong'])
+
+    def testUnknownPrefixIsNotFound(self):
+        self.assertEqual(self.client.get('/nearestHospitals/', {'zipcode': '90210'}).status_code, 404)
+
+    def testBadZipcodeIsRejected(self):
+        self.assertEqual(self.client.get('/nearestHospitals/', {'zipcode': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get('/nearestHospitals/', {'zipcode': '14620', 'k': 'x'}).status_code, 400)
+
+    def testPatientsProfileZipcodeIsTheDefault(self):
+        makePatient('patient', zipcode='14620')
+        self.client.login(username='patient', password='pw')
+        self.assertEqual(self.nearest(k=1), ['Strong'])
+
+    def testTreeAgreesWithBruteForce(self):
+        generator = random.Random(22)
+        points = [(generator.uniform(-60, 70), generator.uniform(-180, 180)) for i in range(500)]
+        tree = geo.KDTree(points, list(range(len(points))))
+        for query in range(50):
+            latitude, longitude = generator.uniform(-60, 70), generator.uniform(-180, 180)
+            x, y, z = geo.toPoint(latitude, longitude)
+            distances = sorted((sum((a - b) ** 2 for a, b in zip((x, y, z), geo.toPoint(*point))), i) for i, point in enumerate(points))
+            for k in (1, 5, geo.LEAF_SIZE * 3):
+                found = tree.nearest(latitude, longitude, k)
+                self.assertEqual([i for i, miles in found], [i for distance, i in distances[:k]])
+                for (i, miles), (distance, j) in zip(found, distances):
+                    self.assertAlmostEqual(miles, geo.chordToMiles(distance))
+
+    def testTreeHandlesFewerPointsThanAsked(self):
+        tree = geo.KDTree([(43.1, -77.6)], ['only'])
+        self.assertEqual([i for i, miles in tree.nearest(0, 0, 3)], ['only'])
+        self.assertEqual(geo.KDTree([], []).nearest(0, 0, 3), [])
+
+
+class MedicationAutocompleteTests(HealthAppTestCase):
+
+    def setUp(self):
+        self.doctor = makeDoctor('doctor')
+        self.patient = makePatient('patient', self.doctor)
+        self.client.login(username='doctor', password='pw')
+
+    def testPrescribeFormPointsAtTheSearch(self):
+        response = self.client.get('/patientDetail/%d/' % self.patient.pk)
+        self.assertContains(response, 'data-autocomplete-url="/medications/"')
+        #the staff page is what reads the attribute
+        self.assertContains(self.client.get('/doctor/staffProfile/'), '[data-autocomplete-url]')
+
+    def testSearchSuggestsCatalogNames(self):
+        name = getCatalog().names[0]
+        matches = json.loads(self.client.get('/medications/', {'q': name[:3]}).content.decode())
+        self.assertIn(name, [match['name'] for match in matches])
+
+
+class RosterTests(HealthAppTestCase):
+
+    def setUp(self):
+        self.doctor = makeDoctor('doctor')
+        self.other = makeDoctor('other')
+        self.hospital = Hospital.objects.create(name='Strong')
+        #three pages worth, with repeated names so the ties are broken by id across page edges
+        for i in range(roster.ROSTER_PAGE_SIZE * 2 + 10):
+            makePatient('patient%d' % i, self.doctor, self.hospital, lastName='Last%d' % (i % 7), firstName='First%d' % (i % 3))
+        makePatient('someoneelse', self.other, self.hospital)
+        self.client.login(username='doctor', password='pw')
+
+    def pages(self):
+        #every roster page of the doctor, with the queries each took
+        pages, url = [], '/doctor/staffProfile/'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(([patient.user.username for patient in response.context['patients']], len(queries)))
+            nextCursor = response.context['nextCursor']
+            url = '/doctor/staffProfile/?cursor=%s' % nextCursor if nextCursor else None
+        return pages
+
+    def testPagesCoverTheRosterInNameOrder(self):
+        pages = self.pages()
+        self.assertEqual([len(names) for names, queryCount in pages], [roster.ROSTER_PAGE_SIZE, roster.ROSTER_PAGE_SIZE, 10])
+        expected = [patient.user.username for patient in
+                    sorted(Patient.objects.filter(doctor=self.doctor).select_related('user', 'profileInfo'),
+                           key=lambda patient: (patient.profileInfo.lastName, patient.profileInfo.firstName, patient.profileInfo_id))]
+        self.assertEqual([name for names, queryCount in pages for name in names], expected)
+
+    def testPagesTakeAFixedNumberOfQueries(self):
+        self.assertEqual(set(queryCount for names, queryCount in self.pages()), set([ROSTER_QUERIES]))
+        #the same for a doctor with a single patient
+        self.client.login(username='other', password='pw')
+        with self.assertNumQueries(ROSTER_QUERIES):
+            self.client.get('/other/staffProfile/')
+
+    def testDetailPanelsTakeAFixedNumberOfQueries(self):
+        patient = Patient.objects.filter(doctor=self.doctor).first()
+        with self.assertNumQueries(DETAIL_QUERIES):
+            response = self.client.get('/patientDetail/%d/' % patient.pk)
+        self.assertEqual(response.status_code, 200)
+
+    def testBadCursorIsRejected(self):
+        self.assertEqual(self.client.get('/doctor/staffProfile/?cursor=nonsense').status_code, 400)
+        cursor = base64.urlsafe_b64encode(json.dumps([None, 'x', 1]).encode('utf-8')).decode('ascii')
+        self.assertEqual(self.client.get('/doctor/staffProfile/?cursor=%s' % cursor).status_code, 400)
+
+
+class PatientReadTests(HealthAppTestCase):
+
+    def setUp(self):
+        self.patient = makePatient('patient', makeDoctor('doctor'), Hospital.objects.create(name='Strong'))
+        self.client.login(username='patient', password='pw')
+
+    def testPatientIsReadWithOneQuery(self):
+        with self.assertNumQueries(1):
+            patient = views.getPatient(self.patient.user_id)
+            self.assertEqual(patient.profileInfo.firstName, 'Patient')
+            self.assertEqual(patient.doctor.user.username, 'doctor')
+            self.assertEqual(patient.hospital.name, 'Strong')
+
+    def testSaveIsSeenOnTheNextRead(self):
+        profile = self.patient.profileInfo
+        profile.firstName = 'Changed'
+        profile.save()
+        self.assertEqual(views.getPatient(self.patient.user_id).profileInfo.firstName, 'Changed')
+
+    def testProfileStaysWithinItsBudget(self):
+        #the first visit also reads the doctor and hospital lists
+        for visit in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get('/patient/profile/').status_code, 200)
+            self.assertLessEqual(len(queries), settings.QUERY_BUDGETS['profile'])
+
+
+class ReferenceListTests(HealthAppTestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, caches, '_reference', caches._reference)
+        caches._reference = caches.ReferenceLists(None, 0, False, (), ())
+
+    def hospitalNames(self):
+        return [hospital.name for hospital in caches.getHospitalList()]
+
+    def testStampIsOnlyLookedAtOncePerWindow(self):
+        caches.getReferenceLists()
+        with self.assertNumQueries(0):
+            caches.getReferenceLists()
+        later = time.time() + caches.REFERENCE_MAX_AGE + 1
+        with mock.patch.object(caches.time, 'time', return_value=later):
+            #the lists were read just after the stamp was first set, so they are read once more
+            caches.getReferenceLists()
+        with mock.patch.object(caches.time, 'time', return_value=later + caches.REFERENCE_MAX_AGE + 1):
+            with self.assertNumQueries(1):
+                caches.getReferenceLists()
+
+    def testOwnChangeIsSeenOnTheNextRead(self):
+        self.assertEqual(self.hospitalNames(), [])
+        Hospital.objects.create(name='Highland')
+        self.assertEqual(self.hospitalNames(), ['Highland'])
+
+    def testBumpIsSeenByAnotherProcess(self):
+        self.hospitalNames()
+        #another process has its own copy of the lists, which a fresh one stands in for here
+        otherProcess = caches.ReferenceLists(None, 0, False, (), ())
+        with mock.patch.object(caches, '_reference', otherProcess):
+            self.assertEqual(self.hospitalNames(), [])
+            otherProcess = caches._reference
+
+        Hospital.objects.create(name='Highland')
+        self.assertEqual(self.hospitalNames(), ['Highland'])
+
+        with mock.patch.object(caches, '_reference', otherProcess):
+            #until its window is over the other process keeps what it read
+            self.assertEqual(self.hospitalNames(), [])
+            with mock.patch.object(caches.time, 'time', return_value=time.time() + caches.REFERENCE_MAX_AGE + 1):
+                self.assertEqual(self.hospitalNames(), ['Highland'])
+
+    def testPerProcessCacheIsWarnedAbout(self):
+        self.assertEqual(caches.checkSharedCache(), [])
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([warning.id for warning in caches.checkSharedCache()], ['HealthApp.W001'])
+
+
+class RegisterTests(HealthAppTestCase):
+
+    def setUp(self):
+        makeDoctor('doctor')
+        Hospital.objects.create(name='Strong')
+
+    def form(self, **changes):
+        data = dict(username='newbie', password='secret', policyNumber='P1', provider='Provider', groupNumber='G1',
+                    firstName='New', middleName='', lastName='Patient', address='1 Main St', city='Rochester', state='NY',
+                    dateOfBirth='1980-01-02', zipcode='14620', phoneNumber='5551234', email='newbie@example.com',
+                    eName='Someone', ePhoneNumber='5554321', hospital='Strong', doctor='doctor', diabetes='on')
+        data.update(changes)
+        return data
+
+    def rowCounts(self):
+        return [model.objects.count() for model in (User, UserInfo, ProfileInfo, MedicalInfo, Patient)]
+
+    def testRegisteredPatientIsLoggedIn(self):
+        response = self.client.post('/register/', self.form())
+        self.assertRedirects(response, '/newbie/profile', fetch_redirect_response=False)
+        patient = Patient.objects.select_related('user', 'medicalInfo', 'doctor__user', 'hospital').get(user__username='newbie')
+        self.assertEqual(int(self.client.session['_auth_user_id']), patient.user_id)
+        self.assertTrue(patient.user.check_password('secret'))
+        self.assertEqual((patient.doctor.user.username, patient.hospital.name), ('doctor', 'Strong'))
+        self.assertTrue(patient.medicalInfo.hasCondition('diabetes'))
+        self.assertEqual(self.client.get('/newbie/profile/').status_code, 200)
+
+    def testInvalidFormLeavesNoRows(self):
+        before = self.rowCounts()
+        response = self.client.post('/register/', self.form(email='not an email'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.rowCounts(), before)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def testUnknownDoctorLeavesNoRows(self):
+        before = self.rowCounts()
+        self.assertEqual(self.client.post('/register/', self.form(doctor='nobody')).status_code, 200)
+        self.assertEqual(self.rowCounts(), before)
+
+    def testFailureAfterTheUserLeavesNoRows(self):
+        before = self.rowCounts()
+        with mock.patch.object(Patient.objects, 'create', side_effect=IntegrityError('patient insert failed')):
+            self.assertRaises(IntegrityError, self.client.post, '/register/', self.form())
+        self.assertEqual(self.rowCounts(), before)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+
+class ImportPatientsTests(HealthAppTestCase):
+
+    def setUp(self):
+        makeDoctor('doctor')
+        Hospital.objects.create(name='Strong')
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def row(self, username, **cells):
+        values = dict((column, '') for column in staffExportHeader())
+        values.update({'Username': username, 'Password': 'pw', 'Firstname': username.title(), 'Lastname': 'Smith',
+                       'Address': '1 Main St', 'City': 'Rochester', 'State': 'NY', 'Zipcode': '14620',
+                       'Phone Number': '5551234', 'Email': '%s@example.com' % username,
+                       'Policy Number': 'P' + username, 'Provider': 'Provider', 'Group Number': 'G',
+                       'Emergency Contact': 'Pat Smith', 'Emergency Phone': '5554321', 'Hospital': 'Strong', 'Doctor': 'doctor'})
+        values.update(cells)
+        return [values[column] for column in staffExportHeader() + ['Password']]
+
+    def runImport(self, rows):
+        path = os.path.join(self.directory.name, 'patients.csv')
+        with open(path, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(staffExportHeader() + ['Password'])
+            writer.writerows(rows)
+        errors = io.StringIO()
+        call_command('importpatients', path, workers=0, stdout=io.StringIO(), stderr=errors)
+        return errors.getvalue()
+
+    def testGoodRowsAreImported(self):
+        self.assertEqual(self.runImport([self.row('alice'), self.row('bob')]), '')
+        patient = Patient.objects.get(user__username='bob')
+        self.assertEqual(patient.doctor.user.username, 'doctor')
+        self.assertEqual(patient.hospital.name, 'Strong')
+        self.assertTrue(patient.user.check_password('pw'))
+
+    def testRaggedRowsAreReported(self):
+        errors = self.runImport([self.row('alice')[:5], self.row('bob') + ['extra'], self.row('carol')])
+        self.assertIn('line 2: the row does not have the same number of columns', errors)
+        self.assertIn('line 3: the row does not have the same number of columns', errors)
+        self.assertEqual(list(User.objects.filter(username__in=['alice', 'bob', 'carol']).values_list('username', flat=True)), ['carol'])
+
+    def testBadRowsAreReportedAndTheRestImported(self):
+        makePatient('taken')
+        errors = self.runImport([self.row('taken'), self.row('nodoctor', Doctor='nobody'), self.row('dave')])
+        self.assertIn('line 2: Username: a user with that username already exists.', errors)
+        self.assertIn('line 3: Doctor: nobody does not exist.', errors)
+        self.assertTrue(Patient.objects.filter(user__username='dave').exists())
+
+    def testOtherIntegrityErrorsAreReportedPerRow(self):
+        realInsert = importpatients.Command.insert
+
+        def insert(command, rows):
+            #a row the database turns down for some reason other than its username
+            if any(row.username == 'broken' for row in rows):
+                raise IntegrityError('broken row')
+            realInsert(command, rows)
+
+        with mock.patch.object(importpatients.Command, 'insert', insert):
+            errors = self.runImport([self.row('erin'), self.row('broken'), self.row('frank')])
+        self.assertIn('line 3: could not be inserted: broken row', errors)
+        self.assertNotIn('free ids', errors)
+        self.assertEqual(Patient.objects.filter(user__username__in=['erin', 'frank']).count(), 2)
+
+
+class QueryBudgetTests(HealthAppTestCase):
+
+    def setUp(self):
+        middleware.resetQueryStats()
+        self.addCleanup(middleware.resetQueryStats)
+        makePatient('patient')
+        self.client.login(username='patient', password='pw')
+
+    def testRequestsAreRecordedByUrlName(self):
+        self.client.get('/appointmentEvents/', {'start': '2016-01-01', 'end': '2016-01-08'})
+        entry = middleware.queryStats()['appointmentEvents']
+        self.assertEqual(entry['requests'], 1)
+        self.assertGreater(entry['queries'], 0)
+        self.assertEqual(entry['overBudget'], 0)
+
+    @override_settings(QUERY_BUDGETS={'appointmentEvents': 1})
+    def testRequestOverBudgetIsLogged(self):
+        with self.assertLogs('HealthApp.middleware', 'WARNING') as logs:
+            self.client.get('/appointmentEvents/', {'start': '2016-01-01', 'end': '2016-01-08'})
+        self.assertIn('appointmentEvents ran', logs.output[0])
+        self.assertEqual(middleware.queryStats()['appointmentEvents']['overBudget'], 1)
+
+    @override_settings(QUERY_BUDGETS={'appointmentEvents': 1}, QUERY_BUDGET_ACTION='raise')
+    def testRequestOverBudgetCanFail(self):
+        self.assertRaises(middleware.QueryBudgetExceeded, self.client.get, '/appointmentEvents/', {'start': '2016-01-01', 'end': '2016-01-08'})
+
+
+class MedTestResultTests(HealthAppTestCase):
+
+    def setUp(self):
+        self.doctor = makeDoctor('doctor')
+        makeDoctor('other')
+        makeNurse('nurse')
+        self.test = MedTest.objects.create(name='Blood panel', doctor=self.doctor, dateIssued=datetime.date(2016, 1, 4))
+        #random words so the body doesn't compress to almost nothing and really spans several chunks
+        generator = random.Random(18)
+        words = ['hemoglobin', 'platelets', 'normal', 'high', 'low', 'glucose', '\u00b5mol/L', 'sodium']
+        self.text = ' '.join(generator.choice(words) + str(generator.randint(0, 999)) for i in range(RESULT_CHUNK_SIZE // 2))
+        self.test.setResult(self.text)
+
+    def testResultRoundTrips(self):
+        body = MedTestResult.objects.get(test=self.test)
+        self.assertEqual(body.getText(), self.text)
+        self.assertEqual(body.size, len(self.text.encode('utf-8')))
+        self.assertLess(body.compressedSize, body.size)
+        self.assertEqual(MedTest.objects.get(pk=self.test.pk).getResult(), self.text)
+
+    def testEmptyResultRoundTrips(self):
+        self.test.setResult('')
+        self.assertEqual(MedTest.objects.get(pk=self.test.pk).getResult(), '')
+
+    def testLargeResultIsStreamedInChunks(self):
+        body = MedTestResult.objects.get(test=self.test)
+        self.assertGreater(body.compressedSize, RESULT_CHUNK_SIZE)
+        chunks = list(body.iterBytes())
+        self.assertGreater(len(chunks), 1)
+        self.assertLessEqual(max(len(chunk) for chunk in chunks), RESULT_CHUNK_SIZE)
+        self.assertEqual(b''.join(chunks).decode('utf-8'), self.text)
+        #small chunks split multi-byte characters, which only join up again at the end
+        self.assertEqual(b''.join(body.iterBytes(chunkSize=7)), self.text.encode('utf-8'))
+
+    def download(self, username):
+        self.client.login(username=username, password='pw')
+        return self.client.get('/medTests/%d/result/' % self.test.pk, {'download': '1'})
+
+    def testOrderingDoctorCanDownload(self):
+        response = self.download('doctor')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(response['Content-Length']), len(self.text.encode('utf-8')))
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertEqual(b''.join(response.streaming_content).decode('utf-8'), self.text)
+
+    def testOthersCannotDownload(self):
+        self.assertEqual(self.download('other').status_code, 404)
+        self.assertRedirects(self.download('nurse'), '/nurse/profile', fetch_redirect_response=False)
+        self.client.logout()
+        self.assertRedirects(self.client.get('/medTests/%d/result/' % self.test.pk), '/login/', fetch_redirect_response=False)
+
+
+def makePrescription(medication, dosage='10mg'):
+    return Prescription(medicationCategory='test', medication=medication, dosage=dosage, frequency='daily',
+                        directions='with food', comments='')
+
+
+class PrescriptionHistoryTests(HealthAppTestCase):
+
+    def setUp(self):
+        self.doctor = makeDoctor('doctor')
+        self.patient = makePatient('patient', self.doctor)
+
+    def current(self):
+        return [(medication.medication, medication.dosage) for medication in prescriptions.currentMedications(self.patient)]
+
+    def testPrescribingAgainStopsThePreviousEntry(self):
+        first = prescriptions.prescribe(self.patient, self.doctor, makePrescription('lisinopril', '10mg'))
+        second = prescriptions.prescribe(self.patient, self.doctor, makePrescription('lisinopril', '20mg'))
+        first.refresh_from_db()
+        self.assertFalse(first.active)
+        self.assertIsNotNone(first.stopDate)
+        self.assertTrue(second.active)
+        self.assertEqual([entry.pk for entry in prescriptions.history(self.patient)], [second.pk, first.pk])
+        self.assertEqual(self.current(), [('lisinopril', '20mg')])
+
+    def testDiscontinueKeepsCurrentMedicationsInStep(self):
+        kept = prescriptions.prescribe(self.patient, self.doctor, makePrescription('lisinopril'))
+        stopped = prescriptions.prescribe(self.patient, self.doctor, makePrescription('metformin'))
+        prescriptions.discontinue(stopped)
+        self.assertEqual(self.current(), [('lisinopril', '10mg')])
+        self.assertFalse(CurrentMedication.objects.filter(prescription=stopped).exists())
+        self.assertTrue(CurrentMedication.objects.filter(prescription=kept).exists())
+        self.assertFalse(Prescription.objects.get(pk=stopped.pk).active)
+        self.assertRaises(prescriptions.NotActive, prescriptions.discontinue, stopped)
+
+
+class PrescriptionHistoryMigrationTests(TransactionTestCase):
+    #0045 is run forwards from the schema 0044 leaves, where patients still point at a single prescription
+
+    before = [('HealthApp', '0044_prescription_history')]
+    after = [('HealthApp', '0045_fill_prescription_history')]
+
+    def setUp(self):
+        self.addCleanup(self.migrateToLatest)
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        self.apps = executor.loader.project_state(self.before).apps
+
+    def migrateToLatest(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def makeOldPatient(self, username, prescription):
+        apps = self.apps
+        user = apps.get_model('auth', 'User').objects.create(username=username)
+        return apps.get_model('HealthApp', 'Patient').objects.create(
+            user=user, prescriptions=prescription,
+            userInfo=apps.get_model('HealthApp', 'UserInfo').objects.create(policyNumber='P', provider='P', groupNumber='G'),
+            profileInfo=apps.get_model('HealthApp', 'ProfileInfo').objects.create(firstName='F', lastName='L', address='A', city='C', state='NY',
+                                                                                  zipcode='14620', phoneNumber='5551234', email='e@example.com'),
+            medicalInfo=apps.get_model('HealthApp', 'MedicalInfo').objects.create())
+
+    def testLinksBecomeHistoryAndOrphansAreRetired(self):
+        OldPrescription = self.apps.get_model('HealthApp', 'Prescription')
+        fields = dict(medicationCategory='test', dosage='10mg', frequency='daily', directions='', comments='')
+        shared = OldPrescription.objects.create(medication='lisinopril', **fields)
+        orphan = OldPrescription.objects.create(medication='metformin', **fields)
+        alice = self.makeOldPatient('alice', shared)
+        bob = self.makeOldPatient('bob', shared)
+
+        MigrationExecutor(connection).migrate(self.after)
+
+        apps = MigrationExecutor(connection).loader.project_state(self.after).apps
+        History = apps.get_model('HealthApp', 'Prescription')
+        Current = apps.get_model('HealthApp', 'CurrentMedication')
+        #the shared prescription goes to the first patient and is copied for the second
+        self.assertEqual(History.objects.get(pk=shared.pk).patient_id, alice.pk)
+        self.assertEqual(sorted(History.objects.filter(active=True).values_list('patient_id', 'medication')),
+                         [(alice.pk, 'lisinopril'), (bob.pk, 'lisinopril')])
+        self.assertEqual(sorted(Current.objects.values_list('patient_id', 'medication')),
+                         [(alice.pk, 'lisinopril'), (bob.pk, 'lisinopril')])
+        retired = History.objects.get(pk=orphan.pk)
+        self.assertIsNone(retired.patient_id)
+        self.assertFalse(retired.active)
+
+        #an interrupted run is started again from the top, which must not add anything twice
+        fill = importlib.import_module('HealthApp.migrations.0045_fill_prescription_history')
+        fill.fillHistory(apps, mock.Mock(connection=connection))
+        self.assertEqual(History.objects.count(), 3)
+        self.assertEqual(Current.objects.count(), 2)
+
+
+class PrescriptionInteractionTests(HealthAppTestCase):
+
+    def setUp(self):
+        self.doctor = makeDoctor('doctor')
+        self.patient = makePatient('patient', self.doctor)
+        prescriptions.prescribe(self.patient, self.doctor, makePrescription('warfarin'))
+        self.client.login(username='doctor', password='pw')
+
+    def post(self, medication, **extra):
+        data = dict(medicationCategory='antifungals', medication=medication, dosage='10mg', frequency='daily', directions='d', comments='c')
+        data.update(extra)
+        return self.client.post('/patientDetail/%d/prescribe/' % self.patient.pk, data)
+
+    def testKnownPairIsRefused(self):
+        with self.assertRaises(prescriptions.InteractionsFound) as found:
+            prescriptions.prescribe(self.patient, self.doctor, makePrescription('fluconazole'))
+        self.assertEqual([(interaction.medication, interaction.other, interaction.severity) for interaction in found.exception.interactions],
+                         [('fluconazole', 'warfarin', 'major')])
+        self.assertFalse(Prescription.objects.filter(medication='fluconazole').exists())
+
+    def testConditionIsRefused(self):
+        self.patient.medicalInfo.setConditions(['kidneyDisease'])
+        self.patient.medicalInfo.save()
+        with self.assertRaises(prescriptions.InteractionsFound) as found:
+            prescriptions.prescribe(self.patient, self.doctor, makePrescription('gentamicin'))
+        self.assertEqual([interaction.other for interaction in found.exception.interactions], ['Kidney Disease'])
+
+    def testUnrelatedMedicationIsAllowed(self):
+        prescriptions.prescribe(self.patient, self.doctor, makePrescription('lisinopril'))
+        #and so is the same medication again, which replaces the entry rather than clashing with it
+        prescriptions.prescribe(self.patient, self.doctor, makePrescription('warfarin', '5mg'))
+        self.assertEqual(sorted(prescriptions.currentMedications(self.patient).values_list('medication', 'dosage')),
+                         [('lisinopril', '10mg'), ('warfarin', '5mg')])
+
+    def testViewAsksForAcknowledgement(self):
+        response = self.post('fluconazole')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(response.content.decode())['interactions'][0]['other'], 'warfarin')
+        self.assertEqual(self.post('fluconazole', acknowledge='1').status_code, 200)
+        self.assertTrue(CurrentMedication.objects.filter(patient=self.patient, medication='fluconazole').exists())
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class ReminderTests(HealthAppTestCase):
+
+    def setUp(self):
+        doctor = makeDoctor('doctor')
+        self.patient = makePatient('patient', doctor)
+        self.now = timezone.now()
+        for hours in (2, 5):
+            Appointment.objects.create(doctor=doctor, patient=self.patient, date=self.now + datetime.timedelta(hours=hours), description='checkup')
+
+    def dispatcher(self, connection=None):
+        return reminders.Dispatcher(connection=connection, now=self.now)
+
+    def testEachPatientGetsOneEmail(self):
+        counts = self.dispatcher().run()
+        self.assertEqual((counts['sent'], counts['messages']), (2, 1))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['patient@example.com'])
+
+    def testRunningAgainSendsNothing(self):
+        self.dispatcher().run()
+        counts = self.dispatcher().run()
+        self.assertEqual((counts['claimed'], counts['sent']), (0, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def testRemindersClaimedByAnotherRunAreLeftToIt(self):
+        other = self.dispatcher()
+        other.claim(set(other.window().values_list('pk', 'date', 'patient_id')))
+        counts = self.dispatcher().run()
+        self.assertEqual((counts['claimed'], counts['sent']), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+
+    def testFailedRemindersAreTriedAgain(self):
+        failing = mock.Mock()
+        failing.send_messages.side_effect = smtplib.SMTPRecipientsRefused({})
+        counts = self.dispatcher(failing).run()
+        self.assertEqual(counts['failed'], 2)
+        self.assertEqual(set(AppointmentReminder.objects.values_list('status', flat=True)), set([AppointmentReminder.FAILED]))
+
+        counts = self.dispatcher().run()
+        self.assertEqual(counts['sent'], 2)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+def loadDashboard(barrier, results):
+    #runs in a forked worker standing in for one of the site's processes
+    try:
+        computedBefore = dashboard.dashboardStats()['computed']
+        barrier.wait()
+        numbers = dashboard.getDashboard()
+        #a stale dashboard is worked out again in a background thread, which has to finish before
+        #this process exits
+        deadline = time.time() + dashboard.LOCK_SECONDS
+        while cache.get(dashboard.DASHBOARD_LOCK_KEY) is not None and time.time() < deadline:
+            time.sleep(dashboard.WAIT_INTERVAL)
+        results.put((numbers['patients'], dashboard.dashboardStats()['computed'] - computedBefore))
+    except Exception as e:
+        results.put(e)
+    finally:
+        connection.close()
+
+
+@skipIf(connection.vendor == 'sqlite' and connection.settings_dict['TEST']['NAME'] in (None, '', ':memory:'),
+        'the worker processes need a test database they can all open')
+@skipIf('fork' not in multiprocessing.get_all_start_methods(), 'the worker processes are forked')
+class DashboardCoalescingTests(TransactionTestCase):
+    #rows have to be committed for the worker processes to see them, which a TestCase never does
+
+    WORKERS = 8
+
+    def setUp(self):
+        cache.delete_many([dashboard.DASHBOARD_KEY, dashboard.DASHBOARD_LOCK_KEY])
+        doctor = makeDoctor('doctor')
+        for username in ('alice', 'bob', 'carol'):
+            makePatient(username, doctor)
+
+    def tearDown(self):
+        #the cache table isn't a model, so flushing the database between tests leaves it alone
+        cache.clear()
+
+    def stampede(self):
+        #every worker asks for the dashboard at once and reports what it was given and how many
+        #times it worked it out
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(self.WORKERS)
+        results = context.Queue()
+        #a forked worker must not share this process's database connection
+        connection.close()
+        workers = [context.Process(target=loadDashboard, args=(barrier, results)) for i in range(self.WORKERS)]
+        for worker in workers:
+            worker.start()
+        found = [results.get(timeout=60) for worker in workers]
+        for worker in workers:
+            worker.join()
+        for result in found:
+            if isinstance(result, Exception):
+                raise result
+        return found
+
+    def testColdDashboardIsWorkedOutOnceAcrossProcesses(self):
+        found = self.stampede()
+        self.assertEqual([patients for patients, computed in found], [3] * self.WORKERS)
+        self.assertEqual(sum(computed for patients, computed in found), 1)
+
+    def testStaleDashboardIsWorkedOutOnceAcrossProcesses(self):
+        numbers = dashboard.getDashboard()
+        dashboard.store(dict(numbers, computedAt=numbers['computedAt'] - dashboard.FRESH_SECONDS))
+        found = self.stampede()
+        self.assertEqual(sum(computed for patients, computed in found), 1)
+        self.assertGreater(cache.get(dashboard.DASHBOARD_KEY)['computedAt'], numbers['computedAt'])
@@ -1,13 +1,22 @@
-from django.shortcuts import render, redirect, render_to_response
-from django.http import HttpResponse, HttpResponseRedirect
+from django.shortcuts import render, redirect, render_to_response, get_object_or_404
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse, JsonResponse, HttpResponseBadRequest, HttpResponseNotAllowed, Http404
+from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.db.models import Q
 from django.template import Context
-from .models import Patient, Doctor, Nurse, Hospital, Appointment
-from .forms import BaseUserForm, UserForm, ProfileForm, MedicalForm, AppointmentForm
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import Patient, Doctor, Nurse, Hospital, Appointment, MedTest, MedTestResult, Prescription, SLOT_MINUTES, FIRST_HOUR, LAST_HOUR
+from .forms import BaseUserForm, UserForm, ProfileForm, MedicalForm, AppointmentForm, PrescriptionForm
+from .conditions import CONDITIONS
 from django.views.decorators.csrf import csrf_exempt
-import datetime, itertools, csv
+from . import availability, caches, cohorts, dashboard, geo, prescriptions, roster, searchindex
+from .middleware import queryStats as collectedQueryStats
+from .medications import getCatalog
+import datetime, itertools, csv, time
 
 """
 The views are essentially the intermediary step between the logic of the models and
@@ -80,34 +89,68 @@ STATE_CHOICES = (
     ('WY', 'Wyoming'),
 )
 
-diseaseChecks = [
-    'Allergies',
-    'Anemia',
-    'Arthritis',
-    'Chickenpox',
-    'Coxsackie',
-    'Diphtheria',
-    'Epilepsy',
-    'Frequent Colds',
-    'German Measles',
-    'High Blood Pressure',
-    'Influenza',
-    'Kidney Disease',
-    'Measles',
-    'Migraines',
-    'Mumps',
-    'Obesity',
-    'Pneumonia',
-    'Polio',
-    'Rheumatic Fever',
-    'Scarlatina',
-    'Scarlet Fever',
-    'Strokes',
-    'Syphilis',
-    'Tonsillitis',
-    'Tuberculosis',
-    'Whooping Cough'
-]
+#condition names shown as checkboxes during patient registration, taken from the registry
+diseaseChecks = [condition.label for condition in CONDITIONS]
+
+#the doctor calendar's month heatmap shades a day by how much of a FULL_DAY_MINUTES working day
+#is booked, in this many steps
+HEATMAP_LEVELS = 4
+FULL_DAY_MINUTES = (LAST_HOUR - FIRST_HOUR) * 60
+
+#number of patients pulled from the database at a time by the staff export. Each chunk is a
+#separate keyset query so memory use stays flat no matter how many patients are exported.
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo(object):
+    #csv.writer needs a file-like object to write to. Instead of buffering the rows this just
+    #hands each written line back so it can be streamed straight out to the client.
+    def write(self, value):
+        return value
+
+
+def getPatient(userId):
+    #the patient belonging to a user with their user, insurance, profile, medical record,
+    #hospital and doctor, all read with one joined query
+    return Patient.objects.select_related(*roster.DETAIL_RELATED).get(user_id=userId)
+
+
+def getStaffMember(user):
+    #returns the Doctor or Nurse object for a staff user along with the account type,
+    #or (None, None) when the user is neither
+    try:
+        return Doctor.objects.get(user=user), "Doctor"
+    except Doctor.DoesNotExist:
+        pass
+    try:
+        return Nurse.objects.get(user=user), "Nurse"
+    except Nurse.DoesNotExist:
+        return None, None
+
+
+def getVisiblePatients(staffMember, accountType):
+    #doctors see their own patients and nurses see every patient at their hospital
+    if accountType == "Doctor":
+        return Patient.objects.filter(doctor=staffMember)
+    elif accountType == "Nurse":
+        return Patient.objects.filter(hospital__name=staffMember.hospital)
+    return Patient.objects.none()
+
+
+def iterPatientChunks(patients, chunkSize=EXPORT_CHUNK_SIZE):
+    #walks a patient queryset in primary key order one chunk at a time. Each chunk is read with
+    #iterator() so the queryset never caches rows, and the next chunk starts after the last id
+    #seen instead of using an OFFSET that gets slower the further into the table it goes.
+    patients = patients.select_related('user', 'userInfo', 'profileInfo', 'medicalInfo', 'hospital', 'doctor__user').order_by('pk')
+    lastId = 0
+    while True:
+        count = 0
+        for patient in patients.filter(pk__gt=lastId)[:chunkSize].iterator():
+            count += 1
+            lastId = patient.pk
+            yield patient
+        if count < chunkSize:
+            return
 
 
 @csrf_exempt
@@ -115,7 +158,7 @@ def updateUser(request, username):
     if not request.user.is_authenticated():
         return redirect('/login/')
 
-    requestedPatient = Patient.objects.get(user=User.objects.get(username=username))
+    requestedPatient = getPatient(User.objects.get(username=username).pk)
     print(requestedPatient)
 
     return HttpResponseRedirect('/%s/profile' % request.user.username, {'patient': requestedPatient})
@@ -126,7 +169,7 @@ def export(request):
     if not request.user.is_authenticated():
         return HttpResponseRedirect(reverse('login'))
     else:
-        patient = Patient.objects.get(user=request.user)
+        patient = getPatient(request.user.pk)
 
     response = HttpResponse(content_type='text/csv')
     response['Content-Disposition'] = 'attachment; filename="MedicalInformation.csv"'
@@ -134,11 +177,262 @@ def export(request):
     writer = csv.writer(response)
     writer.writerow(['User Info:', 'Usename', patient.user.username, 'Policy Number', patient.userInfo.policyNumber, 'Provider', patient.userInfo.provider, 'Group Number', patient.userInfo.groupNumber])
     writer.writerow(['Profile Info:', 'Firstname', patient.profileInfo.firstName, 'Middlename', patient.profileInfo.middleName, 'LastName', patient.profileInfo.lastName, 'Address', patient.profileInfo.address, 'City', patient.profileInfo.city, 'State', patient.profileInfo.state, 'Date of Birth', patient.profileInfo.dateOfBirth, 'Zipcode', patient.profileInfo.zipcode, 'Phone Number', patient.profileInfo.phoneNumber, 'Email', patient.profileInfo.email, 'Emergency contact', patient.profileInfo.eName, 'Emergency Phone', patient.profileInfo.ePhoneNumber ])
-    writer.writerow(['Medical Info:', 'Allergies', patient.medicalInfo.allergies, 'Anemia', patient.medicalInfo.anemia, 'Arthritis', patient.medicalInfo.arthritis, 'Chickenpox', patient.medicalInfo.chickenpox, 'Coxsackie', patient.medicalInfo.coxsackie, 'Diphtheria', patient.medicalInfo.diphtheria, 'Epilepsy', patient.medicalInfo.epilepsy, 'Frequent Colds', patient.medicalInfo.frequentColds, 'German Measeles', patient.medicalInfo.germanMeasles, 'High Blood Pressure', patient.medicalInfo.highBloodPressure, 'Influenza', patient.medicalInfo.influenza, 'Kidney Disease', patient.medicalInfo.kidneyDisease, 'Measles', patient.medicalInfo.measles, 'Migraines', patient.medicalInfo.migraines, 'Mumps', patient.medicalInfo.mumps, 'Obesity', patient.medicalInfo.obesity, 'Pneumonia', patient.medicalInfo.pneumonia, 'Polio', patient.medicalInfo.polio, 'Rheumatic Fever', patient.medicalInfo.rheumaticFever, 'Scarlatina', patient.medicalInfo.scarlatina, 'Scarlet Fever', patient.medicalInfo.scarletFever, 'Strokes', patient.medicalInfo.strokes, 'Syphilis', patient.medicalInfo.syphilis, 'Tonsillitis', patient.medicalInfo.tonsillitis, 'Tuberculosis', patient.medicalInfo.tuberculosis, 'Whooping Cough', patient.medicalInfo.whoopingCough, 'Other', patient.medicalInfo.otherText])
+    medicalRow = ['Medical Info:']
+    for condition in CONDITIONS:
+        medicalRow += [condition.label, patient.medicalInfo.hasCondition(condition.key)]
+    writer.writerow(medicalRow + ['Other', patient.medicalInfo.otherText])
 
     return response
 
 
+def staffExportHeader():
+    return (['Username', 'Policy Number', 'Provider', 'Group Number',
+             'Firstname', 'Middlename', 'Lastname', 'Address', 'City', 'State', 'Date of Birth', 'Zipcode',
+             'Phone Number', 'Email', 'Emergency Contact', 'Emergency Phone', 'Hospital', 'Doctor'] +
+            diseaseChecks + ['Other'])
+
+
+def staffExportRow(patient):
+    #related rows are nullable on Patient so each one falls back to blanks when it is missing
+    userInfo = patient.userInfo
+    profileInfo = patient.profileInfo
+    medicalInfo = patient.medicalInfo
+    row = [patient.user.username]
+    row += [userInfo.policyNumber, userInfo.provider, userInfo.groupNumber] if userInfo else [''] * 3
+    if profileInfo:
+        row += [profileInfo.firstName, profileInfo.middleName, profileInfo.lastName, profileInfo.address,
+                profileInfo.city, profileInfo.state, profileInfo.dateOfBirth, profileInfo.zipcode,
+                profileInfo.phoneNumber, profileInfo.email, profileInfo.eName, profileInfo.ePhoneNumber]
+    else:
+        row += [''] * 12
+    row.append(patient.hospital.name if patient.hospital else '')
+    row.append(patient.doctor.user.username if patient.doctor else '')
+    if medicalInfo:
+        row += [medicalInfo.hasCondition(condition.key) for condition in CONDITIONS]
+        row.append(medicalInfo.otherText)
+    else:
+        row += [''] * (len(diseaseChecks) + 1)
+    return row
+
+
+@csrf_exempt
+def staffExport(request):
+    #streams one csv row per patient the logged in doctor or nurse can see. The rows are generated
+    #lazily while the response is being sent so the whole file is never held in memory.
+    if not request.user.is_authenticated():
+        return HttpResponseRedirect(reverse('login'))
+
+    staffMember, accountType = getStaffMember(request.user)
+    if staffMember is None:
+        return HttpResponseRedirect('/%s/profile' % request.user.username)
+
+    writer = csv.writer(Echo())
+    rows = itertools.chain([staffExportHeader()], (staffExportRow(patient) for patient in iterPatientChunks(getVisiblePatients(staffMember, accountType))))
+    response = StreamingHttpResponse((writer.writerow(row) for row in rows), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="PatientRoster.csv"'
+
+    return response
+
+
+def parseCalendarBound(value):
+    #FullCalendar sends the edges of the visible window as either a date or a datetime string
+    if not value:
+        return None
+    bound = parse_datetime(value)
+    if bound is None:
+        day = parse_date(value)
+        if day is None:
+            return None
+        bound = datetime.datetime.combine(day, datetime.time.min)
+    if timezone.is_naive(bound):
+        bound = timezone.make_aware(bound, timezone.get_current_timezone())
+    return bound
+
+
+@csrf_exempt
+def appointmentEvents(request):
+    #json event source for the calendar. Only the appointments inside the window the calendar is
+    #currently showing are returned, so the page itself never has to carry any appointment data.
+    if not request.user.is_authenticated():
+        return HttpResponseRedirect(reverse('login'))
+
+    start = parseCalendarBound(request.GET.get('start'))
+    end = parseCalendarBound(request.GET.get('end'))
+    if start is None or end is None:
+        return HttpResponseBadRequest('start and end are required')
+
+    #resolve the doctor or patient id first so the window query can use the (doctor, date) or
+    #(patient, date) index directly instead of joining through the user table
+    doctorId = Doctor.objects.filter(user=request.user).values_list('pk', flat=True).first()
+    if doctorId is not None:
+        appointments = Appointment.objects.filter(doctor_id=doctorId)
+    else:
+        patientId = Patient.objects.filter(user=request.user).values_list('pk', flat=True).first()
+        #nurses and admins have no calendar of their own. Filtering on a None id would match
+        #every appointment without a patient, so they get nothing instead.
+        if patientId is None:
+            return JsonResponse([], safe=False)
+        appointments = Appointment.objects.filter(patient_id=patientId)
+    appointments = appointments.filter(date__gte=start, date__lt=end).order_by('date')
+
+    events = []
+    for apt in appointments.values('pk', 'doctor__user__username', 'patient__user__username', 'date', 'description').iterator():
+        startTime = timezone.localtime(apt['date']).strftime('%Y-%m-%dT%H:%M')
+        events.append({
+            'id': apt['pk'],
+            'pk': apt['pk'],
+            #a doctor's agenda shows whose appointment it is
+            'title': (apt['patient__user__username'] or 'Apt') if doctorId is not None else 'Apt',
+            'start': startTime,
+            'end': startTime,
+            'doctor': apt['doctor__user__username'],
+            'patient': apt['patient__user__username'],
+            'description': apt['description'],
+        })
+
+    return JsonResponse(events, safe=False)
+
+
+@csrf_exempt
+def doctorDays(request):
+    #the day by day load of a doctor for the calendar window, read from the DoctorDay rollups:
+    #how many appointments, the first and last booked times, the booked minutes and a heatmap
+    #level from 0 to HEATMAP_LEVELS - 1. Days with nothing booked are left out.
+    if not request.user.is_authenticated():
+        return HttpResponseRedirect(reverse('login'))
+
+    start = parseCalendarBound(request.GET.get('start'))
+    end = parseCalendarBound(request.GET.get('end'))
+    if start is None or end is None:
+        return HttpResponseBadRequest('start and end are required')
+
+    doctorId = Doctor.objects.filter(user=request.user).values_list('pk', flat=True).first()
+    if doctorId is None:
+        return JsonResponse({'error': 'doctors only'}, status=403)
+
+    days = []
+    for day, count, firstSlot, lastSlot, bookedMinutes in availability.dayRollups(doctorId, timezone.localtime(start).date(), timezone.localtime(end).date()):
+        days.append({
+            'day': day.isoformat(),
+            'count': count,
+            'first': slotClock(firstSlot),
+            'last': slotClock(lastSlot + 1) if lastSlot is not None else None,
+            'bookedMinutes': bookedMinutes,
+            'level': min(HEATMAP_LEVELS - 1, bookedMinutes * HEATMAP_LEVELS // FULL_DAY_MINUTES),
+        })
+    return JsonResponse(days, safe=False)
+
+
+def slotClock(slot):
+    #the HH:MM a slot starts at, or None
+    if slot is None:
+        return None
+    minutes = slot * SLOT_MINUTES
+    return '%02d:%02d' % (minutes // 60 % 24, minutes % 60)
+
+
+@csrf_exempt
+def cohortSearch(request):
+    #filters the patients a doctor or nurse can see by hospital, doctor, state and condition and
+    #returns how many match, how the matches break down over every facet and the first few of them
+    if not request.user.is_authenticated():
+        return HttpResponseRedirect(reverse('login'))
+
+    staffMember, accountType = getStaffMember(request.user)
+    if staffMember is None:
+        return JsonResponse({'error': 'staff only'}, status=403)
+
+    try:
+        limit = min(int(request.GET.get('limit', 50)), 500)
+    except ValueError:
+        return HttpResponseBadRequest('limit must be a number')
+
+    index = cohorts.getIndex()
+    conditionMode = 'all' if request.GET.get('conditionMode') == 'all' else 'any'
+    matches = index.select(cohorts.parseFilters(request.GET), conditionMode, index.scopeFor(staffMember, accountType))
+    counts = index.facetCounts(matches)
+
+    patientIds = list(cohorts.iterBits(matches, limit))
+    patients = (Patient.objects.filter(pk__in=patientIds).order_by('pk')
+                .values('pk', 'user__username', 'profileInfo__firstName', 'profileInfo__lastName'))
+
+    return JsonResponse({
+        'count': cohorts.popcount(matches),
+        'facets': counts,
+        'labels': {
+            'hospital': dict(Hospital.objects.filter(pk__in=counts['hospital'].keys()).values_list('pk', 'name')),
+            'doctor': dict((pk, '%s %s' % (first, last)) for pk, first, last in Doctor.objects.filter(pk__in=counts['doctor'].keys()).values_list('pk', 'user__first_name', 'user__last_name')),
+        },
+        'patients': [{'id': patient['pk'], 'username': patient['user__username'],
+                      'name': '%s %s' % (patient['profileInfo__firstName'] or '', patient['profileInfo__lastName'] or '')}
+                     for patient in patients],
+    })
+
+
+@csrf_exempt
+def patientSearch(request):
+    #the search box on the staff page, ranking the doctor's own patients or the patients at the
+    #nurse's hospital by how well their name, username, email or phone number matches q
+    if not request.user.is_authenticated():
+        return HttpResponseRedirect(reverse('login'))
+
+    staffMember, accountType = getStaffMember(request.user)
+    if staffMember is None:
+        return JsonResponse({'error': 'staff only'}, status=403)
+
+    try:
+        limit = min(int(request.GET.get('limit', 20)), 100)
+    except ValueError:
+        return HttpResponseBadRequest('limit must be a number')
+
+    index = searchindex.getIndex()
+    if accountType == "Doctor":
+        matches = index.search(request.GET.get('q', ''), doctorId=staffMember.pk, limit=limit)
+    else:
+        hospitalIds = [hospital.pk for hospital in caches.getHospitalList() if hospital.name == staffMember.hospital]
+        matches = index.search(request.GET.get('q', ''), hospitalIds=hospitalIds, limit=limit)
+
+    return JsonResponse([{'id': document.patientId, 'username': document.username, 'score': score,
+                          'name': '%s %s' % (document.firstName, document.lastName)}
+                         for score, document in matches], safe=False)
+
+
+def nearestHospitals(request):
+    #the hospitals closest to a zipcode, for suggesting one during registration. A logged in
+    #patient who leaves out the zipcode gets the ones nearest the zipcode on their profile.
+    try:
+        k = min(int(request.GET.get('k', 3)), 20)
+    except ValueError:
+        return HttpResponseBadRequest('k must be a number')
+
+    zipcode = request.GET.get('zipcode')
+    if zipcode is None and request.user.is_authenticated():
+        zipcode = Patient.objects.filter(user=request.user).values_list('profileInfo__zipcode', flat=True).first()
+    if geo.normalizeZipcode(zipcode) is None:
+        return HttpResponseBadRequest('zipcode must be five digits')
+
+    nearest = geo.nearestHospitals(zipcode, k)
+    if nearest is None:
+        return JsonResponse({'error': 'unknown zipcode'}, status=404)
+    return JsonResponse([{'id': hospital.pk, 'name': hospital.name, 'miles': round(miles, 1)} for hospital, miles in nearest], safe=False)
+
+
+@csrf_exempt
+def medicationSearch(request):
+    #autocomplete for the medication field, matching catalog names that start with q
+    if not request.user.is_authenticated():
+        return HttpResponseRedirect(reverse('login'))
+
+    try:
+        limit = min(int(request.GET.get('limit', 10)), 50)
+    except ValueError:
+        return HttpResponseBadRequest('limit must be a number')
+
+    catalog = getCatalog()
+    matches = catalog.search(request.GET.get('q', ''), limit)
+    return JsonResponse([{'name': name, 'categories': catalog.categoriesFor(name)} for name in matches], safe=False)
+
+
 @csrf_exempt
 def createApp(request):
     if not request.user.is_authenticated():
@@ -148,23 +442,57 @@ def createApp(request):
         form = AppointmentForm(request.POST)
         if form.is_valid():
             cleanData = form.cleaned_data
-            apt = Appointment(
-				doctor=cleanData['doctor'],
-				userName = request.user.username,
-				date=cleanData['date'] + "T" + cleanData['time'],
-				description=cleanData['description']
-			)
-            apt.save()
+            try:
+                patient = Patient.objects.get(user=request.user)
+                doctor = Doctor.objects.get(user__username=cleanData['doctor'])
+            except (Patient.DoesNotExist, Doctor.DoesNotExist):
+                messages.error(request, 'Appointments can only be booked by a patient with one of our doctors.')
+                return HttpResponseRedirect('/%s/profile/' % request.user.username)
+            when = parseCalendarBound(cleanData['date'] + "T" + cleanData['time'])
+            if when is None:
+                messages.error(request, 'The appointment was not booked because its date or time could not be read.')
+                return HttpResponseRedirect('/%s/profile/' % request.user.username)
+            #the slot is checked and taken inside the same locked transaction that saves the
+            #appointment, so a slot that was just booked by someone else is refused
+            try:
+                availability.bookAppointment(doctor, patient, when, cleanData['description'])
+                messages.success(request, 'Your appointment with Dr. %s is booked.' % doctor.user.last_name)
+            except availability.SlotUnavailable:
+                messages.error(request, 'Dr. %s is already booked at that time, please pick another.' % doctor.user.last_name)
+        else:
+            messages.error(request, 'The appointment was not booked, every field is needed.')
 
     return HttpResponseRedirect('/%s/profile/' % request.user.username)
 
 
+@csrf_exempt
+def doctorAvailability(request, username):
+    #lists the free appointment slots of a doctor for the days starting at the start parameter
+    if not request.user.is_authenticated():
+        return HttpResponseRedirect(reverse('login'))
+
+    try:
+        doctor = Doctor.objects.get(user__username=username)
+    except Doctor.DoesNotExist:
+        return JsonResponse({'error': 'unknown doctor'}, status=404)
+
+    start = parse_date(request.GET.get('start', '')) or timezone.localtime(timezone.now()).date()
+    try:
+        days = min(max(int(request.GET.get('days', 7)), 1), 31)
+    except ValueError:
+        return HttpResponseBadRequest('days must be a number')
+
+    slots = availability.freeSlots(doctor, start, days)
+    return JsonResponse({'doctor': username, 'slotMinutes': SLOT_MINUTES, 'free': [timezone.localtime(slot).strftime('%Y-%m-%dT%H:%M') for slot in slots]})
+
+
 @csrf_exempt
 def deleteApp(request, id):
     if not request.user.is_authenticated():
         return redirect('/login/')
 
-    Appointment.objects.filter(pk=id).delete()
+    #only the patient or the doctor on the appointment can remove it
+    Appointment.objects.filter(Q(patient__user=request.user) | Q(doctor__user=request.user), pk=id).delete()
 
     return HttpResponseRedirect('/%s/profile' % request.user.username)
 
@@ -229,41 +557,31 @@ def register(request):
         medicalForm = MedicalForm(data=request.POST)
 
         #The forms are checked to determine if they are valid. This is where required fields are checked.
-        if  userForm.is_valid() and profileForm.is_valid() and medicalForm.is_valid():
-
-            #creating the user object
-            user = baseUserForm.save()
-            user.set_password(user.password)
-
-            #all adjusted values must be followed by a save call.
-            user.save()
-
-            patientUserInfo = userForm.save()
-            patientProfileInfo = profileForm.save()
-            patientMedicalInfo = medicalForm.save()
-
-            patient = Patient(user=user, userInfo = patientUserInfo, profileInfo=patientProfileInfo, medicalInfo=patientMedicalInfo)
-
-            patient.user.save()
-            patient.userInfo.save()
-            patient.profileInfo.save()
-            patient.medicalInfo.save()
-
-            patient.save()
-
-            patient.hospital = Hospital.objects.get(name=request.POST['hospital'])
-            userDoctor = User.objects.get(username=request.POST['doctor'])
-            patient.doctor = Doctor.objects.get(user=userDoctor)
-            patient.save()
-
-            patient.user.first_name = patient.profileInfo.firstName
-            patient.user.last_name = patient.profileInfo.lastName
-            patient.user.email = patient.profileInfo.email
-            patient.user.save()
-
+        #The hospital and doctor are picked out of the cached drop down lists rather than queried for.
+        reference = caches.getReferenceLists()
+        hospitalId = next((hospital.pk for hospital in reference.hospitals if hospital.name == request.POST.get('hospital')), None)
+        doctorId = next((doctor.pk for doctor in reference.doctors if doctor.username == request.POST.get('doctor')), None)
+        if baseUserForm.is_valid() and userForm.is_valid() and profileForm.is_valid() and medicalForm.is_valid() and hospitalId and doctorId:
+
+            #everything is created in one transaction with a single insert per row, so a failure part
+            #way through can't leave a user behind without a patient
+            with transaction.atomic():
+                user = baseUserForm.save(commit=False)
+                user.set_password(baseUserForm.cleaned_data['password'])
+                user.first_name = profileForm.cleaned_data['firstName']
+                user.last_name = profileForm.cleaned_data['lastName']
+                user.email = profileForm.cleaned_data['email']
+                user.save()
+
+                patient = Patient.objects.create(user=user, userInfo=userForm.save(), profileInfo=profileForm.save(),
+                                                 medicalInfo=medicalForm.save(), hospital_id=hospitalId, doctor_id=doctorId)
+
+            #the password was only just hashed, so the new user is logged in directly instead of going
+            #through authenticate, which would hash it a second time
+            user.backend = 'django.contrib.auth.backends.ModelBackend'
+            login(request, user)
             registered = True
-            userLogin(request)
-            return HttpResponseRedirect('/%s/profile' % patient.user.username)
+            return HttpResponseRedirect('/%s/profile' % user.username)
         else:
             #TODO - these errors should be added into the registration.html so the user can see it
             print(baseUserForm.errors, userForm.errors, profileForm.errors, medicalForm.errors)
@@ -272,7 +590,7 @@ def register(request):
             userForm = UserForm(data=request.POST.copy())
             profileForm = ProfileForm(data=request.POST.copy())
             medicalForm = MedicalForm(data=request.POST.copy())
-            return render(request, 'registration.html', {'baseUserForm':baseUserForm, 'userForm':userForm, 'profileForm':profileForm, 'medicalForm':medicalForm, 'registered': registered, 'doctorlist' : Doctor.objects.all(), 'hospitallist': Hospital.objects.all(), 'states' : STATE_CHOICES, 'diseases' : diseaseChecks})
+            return render(request, 'registration.html', {'baseUserForm':baseUserForm, 'userForm':userForm, 'profileForm':profileForm, 'medicalForm':medicalForm, 'registered': registered, 'doctorlist' : reference.doctors, 'hospitallist': reference.hospitals, 'states' : STATE_CHOICES, 'diseases' : CONDITIONS})
 
     else:
         #if the request is get, show blank forms.
@@ -280,7 +598,8 @@ def register(request):
         userForm = UserForm()
         profileForm = ProfileForm()
         medicalForm = MedicalForm()
-    return render(request, 'registration.html', {'baseUserForm':baseUserForm, 'userForm':userForm, 'profileForm':profileForm, 'medicalForm':medicalForm, 'registered': registered, 'doctorlist' : Doctor.objects.all(), 'hospitallist': Hospital.objects.all(), 'states' : STATE_CHOICES, 'diseases' : diseaseChecks})
+        reference = caches.getReferenceLists()
+    return render(request, 'registration.html', {'baseUserForm':baseUserForm, 'userForm':userForm, 'profileForm':profileForm, 'medicalForm':medicalForm, 'registered': registered, 'doctorlist' : reference.doctors, 'hospitallist': reference.hospitals, 'states' : STATE_CHOICES, 'diseases' : CONDITIONS})
 
 
 @csrf_exempt
@@ -293,18 +612,12 @@ def profile(request, username):
     else:
         #capture the user object and run checks on the account type to determine where to send them
         #In the future we may need to check for doctors and nurses and send them elsewhere.
-        activeUser = Patient.objects.get(user=request.user)
-        checklist = activeUser.medicalInfo._meta.get_fields()
-        newchecklist = []
-        for check in checklist:
-            newchecklist.append(getattr(activeUser.medicalInfo, check.name))
-
-        iterator = itertools.count()
-
-    user = request.user
-    appointments = Appointment.objects.filter(userName = user.username)
+        activeUser = getPatient(request.user.pk)
+        #both lists come from one read kept by the process, see caches.py
+        reference = caches.getReferenceLists()
 
-    return render(request, 'ProfilePage.html', {'user' : activeUser, 'checklist' : checklist, 'newchecklist' : newchecklist, 'iterator':iterator, 'appointments': appointments, 'appform': AppointmentForm,  'doctorlist' : Doctor.objects.all(), 'hospitallist': Hospital.objects.all()})
+    return render(request, 'ProfilePage.html', {'user' : activeUser, 'appform': AppointmentForm,  'doctorlist' : reference.doctors, 'hospitallist': reference.hospitals,
+                                                'currentMedications': prescriptions.currentMedications(activeUser)})
 
 
 @csrf_exempt
@@ -317,25 +630,141 @@ def staffProfile(request, username):
     else:
         #capture the user object and run checks on the account type to determine where to send them
         #In the future we may need to check for doctors and nurses and send them elsewhere.
-        accountType = "Doctor"
-        try:
-            activeUser = Doctor.objects.get(user=request.user)
-        except:
-            try:
-                activeUser = Nurse.objects.get(user=request.user)
-            except:
-                activeUser = None
+        activeUser, accountType = getStaffMember(request.user)
+        patients, nextCursor = None, None
         if activeUser:
+            #the roster is read a page at a time, the cursor in the url says where the page starts
             try:
-                patients = Patient.objects.filter(doctor=Doctor.objects.get(user=request.user))
-            except:
-                accountType = "Nurse"
-                try:
-                    patients = Patient.objects.filter(hospital= Hospital.objects.get(name=activeUser.hospital))
-                except:
-                    patients = None
+                patients, nextCursor = roster.rosterPage(getVisiblePatients(activeUser, accountType), request.GET.get('cursor'))
+            except roster.InvalidCursor:
+                return HttpResponseBadRequest("invalid roster cursor")
+
+    return render(request, 'StaffProfile.html', {'user' : activeUser, 'accountType' : accountType, 'patients' : patients, 'nextCursor' : nextCursor})
+
+
+def patientDetail(request, patientId):
+    #the detail panels for one patient, fetched by the staff page when a patient is picked from
+    #the roster. Only patients on the staff member's own roster can be looked at.
+    if not request.user.is_authenticated():
+        return HttpResponseRedirect(reverse('login'))
+
+    staffMember, accountType = getStaffMember(request.user)
+    if staffMember is None:
+        return HttpResponseRedirect('/%s/profile' % request.user.username)
 
-    return render(request, 'StaffProfile.html', {'user' : activeUser, 'accountType' : accountType, 'patients' : patients})
+    patients = getVisiblePatients(staffMember, accountType).select_related(*roster.DETAIL_RELATED)
+    patient = get_object_or_404(patients, pk=patientId)
+    return render(request, 'patientDetail.html', {'patient': patient, 'currentMedications': prescriptions.currentMedications(patient),
+                                                  'prescriptionForm': PrescriptionForm() if accountType == "Doctor" else None})
+
+
+#entries of a patient's prescription history sent per request
+HISTORY_PAGE_SIZE = 100
+
+
+def prescriptionHistory(request, patientId):
+    #a page of a patient's prescription history, newest first, for the staff who can see them.
+    #?before=<id> continues from the last entry of the previous page.
+    if not request.user.is_authenticated():
+        return HttpResponseRedirect(reverse('login'))
+
+    staffMember, accountType = getStaffMember(request.user)
+    if staffMember is None:
+        return HttpResponseRedirect('/%s/profile' % request.user.username)
+
+    patient = get_object_or_404(getVisiblePatients(staffMember, accountType), pk=patientId)
+    entries = prescriptions.history(patient)
+    before = request.GET.get('before')
+    if before:
+        try:
+            last = entries.values_list('startDate', flat=True).get(pk=int(before))
+        except (ValueError, Prescription.DoesNotExist):
+            return HttpResponseBadRequest("invalid history position")
+        entries = entries.filter(Q(startDate__lt=last) | Q(startDate=last, pk__lt=int(before)))
+    entries = list(entries[:HISTORY_PAGE_SIZE])
+
+    return JsonResponse({
+        'prescriptions': [{
+            'id': entry.pk,
+            'medication': entry.medication,
+            'medicationCategory': entry.medicationCategory,
+            'dosage': entry.dosage,
+            'frequency': entry.frequency,
+            'directions': entry.directions,
+            'comments': entry.comments,
+            'prescribedBy': entry.prescribedBy.user.username if entry.prescribedBy else None,
+            'startDate': entry.startDate.isoformat(),
+            'stopDate': entry.stopDate.isoformat() if entry.stopDate else None,
+            'active': entry.active,
+        } for entry in entries],
+        'before': entries[-1].pk if len(entries) == HISTORY_PAGE_SIZE else None,
+    })
+
+
+def prescribe(request, patientId):
+    #a doctor putting one of their own patients on a medication
+    if not request.user.is_authenticated():
+        return HttpResponseRedirect(reverse('login'))
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    staffMember, accountType = getStaffMember(request.user)
+    if accountType != "Doctor":
+        return HttpResponseRedirect('/%s/profile' % request.user.username)
+
+    patient = get_object_or_404(getVisiblePatients(staffMember, accountType), pk=patientId)
+    form = PrescriptionForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    #interactions are sent back for the doctor to confirm, the form is then posted again with acknowledge set
+    try:
+        prescription = prescriptions.prescribe(patient, staffMember, form.save(commit=False), acknowledged=bool(request.POST.get('acknowledge')))
+    except prescriptions.InteractionsFound as e:
+        return JsonResponse({'interactions': [interaction._asdict() for interaction in e.interactions]}, status=409)
+    return JsonResponse({'id': prescription.pk})
+
+
+def discontinuePrescription(request, prescriptionId):
+    #stops an active prescription of one of the doctor's own patients
+    if not request.user.is_authenticated():
+        return HttpResponseRedirect(reverse('login'))
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    staffMember, accountType = getStaffMember(request.user)
+    if accountType != "Doctor":
+        return HttpResponseRedirect('/%s/profile' % request.user.username)
+
+    prescription = get_object_or_404(Prescription, pk=prescriptionId, patient__in=getVisiblePatients(staffMember, accountType))
+    try:
+        prescriptions.discontinue(prescription)
+    except prescriptions.NotActive as e:
+        return JsonResponse({'errors': {'__all__': [str(e)]}}, status=400)
+    return JsonResponse({'id': prescription.pk})
+
+
+def medTestResult(request, testId):
+    #streams the result of one test, decompressing it a chunk at a time. Tests are only linked
+    #to the doctor that ordered them, so that doctor is the one who can read the result.
+    #?download=1 sends it as an attachment instead of showing it in the browser.
+    if not request.user.is_authenticated():
+        return HttpResponseRedirect(reverse('login'))
+
+    staffMember, accountType = getStaffMember(request.user)
+    if accountType != "Doctor":
+        return HttpResponseRedirect('/%s/profile' % request.user.username)
+
+    test = get_object_or_404(MedTest, pk=testId, doctor=staffMember)
+    try:
+        body = MedTestResult.objects.get(test=test)
+    except MedTestResult.DoesNotExist:
+        raise Http404("this test has no result")
+
+    response = StreamingHttpResponse(body.iterBytes(), content_type='text/plain; charset=utf-8')
+    response['Content-Length'] = str(body.size)
+    if request.GET.get('download'):
+        response['Content-Disposition'] = 'attachment; filename="MedTest%d.txt"' % test.pk
+    return response
 
 
 @csrf_exempt
@@ -353,7 +782,7 @@ def profileEdit(request):
             patientUserInfo = userForm.save()
             patientProfileInfo = profileForm.save()
 
-            patient = Patient.objects.get(user=User.objects.get(username=request.user.username))
+            patient = Patient.objects.select_related('user').get(user=request.user)
 
             patient.userInfo = patientUserInfo
             patient.profileInfo = patientProfileInfo
@@ -374,7 +803,33 @@ def profileEdit(request):
         userForm = UserForm()
         profileForm = ProfileForm()
 
-    return HttpResponseRedirect('/%s/profile' % request.user.username, {'userForm':userForm, 'profileForm':profileForm, 'doctorlist' : Doctor.objects.all(), 'hospitallist': Hospital.objects.all()})
+    return HttpResponseRedirect('/%s/profile' % request.user.username, {'userForm':userForm, 'profileForm':profileForm, 'doctorlist' : caches.getDoctorList(), 'hospitallist': caches.getHospitalList()})
+
+
+def analytics(request):
+    #patients per hospital, doctor and state, condition prevalence and age bands for
+    #administrators, served from the cache in dashboard.py. ?format=json returns the numbers.
+    if not request.user.is_authenticated():
+        return HttpResponseRedirect(reverse('login'))
+    if not request.user.is_superuser:
+        return HttpResponseRedirect('/%s/profile' % request.user.username)
+
+    numbers = dashboard.getDashboard()
+    age = int(time.time() - numbers['computedAt'])
+    if request.GET.get('format') == 'json':
+        return JsonResponse(dict(numbers, ageSeconds=age, served=dashboard.dashboardStats()))
+    return render(request, 'analytics.html', {'dashboard': numbers, 'ageSeconds': age, 'served': dashboard.dashboardStats()})
+
+
+def queryStats(request):
+    #queries run per url name in this process, recorded by QueryBudgetMiddleware
+    if not request.user.is_authenticated():
+        return HttpResponseRedirect(reverse('login'))
+    staffMember, accountType = getStaffMember(request.user)
+    if staffMember is None:
+        return HttpResponseRedirect('/%s/profile' % request.user.username)
+
+    return JsonResponse(collectedQueryStats())
 
 
 @csrf_exempt
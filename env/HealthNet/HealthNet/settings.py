@@ -42,6 +42,8 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'HealthApp.middleware.QueryBudgetMiddleware',
+    'HealthApp.indexes.IndexChangesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -54,6 +56,24 @@ MIDDLEWARE_CLASSES = (
 
 ROOT_URLCONF = 'HealthNet.urls'
 
+# Most queries a request to each url name should run, see HealthApp/middleware.py. Going over
+# is logged, or raises QueryBudgetExceeded when QUERY_BUDGET_ACTION is 'raise'.
+QUERY_BUDGETS = {
+    'profile': 8,
+    'staffProfile': 8,
+    'patientDetail': 8,
+    'register': 25,
+    'export': 6,
+    'appointmentEvents': 6,
+    'medTestResult': 6,
+    'prescriptionHistory': 6,
+    'patientSearch': 6,
+    'nearestHospitals': 5,
+    'doctorDays': 4,
+    'analytics': 6,
+}
+QUERY_BUDGET_ACTION = 'log'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -92,6 +112,37 @@ DATABASES = {
 
 
 
+# Cache
+# https://docs.djangoproject.com/en/1.8/topics/cache/
+# Every process should see the same cache: a doctor or hospital saved by one process moves the
+# reference stamp the others check (see HealthApp/caches.py), and the analytics dashboard is
+# worked out once for all of them. The database cache needs nothing beyond the database itself,
+# and its table is made by migration 0040. memcached works just as well. With a per process
+# cache such as LocMemCache the site still runs, but the check in caches.py warns about it.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'healthnet_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    }
+}
+
+
+# Email
+# https://docs.djangoproject.com/en/1.8/topics/email/
+# Appointment reminders are sent through this server by the sendreminders command. For trying
+# it out locally run python -m smtpd -n -c DebuggingServer localhost:1025, which prints every
+# message instead of delivering it.
+
+EMAIL_HOST = 'localhost'
+EMAIL_PORT = 1025
+EMAIL_TIMEOUT = 30
+REMINDER_FROM_EMAIL = 'reminders@healthnet.example.com'
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
 
@@ -24,10 +24,25 @@ urlpatterns = [
     url(r'^(?P<username>\w+)/profile/$', views.profile, name='profile'),
     url(r'^(?P<username>\w+)/staffProfile/$', views.staffProfile, name='staffProfile'),
     url(r'^(?P<username>\w+)/staffProfile/(?P<patient>\w+)$', views.updateUser, name='updateUser'),
+    url(r'^patientDetail/(?P<patientId>\d+)/$', views.patientDetail, name='patientDetail'),
+    url(r'^patientDetail/(?P<patientId>\d+)/prescriptions/$', views.prescriptionHistory, name='prescriptionHistory'),
+    url(r'^patientDetail/(?P<patientId>\d+)/prescribe/$', views.prescribe, name='prescribe'),
+    url(r'^prescriptions/(?P<prescriptionId>\d+)/discontinue/$', views.discontinuePrescription, name='discontinuePrescription'),
+    url(r'^medTests/(?P<testId>\d+)/result/$', views.medTestResult, name='medTestResult'),
     url(r'^logout/$', views.userLogout, name='logout'),
     url(r'^admin/', include(admin.site.urls)),
     url(r'^profileEdit/$', views.profileEdit, name='profileEdit'),
     url(r'^createAppForm/', views.createApp, name='createAppForm'),
     url(r'^deleteAppForm/(\d+)$', views.deleteApp, name='deleteAppForm'),
-    url(r'^export/$', views.export, name='export')
+    url(r'^appointmentEvents/$', views.appointmentEvents, name='appointmentEvents'),
+    url(r'^doctors/(?P<username>\w+)/availability/$', views.doctorAvailability, name='doctorAvailability'),
+    url(r'^export/$', views.export, name='export'),
+    url(r'^staffExport/$', views.staffExport, name='staffExport'),
+    url(r'^cohorts/$', views.cohortSearch, name='cohortSearch'),
+    url(r'^medications/$', views.medicationSearch, name='medicationSearch'),
+    url(r'^patientSearch/$', views.patientSearch, name='patientSearch'),
+    url(r'^nearestHospitals/$', views.nearestHospitals, name='nearestHospitals'),
+    url(r'^doctorDays/$', views.doctorDays, name='doctorDays'),
+    url(r'^analytics/$', views.analytics, name='analytics'),
+    url(r'^queryStats/$', views.queryStats, name='queryStats')
 ]
\ No newline at end of file